@@ -212,17 +212,39 @@ document.addEventListener('DOMContentLoaded', function () {
 			triggerBrowserDownload(content, downloadFileName);
 			showNotification("File was downloaded", 'success');
 		}
+		else if (response_code == 'RNID') {
+			// Messages of the run carry its ID first
+			currentRunId = data[0];
+		}
 		else if (response_code == 'OUTP') {
 			// Decode (bsae64) output
-			let outputLine = atob(data[0]);
+			let outputLine = atob(data[1]);
 			updateOutput(outputLine);
 		}
+		else if (response_code == 'QUEU') {
+			showQueuePosition(parseInt(data[1]));
+		}
 		else if (response_code == 'DONE') {
-			let returnCode = parseInt(data[0]);
+			let returnCode = parseInt(data[1]);
 			showExecutionStatus(returnCode);
+			if (data[2]) {
+				showRunUsage(JSON.parse(data[2]));
+			}
+			if (data[0] == currentRunId) {
+				currentRunId = null;
+			}
 			enableRunButton();
 			enableSaveButton();
 		}
+		else if (response_code == 'PROF') {
+			let profile = JSON.parse(data[1]);
+			if (profile) {
+				showProfile(profile);
+			}
+		}
+		else if (response_code == 'KSTA') {
+			showNotification(`Kernel ${data[0]}`, 'info');
+		}
 		else if (response_code == 'ERRR') {
 			clearEmailPw();
 			errorCode = data[0];
@@ -236,6 +258,10 @@ document.addEventListener('DOMContentLoaded', function () {
 		"102": "User already exists (102)",
 		"201": "File not found (201)",
 		"202": "Execution timeout (202)",
+		"204": "Invalid test cases (204)",
+		"205": "Kernel unavailable (205)",
+		"206": "Run not found (206)",
+		"207": "Too many runs at once (207)",
 		"301": "Failed to create file or folder (301)",
 		"302": "Failed to delete file (302)"
 	};
@@ -286,6 +312,13 @@ document.addEventListener('DOMContentLoaded', function () {
 		disableSaveButton();
 	});
 
+	// Escape cancels the running program
+	document.addEventListener('keydown', (e) => {
+		if (e.key === 'Escape' && currentRunId !== null) {
+			socket.send(`CNCL~${currentRunId}`);
+		}
+	});
+
 	// Function to disable Run button and show a loading throbber
 	function disableRunButton() {
 		const runBtn = document.getElementById('run-btn');
@@ -316,6 +349,15 @@ document.addEventListener('DOMContentLoaded', function () {
 		}
 	}
 
+	// Show the execution's position in the server queue (0 = started running)
+	function showQueuePosition(position) {
+		const runBtn = document.getElementById('run-btn');
+		if (runBtn && runBtn.disabled) {
+			const label = position > 0 ? `Queued (#${position})...` : 'Running...';
+			runBtn.innerHTML = `<div class="button-throbber"></div> ${label}`;
+		}
+	}
+
 	// Initialize output window
 	output.srcdoc = `
 		<html>
@@ -374,7 +416,8 @@ document.addEventListener('DOMContentLoaded', function () {
 		0: "Code Execution Successful",
 		1: "Code Exited With Errors",
 		2: "Code Execution Environment Failed (Server Error)",
-		3: "Reached execution timeout"
+		3: "Reached execution timeout",
+		4: "Run cancelled"
 	}
 
 	// Show execution finish status
@@ -389,6 +432,30 @@ document.addEventListener('DOMContentLoaded', function () {
 		updateOutput(message);
 	}
 
+	// Show the resource usage of the finished run
+	function showRunUsage(usage) {
+		const cpuMs = usage.cpu_user_ms + usage.cpu_system_ms;
+		const memoryMb = (usage.memory_peak_bytes / (1024 * 1024)).toFixed(1);
+		let message = `\nTime: ${usage.wall_ms} ms | CPU: ${cpuMs} ms | Peak memory: ${memoryMb} MB`;
+		if (usage.limits_hit.length > 0) {
+			message += ` | Limits reached: ${usage.limits_hit.join(", ")}`;
+		}
+
+		updateOutput(message);
+	}
+
+	function showProfile(profile) {
+		let message = `\nProfile (${profile.wall_ms} ms, peak traced memory ${(profile.memory.peak_bytes / (1024 * 1024)).toFixed(1)} MB)`;
+		for (const entry of profile.functions.slice(0, 10)) {
+			message += `\n  ${entry.cumulative_ms.toFixed(1).padStart(9)} ms  ${entry.calls.toString().padStart(8)} calls  ${entry.function} (${entry.file}:${entry.line})`;
+		}
+		for (const entry of profile.allocations.slice(0, 5)) {
+			message += `\n  ${(entry.size_bytes / 1024).toFixed(1).padStart(9)} KB  allocated at ${entry.file}:${entry.line}`;
+		}
+
+		updateOutput(message);
+	}
+
 	// Function to clear the output window
 	function clearOutput() {
 		if (output.contentDocument) {
@@ -482,6 +549,19 @@ document.addEventListener('DOMContentLoaded', function () {
 			function handleKeyDown(e) {
 				if (!inputState.active) return;
 
+				// Ctrl+D closes the program's input (EOF)
+				if (e.ctrlKey && e.key === "d") {
+					e.preventDefault();
+					inputState.active = false;
+					preElement.removeChild(inputSpan);
+
+					outputDoc.removeEventListener("keydown", handleKeyDown);
+					outputDoc.body.removeEventListener("click", focusInput);
+
+					resolve(null);
+					return;
+				}
+
 				if (e.key === "Enter") {
 					e.preventDefault();
 
@@ -524,22 +604,28 @@ document.addEventListener('DOMContentLoaded', function () {
 
 			// Check if this is an input request
 			if (response_code === 'INPT') {
-				// Get the prompt (if any)
-				const promptData = data[0] ? JSON.parse(data[0]) : {};
-				const prompt = promptData.prompt || "";
+				// The input goes to the run that asked for it
+				const runId = data[0];
+				const prompt = "";
 
 				try {
 					// Handle the input request
 					const userInput = await handleInputRequest(prompt);
 
+					// Input was closed by the user (EOF)
+					if (userInput === null) {
+						socket.send(`INPE~${runId}`);
+						return;
+					}
+
 					// Send the input back to the server (Base64-encoded)
-					const inputResponse = `INPR~${btoa(unescape(encodeURIComponent(userInput)))}`;
+					const inputResponse = `INPR~${runId}~${btoa(unescape(encodeURIComponent(userInput)))}`;
 					socket.send(inputResponse);
 					console.log(`Sent: ${inputResponse}`);
 				} catch (error) {
 					console.error("Error handling input:", error);
 					// Send empty response in case of error
-					socket.send('INPR');
+					socket.send(`INPR~${runId}`);
 				}
 			}
 		});
@@ -1945,6 +2031,9 @@ document.addEventListener('DOMContentLoaded', function () {
 	// Variable to store the name of the file that was asked to download
 	let downloadFileName;
 
+	// ID of the run started by the Run button, while it runs (see RNID)
+	let currentRunId = null;
+
 	function downloadFileAction() {
 		if (!currentContextMenuFile) {
 			hideContextMenu();
@@ -0,0 +1,178 @@
+"""
+In-container fork server for user scripts.
+
+Starting `python3` and importing the modules a script uses costs tens of
+milliseconds on every run. In fork server mode the sandbox's main process is
+this server: while the sandbox waits in the pool it imports the launcher and
+a set of commonly used modules, then waits for a run request. A run forks a
+fresh child off the warm interpreter, which takes over the standard streams
+of the requesting client and runs the script through the launcher.
+
+Usage:
+    python3 -u forkserver.py [module ...]
+
+    The modules are imported ahead of runs (missing ones are skipped).
+
+Requests:
+    The client is a `sh` process started with `docker exec` (see
+    server/src/sandbox/supervisor.py). It opens a FIFO for the exit status of
+    the run, writes "<pid> <request>" to the control FIFO and waits. The
+    request is a JSON object:
+        {"argv": [script, args...], "cwd": str, "env": {...}, "timeout": seconds}
+    The child reopens the client's stdin / stdout / stderr through
+    /proc/<pid>/fd (fds 4-6, copies the client keeps of its standard
+    streams), and the server writes the run's exit status (124 if it
+    reached the timeout) to /tmp/codebox/exit-<pid>.
+
+Note:
+    This file is copied into the python_runner image next to launcher.py and
+    must only depend on the standard library. Paths must match
+    server/src/sandbox/supervisor.py
+"""
+
+import gc
+import importlib
+import json
+import os
+import signal
+import sys
+import traceback
+
+RUN_DIR = '/tmp/codebox'
+CONTROL_PATH = f'{RUN_DIR}/control'
+TIMEOUT_STATUS = 124
+CLIENT_STREAMS_FD = 4  # Client's copies of stdin / stdout / stderr are fds 4-6
+
+
+def preload(modules: list):
+    """Import the launcher and the given modules into the server interpreter."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import launcher  # noqa: F401
+
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    # Keep preloaded objects out of the children's garbage collections,
+    # so collecting doesn't touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def run_child(client_pid: int, request: dict) -> int:
+    """Run the requested script in the forked child, on the client's streams."""
+    os.setpgid(0, 0)
+
+    for fd, flags in ((0, os.O_RDONLY), (1, os.O_WRONLY), (2, os.O_WRONLY)):
+        stream = os.open(f'/proc/{client_pid}/fd/{CLIENT_STREAMS_FD + fd}', flags)
+        os.dup2(stream, fd)
+        os.close(stream)
+
+    env = request.get('env') or {}
+    os.environ.update(env)
+    if 'PYTHONPYCACHEPREFIX' in env:
+        sys.pycache_prefix = env['PYTHONPYCACHEPREFIX']
+    if 'PYTHONPATH' in env:
+        # Where a fresh interpreter puts it: after the script's directory (sys.path[0], set by the launcher)
+        sys.path[1:1] = env['PYTHONPATH'].split(os.pathsep)
+    os.chdir(request.get('cwd') or '.')
+
+    import launcher
+    try:
+        return launcher.main(request['argv'])
+    except SystemExit as exc:
+        if exc.code is None or isinstance(exc.code, int):
+            return exc.code or 0
+        print(exc.code, file=sys.stderr)
+        return 1
+
+
+def wait_child(pid: int, timeout: float) -> int:
+    """
+    Wait for the child to exit, killing its process group at the timeout.
+
+    Returns:
+        int: Exit status (128 + signal if killed by a signal, TIMEOUT_STATUS on timeout)
+    """
+    timed_out = False
+
+    def on_timeout(*_):
+        nonlocal timed_out
+        timed_out = True
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            os.kill(pid, signal.SIGKILL)  # Child didn't set up its process group yet
+
+    signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    _, status = os.waitpid(pid, 0)
+    signal.setitimer(signal.ITIMER_REAL, 0)
+
+    if timed_out:
+        return TIMEOUT_STATUS
+    code = os.waitstatus_to_exitcode(status)
+    return code if code >= 0 else 128 - code
+
+
+def reap_orphans():
+    """Reap exited processes the runs left behind (the server is the sandbox's PID 1)."""
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def report(client_pid: int, status: int):
+    """Send the exit status of a run to its client, if it is still waiting."""
+    try:
+        fd = os.open(f'{RUN_DIR}/exit-{client_pid}', os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        return  # Client is gone
+    try:
+        os.write(fd, f'{status}\n'.encode())
+    finally:
+        os.close(fd)
+
+
+def handle(line: str):
+    client_pid, _, payload = line.partition(' ')
+    client_pid = int(client_pid)
+    request = json.loads(payload)
+
+    pid = os.fork()
+    if pid == 0:
+        status = 2
+        try:
+            status = run_child(client_pid, request)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            os._exit(status)
+
+    status = wait_child(pid, float(request.get('timeout') or 60))
+    reap_orphans()
+    report(client_pid, status)
+
+
+def serve():
+    os.makedirs(RUN_DIR, exist_ok=True)
+    os.mkfifo(CONTROL_PATH)  # Clients wait for it, so it marks the server as ready
+
+    while True:
+        # Blocks until a client opens the FIFO, EOF once it closes it again
+        with open(CONTROL_PATH, encoding='utf-8') as control:
+            for line in control:
+                try:
+                    handle(line)
+                except (ValueError, KeyError, OSError):
+                    pass  # Malformed request or client gone
+
+
+if __name__ == '__main__':
+    preload(sys.argv[1:])
+    serve()
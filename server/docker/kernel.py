@@ -0,0 +1,183 @@
+"""
+In-container REPL kernel.
+
+A long-lived interpreter running code cells one after the other in a single
+namespace, so state (variables, imported modules, loaded data) carries over
+from one cell to the next. The value of a cell's last expression is
+displayed like in the interactive interpreter.
+
+Usage:
+    python3 -u kernel.py
+
+Requests:
+    stdin carries one JSON object per line:
+        {"op": "cell", "code": str}     Run a cell
+        {"op": "input", "data": str}    Input the running cell asked for
+        {"op": "eof"}                   End of input of the running cell
+    Input requests arriving while no cell waits for input are dropped.
+    The kernel exits at the end of stdin.
+
+Output:
+    Cell output (stdout and stderr) is written to stdout, events to the
+    original stderr stream (as in launcher.py):
+        {"event": "input", "offset": <int>}
+            The cell is about to block reading stdin
+        {"event": "done", "status": <int>, "offset": <int>}
+            The cell finished: 0, 1 on an exception, the code of a
+            SystemExit or 130 when it was interrupted
+    Offsets count the bytes the cell wrote to stdout.
+
+Interrupts:
+    SIGINT raises KeyboardInterrupt in the running cell and is ignored
+    between cells.
+
+Note:
+    This file is copied into the python_runner image next to launcher.py and
+    must only depend on the standard library. Event names must match
+    server/src/sandbox/supervisor.py
+"""
+
+import ast
+import builtins
+import io
+import json
+import linecache
+import os
+import signal
+import sys
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from launcher import EVENT_INPUT, READ_SIZE, CountingWriter, EventChannel, InputReader  # noqa: E402
+
+EVENT_DONE = 'done'
+INTERRUPTED_STATUS = 130
+
+
+class Requests:
+    """Reads the JSON requests from stdin."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.buffer = b''
+
+    def next(self) -> dict | None:
+        """
+        Returns:
+            dict | None: The next request, None at the end of stdin
+        """
+        while b'\n' not in self.buffer:
+            data = os.read(self.fd, READ_SIZE)
+            if not data:
+                return None
+            self.buffer += data
+
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {}
+        return request if isinstance(request, dict) else {}
+
+
+class CellInput(InputReader):
+    """sys.stdin of cells: every read asks the server for input."""
+
+    def __init__(self, requests: Requests, events: EventChannel, stdout: io.TextIOWrapper, counter: CountingWriter):
+        super().__init__(0, events, stdout, counter)
+        self.requests = requests
+
+    def _fill(self):
+        self.stdout.flush()
+        self.events.send(EVENT_INPUT, offset=self.counter.count)
+
+        while True:
+            request = self.requests.next()
+            if request is None or request.get('op') == 'eof':
+                self.eof = True
+                return
+            if request.get('op') == 'input':
+                self.pending += str(request.get('data', ''))
+                return
+
+
+class Kernel:
+    def __init__(self):
+        # Keep the original stderr as the event channel, cell stderr goes to stdout
+        self.events = EventChannel(os.dup(2))
+        os.dup2(1, 2)
+
+        self.counter = CountingWriter(1)
+        self.stdout = io.TextIOWrapper(self.counter, encoding='utf-8', errors='backslashreplace', write_through=True)
+        sys.stdout = sys.__stdout__ = self.stdout
+        sys.stderr = sys.__stderr__ = self.stdout
+        self.requests = Requests(0)
+
+        self.namespace = {'__name__': '__main__', '__builtins__': builtins}
+        self.cells = 0
+        sys.path[0] = os.getcwd()
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def compile_cell(self, code: str, filename: str) -> list:
+        """
+        Returns:
+            list: Code objects of the cell, the last expression compiled to be displayed
+        """
+        tree = ast.parse(code, filename, 'exec')
+        last = tree.body.pop() if tree.body and isinstance(tree.body[-1], ast.Expr) else None
+        compiled = [compile(tree, filename, 'exec')]
+        if last is not None:
+            compiled.append(compile(ast.Interactive([last]), filename, 'single'))
+        return compiled
+
+    def run_cell(self, code: str) -> int:
+        """
+        Returns:
+            int: Status of the cell (see module docstring)
+        """
+        self.cells += 1
+        filename = f'<cell-{self.cells}>'
+        # Lets tracebacks show the source lines of the cell
+        linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+
+        self.counter.count = 0
+        sys.stdin = sys.__stdin__ = CellInput(self.requests, self.events, self.stdout, self.counter)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            for compiled in self.compile_cell(code, filename):
+                exec(compiled, self.namespace)
+        except SystemExit as exc:
+            if exc.code is None or isinstance(exc.code, int):
+                return exc.code or 0
+            print(exc.code)
+            return 1
+        except BaseException as exc:
+            traceback.print_exception(type(exc), exc, cell_traceback(exc))
+            return INTERRUPTED_STATUS if isinstance(exc, KeyboardInterrupt) else 1
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.stdout.flush()
+        return 0
+
+    def serve(self):
+        while (request := self.requests.next()) is not None:
+            if request.get('op') != 'cell':
+                continue  # Input for a cell that already ended
+
+            try:
+                status = self.run_cell(str(request.get('code', '')))
+            except KeyboardInterrupt:
+                status = INTERRUPTED_STATUS  # Arrived just after the cell ended
+            self.events.send(EVENT_DONE, status=status, offset=self.counter.count)
+
+
+def cell_traceback(exc: BaseException):
+    """Returns the exception's traceback without the kernel frames."""
+    tb = exc.__traceback__
+    while tb is not None and not tb.tb_frame.f_code.co_filename.startswith('<cell-'):
+        tb = tb.tb_next
+    return tb
+
+
+if __name__ == '__main__':
+    Kernel().serve()
@@ -0,0 +1,191 @@
+"""
+In-container launcher (supervisor) for user scripts.
+
+Runs a user script as `__main__` and reports sandbox events to the server over
+a side channel, so the server never has to poll the container to find out what
+the script is doing.
+
+Usage:
+    python3 -u launcher.py <script> [args...]
+
+    With CODEBOX_PROFILE set, the script runs under the profiler and its
+    profile is written to that path (see profiler.py).
+
+Side Channel:
+    The container's original stderr stream carries one JSON object per line.
+    The script's own stderr is redirected into stdout, so anything the server
+    reads from stderr is either an event or a launcher failure.
+
+Events:
+    {"event": "input", "offset": <int>}
+        The script is about to block reading stdin. `offset` is the number of
+        stdout bytes written so far, so the server can forward all preceding
+        output (e.g. the input() prompt) before asking the client for input.
+
+Note:
+    This file is copied into the python_runner image and must only depend on
+    the standard library. Event names must match server/src/sandbox/supervisor.py
+"""
+
+import codecs
+import io
+import json
+import os
+import runpy
+import select
+import sys
+import traceback
+
+EVENT_INPUT = 'input'
+READ_SIZE = 65536
+
+
+class EventChannel:
+    """Writes JSON event lines to the server side channel."""
+
+    def __init__(self, fd: int):
+        self.file = os.fdopen(fd, 'w', buffering=1, encoding='utf-8')
+
+    def send(self, event: str, **fields):
+        self.file.write(json.dumps({'event': event, **fields}) + '\n')
+        self.file.flush()
+
+
+class CountingWriter(io.RawIOBase):
+    """Raw stdout writer that counts the bytes written to the stream."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.count = 0
+
+    def writable(self):
+        return True
+
+    def fileno(self):
+        return self.fd
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            self.count += written
+            view = view[written:]
+        return len(data)
+
+
+class InputReader(io.TextIOBase):
+    """
+    sys.stdin replacement that reports an input event whenever a read is
+    about to block because no data is waiting in the pipe.
+    """
+
+    def __init__(self, fd: int, events: EventChannel, stdout: io.TextIOWrapper, counter: CountingWriter):
+        self.fd = fd
+        self.events = events
+        self.stdout = stdout
+        self.counter = counter
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.pending = ''
+        self.eof = False
+
+    @property
+    def encoding(self):
+        return 'utf-8'
+
+    def readable(self):
+        return True
+
+    def fileno(self):
+        return self.fd
+
+    def isatty(self):
+        return False
+
+    def _fill(self):
+        """Read more data from stdin, reporting first if the read would block."""
+        if not select.select([self.fd], [], [], 0)[0]:
+            self.stdout.flush()
+            self.events.send(EVENT_INPUT, offset=self.counter.count)
+
+        data = os.read(self.fd, READ_SIZE)
+        if not data:
+            self.eof = True
+            self.pending += self.decoder.decode(b'', final=True)
+        else:
+            self.pending += self.decoder.decode(data)
+
+    def _take(self, end: int) -> str:
+        text, self.pending = self.pending[:end], self.pending[end:]
+        return text
+
+    def readline(self, size=-1):
+        size = -1 if size is None else size
+        while '\n' not in self.pending and not self.eof and (size < 0 or len(self.pending) < size):
+            self._fill()
+
+        end = self.pending.find('\n') + 1 or len(self.pending)
+        if size >= 0:
+            end = min(end, size)
+        return self._take(end)
+
+    def read(self, size=-1):
+        size = -1 if size is None else size
+        while not self.eof and (size < 0 or len(self.pending) < size):
+            self._fill()
+
+        return self._take(len(self.pending) if size < 0 else size)
+
+
+def user_traceback(exc: BaseException, script: str):
+    """Returns the exception's traceback without the launcher and runpy frames."""
+    tb = exc.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != script:
+        tb = tb.tb_next
+    return tb
+
+
+def main(argv: list) -> int:
+    if not argv:
+        print("Usage: launcher.py <script> [args...]", file=sys.stderr)
+        return 2
+
+    script = argv[0]
+    profile_path = os.environ.get('CODEBOX_PROFILE')
+    if profile_path:
+        import profiler  # Before sys.path[0] becomes the script's directory
+
+    # Keep the original stderr as the event channel, user stderr goes to stdout
+    events = EventChannel(os.dup(2))
+    os.dup2(1, 2)
+
+    counter = CountingWriter(1)
+    stdout = io.TextIOWrapper(counter, encoding='utf-8', errors='backslashreplace', write_through=True)
+    sys.stdout = sys.__stdout__ = stdout
+    sys.stderr = sys.__stderr__ = stdout
+    sys.stdin = sys.__stdin__ = InputReader(0, events, stdout, counter)
+
+    # Make the script behave as if it was run directly with `python3 <script>`
+    sys.argv = list(argv)
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+
+    def run():
+        runpy.run_path(script, run_name='__main__')
+
+    try:
+        if profile_path:
+            profiler.run(script, run, profile_path)
+        else:
+            run()
+    except SystemExit:
+        raise
+    except BaseException as exc:
+        traceback.print_exception(type(exc), exc, user_traceback(exc, script))
+        return 1
+    finally:
+        stdout.flush()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,163 @@
+"""
+In-container profiler of user scripts (profile mode).
+
+Runs the script under cProfile and tracemalloc, and writes an aggregated
+profile as JSON once it ends (also when it raises or exits):
+    {
+        "wall_ms": float,                 Run time, profiling overhead included
+        "functions": [                    Top functions by cumulative time
+            {"function", "file", "line", "calls", "primitive_calls", "total_ms", "cumulative_ms"}, ...
+        ],
+        "allocations": [                  Top allocation sites still holding memory at the end
+            {"file", "line", "size_bytes", "count"}, ...
+        ],
+        "memory": {"current_bytes", "peak_bytes"},   Traced Python memory
+        "flame": {"name", "value", "children": [...]} Call tree (cumulative ms), for a flame graph
+    }
+
+The call tree is rebuilt from cProfile's caller / callee edges, so time of a
+function called from several places is split by the edges' cumulative time
+rather than measured per stack. Frames of the launcher, this module and
+runpy are left out.
+
+Overhead:
+    cProfile instruments every Python call and tracemalloc every allocation
+    (measured with server/scripts/benchmark_profile_overhead.py, CPython 3.11):
+        - call-heavy code (small recursive functions): ~7x slower
+        - allocation-heavy code: ~4.5x slower, ~3x peak memory
+        - code spending its time in C (sorting, hashing): ~1.6x slower
+    tracemalloc keeps a traceback per live allocation, so the extra memory
+    counts against the sandbox's memory limit: a script using more than
+    about a third of the limit may be killed only when profiled. The
+    profiled run keeps the normal execution timeout.
+
+Note:
+    This file is copied into the python_runner image next to launcher.py and
+    must only depend on the standard library. The output path is set by the
+    server (CODEBOX_PROFILE, see server/src/sandbox/profiling.py)
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+FLAME_MAX_DEPTH = 24
+FLAME_MIN_FRACTION = 0.005  # Call tree nodes below this share of the total are dropped
+INTERNAL_FILES = ('launcher.py', 'profiler.py', 'runpy.py', '<frozen runpy>')
+
+
+def is_internal(filename: str) -> bool:
+    return filename.endswith(INTERNAL_FILES) or filename == '~'
+
+
+def short_path(filename: str) -> str:
+    """Path relative to the working directory for the user's files."""
+    cwd = os.getcwd() + os.sep
+    return filename[len(cwd):] if filename.startswith(cwd) else filename
+
+
+def function_name(func: tuple) -> str:
+    filename, line, name = func
+    if filename == '~':
+        return name  # Built-in, e.g. "<built-in method builtins.sorted>"
+    return f"{name} ({short_path(filename)}:{line})"
+
+
+def top_functions(stats: dict) -> list:
+    entries = []
+    for func, (primitive_calls, calls, total, cumulative, _) in stats.items():
+        if is_internal(func[0]):
+            continue
+        entries.append({
+            "function": func[2],
+            "file": short_path(func[0]),
+            "line": func[1],
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "total_ms": round(total * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return entries[:TOP_FUNCTIONS]
+
+
+def call_tree(stats: dict, script: str) -> dict | None:
+    """
+    Returns:
+        dict | None: Call tree below the script's module code, None if it was not profiled
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative))
+
+    roots = [func for func in stats if func[2] == '<module>' and os.path.abspath(func[0]) == script]
+    if not roots:
+        return None
+    total = stats[roots[0]][3]
+    threshold = total * FLAME_MIN_FRACTION
+
+    def node(func: tuple, value: float, path: set, depth: int) -> dict:
+        children = []
+        if depth < FLAME_MAX_DEPTH:
+            for callee, cumulative in sorted(callees.get(func, []), key=lambda edge: edge[1], reverse=True):
+                # Recursion is folded into the first call
+                if cumulative >= threshold and callee not in path and not is_internal(callee[0]):
+                    children.append(node(callee, cumulative, path | {callee}, depth + 1))
+        return {"name": function_name(func), "value": round(value * 1000, 3), "children": children}
+
+    return node(roots[0], total, {roots[0]}, 0)
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot) -> list:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        *(tracemalloc.Filter(False, f"*{name}") for name in INTERNAL_FILES),
+    ])
+    return [
+        {
+            "file": short_path(stat.traceback[0].filename),
+            "line": stat.traceback[0].lineno,
+            "size_bytes": stat.size,
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+    ]
+
+
+def run(script: str, target, output_path: str):
+    """
+    Call target() (running the script) under the profilers and write the
+    profile to output_path when it returns or raises.
+    """
+    profile = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        return target()
+    finally:
+        profile.disable()
+        wall = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        write(output_path, script, profile, snapshot, wall, current, peak)
+
+
+def write(output_path: str, script: str, profile: cProfile.Profile, snapshot, wall: float, current: int, peak: int):
+    stats = pstats.Stats(profile).stats
+    result = {
+        "wall_ms": round(wall * 1000, 3),
+        "functions": top_functions(stats),
+        "allocations": top_allocations(snapshot),
+        "memory": {"current_bytes": current, "peak_bytes": peak},
+        "flame": call_tree(stats, os.path.abspath(script)),
+    }
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(result, file)
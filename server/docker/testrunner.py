@@ -0,0 +1,230 @@
+"""
+In-container test runner of project test suites (test suite mode).
+
+Discovers and runs the tests of the project in the working directory, with
+pytest when it is importable (installed, or from the project's environment)
+and with unittest otherwise.
+
+Usage:
+    testrunner.py collect           Discover the tests
+    testrunner.py run <framework>   Run the tests whose IDs are read from stdin (JSON list)
+
+Results are written as JSON lines to the original stdout, one per event:
+    {"event": "found", "id": str}                       A test was discovered
+    {"event": "collection_error", "id": str,
+     "message": str}                                    A module failed to import
+    {"event": "collected", "framework": str}            Discovery finished
+    {"event": "test", "id": str, "outcome": str, "duration_ms": float,
+     "message": str}                                    A test finished (outcome: passed, failed, error or skipped)
+    {"event": "done"}                                   All requested tests ran
+Everything else the tests or frameworks print goes to stderr, and stdin is
+/dev/null while tests run.
+
+Note:
+    This file is copied into the python_runner image next to launcher.py and
+    must only depend on the standard library (pytest is optional). The server
+    side is server/src/sandbox/test_suite.py
+"""
+
+import json
+import os
+import sys
+import time
+import unittest
+
+PYTEST = 'pytest'
+UNITTEST = 'unittest'
+PYTEST_ARGS = ['-q', '-p', 'no:cacheprovider']  # Project files are read-only
+MAX_MESSAGE = 8192  # Characters of a failure message
+FAILED_IMPORT = 'unittest.loader._FailedTest.'  # ID prefix of modules discovery couldn't import
+
+
+class Results:
+    """Writes result events to the original stdout, while stdout and stdin of the tests are redirected."""
+
+    def __init__(self):
+        self.stream = os.fdopen(os.dup(1), 'w', buffering=1, encoding='utf-8')
+        os.dup2(2, 1)
+        null = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null, 0)
+        os.close(null)
+
+    def send(self, event: str, **fields):
+        self.stream.write(json.dumps({"event": event, **fields}) + '\n')
+
+    def test(self, test_id: str, outcome: str, duration: float, message: str = ''):
+        if len(message) > MAX_MESSAGE:
+            message = message[:MAX_MESSAGE] + '\n[truncated]'
+        self.send("test", id=test_id, outcome=outcome, duration_ms=round(duration * 1000, 3), message=message)
+
+
+def pytest_available() -> bool:
+    try:
+        import pytest  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PytestCollector:
+    """pytest plugin recording the collected test IDs and collection errors."""
+
+    def __init__(self):
+        self.tests = []
+        self.errors = []
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self.errors.append({"id": report.nodeid, "message": str(report.longrepr)[:MAX_MESSAGE]})
+
+    def pytest_collection_finish(self, session):
+        self.tests = [item.nodeid for item in session.items]
+
+
+class PytestReporter:
+    """pytest plugin reporting every test once its teardown ran."""
+
+    def __init__(self, results: Results):
+        self.results = results
+        self.tests = {}  # node ID -> [outcome, duration, message]
+
+    def pytest_runtest_logreport(self, report):
+        state = self.tests.setdefault(report.nodeid, [None, 0.0, ''])
+        state[1] += report.duration
+        if report.failed:
+            if state[0] not in ('failed', 'error'):
+                state[0] = 'failed' if report.when == 'call' else 'error'
+                state[2] = report.longreprtext
+        elif report.skipped and state[0] is None:
+            state[0] = 'skipped'
+            state[2] = str(report.longrepr[2]) if isinstance(report.longrepr, tuple) else ''
+        elif report.when == 'call' and state[0] is None:
+            state[0] = 'passed'
+
+        if report.when == 'teardown':
+            outcome, duration, message = self.tests.pop(report.nodeid)
+            self.results.test(report.nodeid, outcome or 'error', duration, message)
+
+
+class UnittestReporter(unittest.TestResult):
+    """unittest result reporting every test when it stops, with its output captured."""
+
+    def __init__(self, results: Results):
+        super().__init__()
+        self.buffer = True
+        self.results = results
+        self.outcome = None
+        self.message = ''
+        self.started = None
+        self.requested = None  # ID the running tests were loaded from
+
+    def startTest(self, test):
+        super().startTest(test)
+        self.outcome, self.message = 'passed', ''
+        self.started = time.perf_counter()
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        # A requested test that couldn't be loaded is reported under its own ID
+        test_id = self.requested if test.id().startswith(FAILED_IMPORT) else test.id()
+        self.results.test(test_id, self.outcome, time.perf_counter() - self.started, self.message)
+
+    def set(self, outcome: str, message: str):
+        # The first failure of a test (e.g. of a subtest) is reported
+        if self.outcome in ('passed', 'skipped'):
+            self.outcome, self.message = outcome, message
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self.set('error', self._exc_info_to_string(err, test))
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self.set('failed', self._exc_info_to_string(err, test))
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self.set('skipped', reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self.set('skipped', 'expected failure')
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self.set('failed', 'unexpected success')
+
+    def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
+        if err is not None:
+            failed = issubclass(err[0], test.failureException)
+            self.set('failed' if failed else 'error', self._exc_info_to_string(err, test))
+
+
+def unittest_tests(suite) -> list:
+    """Flatten a test suite."""
+    tests = []
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            tests.extend(unittest_tests(test))
+        else:
+            tests.append(test)
+    return tests
+
+
+def collect(results: Results):
+    if pytest_available():
+        import pytest
+        collector = PytestCollector()
+        pytest.main(['--collect-only', *PYTEST_ARGS], plugins=[collector])
+        framework, tests, errors = PYTEST, collector.tests, collector.errors
+    else:
+        framework, tests, errors = UNITTEST, [], []
+        for test in unittest_tests(unittest.defaultTestLoader.discover('.')):
+            if test.id().startswith(FAILED_IMPORT):
+                result = unittest.TestResult()
+                test.run(result)  # Raises the import error
+                message = result.errors[0][1] if result.errors else ''
+                errors.append({"id": test.id()[len(FAILED_IMPORT):], "message": message[:MAX_MESSAGE]})
+            else:
+                tests.append(test.id())
+
+    for test_id in tests:
+        results.send("found", id=test_id)
+    for error in errors:
+        results.send("collection_error", **error)
+    results.send("collected", framework=framework)
+
+
+def run(results: Results, framework: str, test_ids: list):
+    if framework == PYTEST:
+        import pytest
+        pytest.main([*PYTEST_ARGS, *test_ids], plugins=[PytestReporter(results)])
+    else:
+        reporter = UnittestReporter(results)
+        for test_id in test_ids:
+            try:
+                suite = unittest.defaultTestLoader.loadTestsFromName(test_id)
+            except Exception as exc:
+                results.test(test_id, 'error', 0.0, f"{type(exc).__name__}: {exc}")
+                continue
+            reporter.requested = test_id
+            suite.run(reporter)
+    results.send("done")
+
+
+def main():
+    sys.path[0] = os.getcwd()  # Like a test run started in the project
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'collect'
+    test_ids = json.load(sys.stdin) if mode == 'run' else None
+
+    results = Results()
+    if mode == 'run':
+        run(results, sys.argv[2], test_ids)
+    else:
+        collect(results)
+    results.stream.flush()
+
+
+if __name__ == '__main__':
+    main()
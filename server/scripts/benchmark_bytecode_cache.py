@@ -0,0 +1,150 @@
+"""
+Benchmark the import time of a multi-module project with and without the
+bytecode cache (sandbox/bytecode_cache.py).
+
+The project is a package of MODULES generated modules imported by a main
+script, which prints how long the imports took. Every iteration runs it in
+a fresh sandbox the way RUNF does: once with an empty cache (every module is
+compiled) and once with the bytecode stored by an earlier run restored into
+the sandbox. The standard library's bytecode is in the image (or the
+namespace backend's seed) either way, so the difference is the project's
+own modules.
+
+Prints mean / p50 / p95 of the import time and of the whole run per case.
+
+Measured (namespace backend, 1 CPU VM, 10 iterations, 30 modules):
+    no cache: imports p50 169.4 ms, run p50 195.5 ms
+    cached:   imports p50  16.2 ms, run p50  39.7 ms
+
+Usage:
+    python3 benchmark_bytecode_cache.py [iterations] [backend]
+
+    backend: docker-cli, docker-api, namespace (default: namespace)
+"""
+
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Add the src directory to sys.path to allow access packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from sandbox.archive import files_archive  # noqa: E402
+from sandbox.bytecode_cache import PROJECT_CACHE_DIR, PROJECT_CACHE_PARENT, BytecodeCache  # noqa: E402
+from sandbox.docker_driver import DockerAPIDriver, DockerCLIDriver  # noqa: E402
+from sandbox.namespace_backend import NamespaceBackend  # noqa: E402
+from sandbox.pool import SANDBOX_IMAGE, SANDBOX_LIMITS, SANDBOX_WORKDIR  # noqa: E402
+
+BACKENDS = {
+    'docker-cli': DockerCLIDriver,
+    'docker-api': DockerAPIDriver,
+    'namespace': NamespaceBackend,
+}
+MODULES = 30
+FUNCTIONS = 60  # Per module
+USER_ID = 1
+
+
+def project_files() -> dict:
+    """
+    Returns:
+        dict: Maps path -> content of the generated project
+    """
+    files = {"lib/__init__.py": b""}
+    for module in range(MODULES):
+        functions = "".join(
+            f"def f{i}(values, factor={i}):\n"
+            f"    total = 0\n"
+            f"    for index, value in enumerate(values):\n"
+            f"        if value % {i + 2} == 0:\n"
+            f"            total += value * factor - index\n"
+            f"        else:\n"
+            f"            total -= {{'a': value, 'b': index}}.get('a', 0)\n"
+            f"    return [total, str(total), (total, factor)]\n\n\n"
+            for i in range(FUNCTIONS)
+        )
+        files[f"lib/m{module}.py"] = f"import json\nimport re\n\n\n{functions}".encode()
+
+    imports = "\n".join(f"import lib.m{module}" for module in range(MODULES))
+    files["main.py"] = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"{imports}\n"
+        "print(round((time.perf_counter() - start) * 1000, 3))\n"
+    ).encode()
+    return files
+
+
+async def run_project(backend, name: str, project: bytes, cache: BytecodeCache, restore: bool) -> tuple:
+    """
+    Run the project in a fresh sandbox, restoring the cached bytecode first if `restore`.
+
+    Args:
+        project (bytes): Archive of the project, built once so its files keep their
+                         modification times (the bytecode is checked against them)
+
+    Returns:
+        tuple: (milliseconds the imports took, seconds of the whole run)
+    """
+    if not await backend.start_sandbox(name, SANDBOX_IMAGE, SANDBOX_LIMITS, ["sleep", "infinity"]):
+        raise RuntimeError(f"{name}: sandbox failed to start")
+    try:
+        await backend.copy_into(name, SANDBOX_WORKDIR, project)
+        archive = cache.archive(USER_ID) if restore else None
+        if archive:
+            await backend.copy_into(name, PROJECT_CACHE_PARENT, archive)
+
+        start = time.perf_counter()
+        process = await backend.exec(name, ["python3", "main.py"], env=BytecodeCache.environment())
+        stdout, stderr = await process.communicate()
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError(f"{name}: {stderr.decode(errors='replace')}")
+
+        archive = await backend.copy_from(name, PROJECT_CACHE_DIR)
+        if archive and not restore:
+            cache.store(USER_ID, archive, cache.generation(USER_ID))
+        return float(stdout), elapsed
+    finally:
+        await backend.kill_sandbox(name)
+
+
+def report(label: str, timings: list, unit: float = 1.0):
+    timings.sort()
+    print(f"{label:>22}: mean {statistics.mean(timings) * unit:7.1f} ms  "
+          f"p50 {timings[len(timings) // 2] * unit:7.1f} ms  "
+          f"p95 {timings[int(len(timings) * 0.95)] * unit:7.1f} ms")
+
+
+async def main(iterations: int, backend_name: str):
+    backend = BACKENDS[backend_name]()
+    cache = BytecodeCache(enabled=True, base_dir=tempfile.mkdtemp(prefix='codebox-bytecode-bench-'))
+    project = files_archive(project_files())
+    results = {False: [], True: []}
+    try:
+        await run_project(backend, f"bench-{os.getpid()}-warmup", project, cache, restore=False)
+        # Interleaved, so both cases see the same host conditions
+        for i in range(iterations):
+            for restore in (False, True):
+                name = f"bench-{os.getpid()}-{i}-{restore:d}"
+                results[restore].append(await run_project(backend, name, project, cache, restore))
+    finally:
+        await backend.close()
+        shutil.rmtree(cache.base_dir, ignore_errors=True)
+
+    print(f"{backend_name}: {MODULES} modules, {iterations} iterations")
+    for restore, label in ((False, "no cache"), (True, "cached")):
+        report(f"{label} imports", [imports for imports, _ in results[restore]])
+        report(f"{label} run", [elapsed for _, elapsed in results[restore]], unit=1000)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    asyncio.run(main(
+        int(next((arg for arg in args if arg.isdigit()), 10)),
+        next((arg for arg in args if arg in BACKENDS), 'namespace')
+    ))
@@ -0,0 +1,126 @@
+"""
+Benchmark time-to-first-output of the script start paths.
+
+The benchmarked script imports a few common modules and prints a line, the
+time until that line arrives is measured for:
+    cold:       start a sandbox, then exec the launcher in it
+    warm:       exec the launcher in a pre-started (pooled) sandbox
+    forkserver: run through the fork server of a pre-started sandbox
+
+Sandboxes are run by the backend selected by the environment (SANDBOX_BACKEND).
+
+Prints mean / p50 / p95 per path.
+
+Usage:
+    python3 benchmark_forkserver.py [iterations] [--local]
+
+    --local: Compare the launcher and the fork server as local processes
+             (no sandbox), which isolates interpreter startup from exec overhead
+"""
+
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Add the src directory to sys.path to allow access packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from sandbox import supervisor  # noqa: E402
+from sandbox.archive import files_archive  # noqa: E402
+from sandbox.backend import create_backend  # noqa: E402
+from sandbox.pool import SANDBOX_IMAGE, SANDBOX_LIMITS, SANDBOX_WORKDIR  # noqa: E402
+
+DOCKER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker'))
+SCRIPT = b"import json, re, collections, datetime, random\nprint('ready')\n"
+
+
+async def first_output(process, start: float) -> float:
+    """Returns the time from `start` until the process wrote its first output byte."""
+    await process.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    await process.stdout.read()
+    await process.wait()
+    return elapsed
+
+
+def report(name: str, timings: list):
+    timings.sort()
+    print(f"{name:>10}: mean {statistics.mean(timings) * 1000:7.1f} ms  "
+          f"p50 {timings[len(timings) // 2] * 1000:7.1f} ms  "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.1f} ms")
+
+
+async def benchmark_sandboxes(iterations: int):
+    backend = create_backend()
+    archive = files_archive({"script.py": SCRIPT})
+    counter = iter(range(1_000_000))
+
+    async def start_sandbox(forkserver: bool) -> str:
+        name = f"bench-start-{os.getpid()}-{next(counter)}"
+        await backend.start_sandbox(name, SANDBOX_IMAGE, SANDBOX_LIMITS, supervisor.sandbox_main_command(forkserver))
+        return name
+
+    async def run(name: str, forkserver: bool, start: float) -> float:
+        await backend.copy_into(name, SANDBOX_WORKDIR, archive)
+        command = supervisor.run_command("script.py", 60, SANDBOX_WORKDIR, forkserver)
+        process = await backend.exec(name, command)
+        elapsed = await first_output(process, start)
+        await backend.kill_sandbox(name)
+        return elapsed
+
+    paths = {"cold": [], "warm": [], "forkserver": []}
+    for _ in range(iterations):
+        start = time.perf_counter()
+        name = await start_sandbox(False)
+        paths["cold"].append(await run(name, False, start))
+
+        warm, forked = await start_sandbox(False), await start_sandbox(True)
+        await asyncio.sleep(1)  # Pooled sandboxes are idle (and preloaded) long before they're used
+        paths["warm"].append(await run(warm, False, time.perf_counter()))
+        paths["forkserver"].append(await run(forked, True, time.perf_counter()))
+
+    for name, timings in paths.items():
+        report(name, timings)
+    await backend.close()
+
+
+async def benchmark_local(iterations: int):
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "script.py"), 'wb') as file:
+        file.write(SCRIPT)
+
+    shutil.rmtree(supervisor.FORKSERVER_RUN_DIR, ignore_errors=True)
+    server = await asyncio.create_subprocess_exec(
+        "python3", "-u", os.path.join(DOCKER_DIR, "forkserver.py"), *supervisor.PRELOAD_MODULES
+    )
+
+    launcher = ["python3", "-u", os.path.join(DOCKER_DIR, "launcher.py"), "script.py"]
+    forked = supervisor.run_command("script.py", 60, workdir, True)
+
+    async def spawn(command: list) -> float:
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *command, cwd=workdir, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        return await first_output(process, start)
+
+    try:
+        await spawn(forked)  # Waits for the fork server to be ready
+        report("launcher", [await spawn(launcher) for _ in range(iterations)])
+        report("forkserver", [await spawn(forked) for _ in range(iterations)])
+    finally:
+        server.kill()
+        await server.wait()
+        shutil.rmtree(supervisor.FORKSERVER_RUN_DIR, ignore_errors=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    iterations = int(args[0]) if args else 20
+    asyncio.run(benchmark_local(iterations) if '--local' in sys.argv else benchmark_sandboxes(iterations))
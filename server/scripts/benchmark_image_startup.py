@@ -0,0 +1,200 @@
+"""
+Benchmark the cold start of runner images: `docker run` until the first output byte.
+
+Every iteration starts a fresh container of each image (with the sandbox
+limits, no network) that runs a script through the launcher. The script
+imports a few common modules and prints a line, the time until that line
+arrives is measured. Also measured is the same script exec'd into a running
+container of the image (interpreter startup without the container start),
+and the size of the images.
+
+Images:
+    python_runner            docker/Dockerfile, the runner image of the sandboxes
+    python_runner:baseline   docker/Dockerfile.ubuntu, the previous image (Ubuntu, apt Python)
+
+Prints size and mean / p50 / p95 per image and path, and the runner image
+against the previous one.
+
+Regressions:
+    With --max-regression the script fails (exit status 1) when the runner
+    image's p50 run time is more than PERCENT slower than its reference:
+      - the p50 times recorded in image_startup_p50.json (next to this
+        script) with --record, when that file exists. It is meant for the
+        host the benchmark guards image changes on, and isn't committed
+        since timings of other hosts don't compare. Record again when the
+        image gets slower on purpose or the reference host changes.
+      - otherwise (a fresh checkout, CI) the previous image, timed in the
+        same run under the same host conditions. This is what is expected
+        unless a reference host keeps a recording.
+
+Usage:
+    python3 benchmark_image_startup.py [iterations] [--build] [--record] [--max-regression=PERCENT]
+
+    --build: Build both images first
+    --record: Record the runner image's p50 times as the reference
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+# Add the src directory to sys.path to allow access packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from sandbox import supervisor  # noqa: E402
+from sandbox.docker_driver import cli_limit_args  # noqa: E402
+from sandbox.pool import SANDBOX_IMAGE, SANDBOX_LIMITS  # noqa: E402
+
+DOCKER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker'))
+RECORDED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_startup_p50.json')
+BASELINE_IMAGE = f'{SANDBOX_IMAGE}:baseline'
+IMAGES = {
+    SANDBOX_IMAGE: 'Dockerfile',
+    BASELINE_IMAGE: 'Dockerfile.ubuntu',
+}
+SCRIPT = "import json, re, collections, datetime, random\nprint('ready')\n"
+SCRIPT_PATH = '/tmp/script.py'
+
+# Writes the script passed as $0 and runs it through the launcher
+RUN_SCRIPT = ["sh", "-c", f'printf "%s" "$0" > {SCRIPT_PATH} && exec {" ".join(supervisor.launcher_command(SCRIPT_PATH))}',
+              SCRIPT]
+
+
+async def docker(*args: str) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        "docker", *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"docker {args[0]} failed: {stderr.decode(errors='replace').strip()}")
+    return stdout
+
+
+async def first_output(command: list) -> float:
+    """Returns the time from starting the command until it wrote its first output byte."""
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *command, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    first = await process.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    await process.stdout.read()
+    await process.wait()
+    if not first:
+        raise RuntimeError(f"{' '.join(command[:3])} wrote no output (exit status {process.returncode})")
+    return elapsed
+
+
+def report(name: str, timings: list):
+    timings.sort()
+    print(f"{name:>30}: mean {statistics.mean(timings) * 1000:7.1f} ms  "
+          f"p50 {timings[len(timings) // 2] * 1000:7.1f} ms  "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.1f} ms")
+
+
+async def build():
+    for image, dockerfile in IMAGES.items():
+        print(f"Building {image} from {dockerfile}")
+        await docker("build", "-q", "-t", image, "-f", os.path.join(DOCKER_DIR, dockerfile), DOCKER_DIR)
+
+
+def p50(timings: list) -> float:
+    return sorted(timings)[len(timings) // 2]
+
+
+async def benchmark(iterations: int) -> dict:
+    """
+    Returns:
+        dict: Maps image -> (p50 of its run timings, p50 of its exec timings) in seconds
+    """
+    run_args = ["docker", "run", "--rm", *cli_limit_args(SANDBOX_LIMITS)]
+    runs = {image: [] for image in IMAGES}
+    execs = {image: [] for image in IMAGES}
+
+    for image in IMAGES:
+        size = int((await docker("image", "inspect", "--format", "{{.Size}}", image)).strip())
+        print(f"{image:>30}: {size / 1024 / 1024:7.1f} MiB")
+        await first_output([*run_args, image, *RUN_SCRIPT])  # Warm up the image's layers in the page cache
+
+    # Interleaved, so both images see the same host conditions
+    for _ in range(iterations):
+        for image in IMAGES:
+            runs[image].append(await first_output([*run_args, image, *RUN_SCRIPT]))
+
+    for image in IMAGES:
+        name = f"codebox-image-bench-{os.getpid()}"
+        await docker("run", "-d", "--rm", *cli_limit_args(SANDBOX_LIMITS), "--name", name, image, "sleep", "infinity")
+        try:
+            for _ in range(iterations):
+                execs[image].append(await first_output(["docker", "exec", name, *RUN_SCRIPT]))
+        finally:
+            await docker("kill", name)
+
+    for image in IMAGES:
+        report(f"{image} run", runs[image])
+        report(f"{image} exec", execs[image])
+    return {image: (p50(runs[image]), p50(execs[image])) for image in IMAGES}
+
+
+def record(run_p50: float, exec_p50: float, iterations: int):
+    with open(RECORDED_PATH, 'w') as file:
+        json.dump({
+            "image": SANDBOX_IMAGE,
+            "run_p50_ms": round(run_p50 * 1000, 1),
+            "exec_p50_ms": round(exec_p50 * 1000, 1),
+            "iterations": iterations,
+            "host": socket.gethostname(),
+            "recorded": datetime.date.today().isoformat(),
+        }, file, indent=4)
+        file.write('\n')
+    print(f"Recorded {SANDBOX_IMAGE} p50 times in {RECORDED_PATH}")
+
+
+def read_recorded() -> dict | None:
+    try:
+        with open(RECORDED_PATH) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+async def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    iterations = int(args[0]) if args else 20
+    max_regression = next((float(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--max-regression=')), None)
+
+    if '--build' in sys.argv:
+        await build()
+    medians = await benchmark(iterations)
+    run_p50, exec_p50 = medians[SANDBOX_IMAGE]
+
+    change = run_p50 / medians[BASELINE_IMAGE][0] - 1
+    print(f"{SANDBOX_IMAGE} run p50 vs {BASELINE_IMAGE}: {change * 100:+.1f} %")
+
+    if '--record' in sys.argv:
+        record(run_p50, exec_p50, iterations)
+    if max_regression is None:
+        return
+
+    recorded = read_recorded()
+    if recorded is not None:
+        reference = recorded['run_p50_ms'] / 1000
+        print(f"Reference: recorded {SANDBOX_IMAGE} p50 ({recorded['run_p50_ms']} ms on {recorded['host']}, "
+              f"{recorded['recorded']})")
+    else:
+        reference = medians[BASELINE_IMAGE][0]
+        print(f"Reference: {BASELINE_IMAGE} p50 of this run (nothing recorded in {RECORDED_PATH})")
+    change = run_p50 / reference - 1
+    print(f"{SANDBOX_IMAGE} run p50 vs reference: {change * 100:+.1f} %")
+    if change * 100 > max_regression:
+        print(f"Regression: more than {max_regression} % slower than the reference")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Measure the overhead of profile mode (see server/docker/profiler.py).
+
+Runs a few workloads through the launcher on this machine's python3, plain
+and with CODEBOX_PROFILE set, and prints the slowdown and the growth of the
+peak RSS per workload (best of the given number of repetitions).
+
+Usage:
+    python3 benchmark_profile_overhead.py [repetitions]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+LAUNCHER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'docker', 'launcher.py'))
+
+WORKLOADS = {
+    "calls": "def fib(n):\n    return n if n < 2 else fib(n - 1) + fib(n - 2)\nfib(25)\n",
+    "allocations": "rows = [{'id': i, 'name': str(i) * 4, 'tags': [i, i + 1]} for i in range(300000)]\n",
+    "builtins": "import hashlib, random\n"
+                "data = [random.random() for _ in range(10 ** 6)]\n"
+                "for _ in range(5): sorted(data)\n"
+                "hashlib.sha256(b'x' * 50_000_000).hexdigest()\n",
+}
+
+
+def run_once(script: str, env: dict) -> tuple:
+    """
+    Returns:
+        tuple: (seconds, peak RSS in KiB) of running the script through the launcher
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-u", LAUNCHER, script], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{script} failed")
+    return elapsed, usage.ru_maxrss
+
+
+def measure(script: str, env: dict, repetitions: int) -> tuple:
+    results = [run_once(script, env) for _ in range(repetitions)]
+    return min(elapsed for elapsed, _ in results), min(rss for _, rss in results)
+
+
+def main(repetitions: int):
+    directory = tempfile.mkdtemp()
+    plain_env = {key: value for key, value in os.environ.items() if key != 'CODEBOX_PROFILE'}
+    profile_env = {**plain_env, "CODEBOX_PROFILE": os.path.join(directory, "profile.json")}
+
+    for name, code in WORKLOADS.items():
+        script = os.path.join(directory, f"{name}.py")
+        with open(script, 'w') as file:
+            file.write(code)
+
+        plain_time, plain_rss = measure(script, plain_env, repetitions)
+        profiled_time, profiled_rss = measure(script, profile_env, repetitions)
+        print(f"{name:>12}: {plain_time * 1000:8.1f} ms -> {profiled_time * 1000:8.1f} ms "
+              f"(x{profiled_time / plain_time:.2f})  "
+              f"peak RSS {plain_rss / 1024:6.1f} MiB -> {profiled_rss / 1024:6.1f} MiB "
+              f"(x{profiled_rss / plain_rss:.2f})")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
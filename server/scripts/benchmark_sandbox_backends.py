@@ -0,0 +1,94 @@
+"""
+Benchmark the per-execution overhead of the sandbox backends.
+
+Each iteration runs the sandbox operations of one execution: start a
+sandbox, copy a script into it, exec a trivial command in it, wait for it and
+kill the sandbox. Prints mean / p50 / p95 latency of the whole iteration and
+of the sandbox start alone per backend.
+
+Usage:
+    python3 benchmark_sandbox_backends.py [iterations] [backend ...] [--fake]
+
+    backend: docker-cli, docker-api, namespace (default: all three)
+    --fake: Benchmark the docker-api backend against fake_docker_daemon.py
+            instead of the real daemon
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Add the src directory to sys.path to allow access packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from sandbox.archive import files_archive  # noqa: E402
+from sandbox.docker_driver import DockerAPIDriver, DockerCLIDriver  # noqa: E402
+from sandbox.namespace_backend import NamespaceBackend  # noqa: E402
+from sandbox.pool import SANDBOX_IMAGE, SANDBOX_LIMITS, SANDBOX_WORKDIR  # noqa: E402
+
+from fake_docker_daemon import FakeDaemon  # noqa: E402
+
+BACKENDS = ['docker-cli', 'docker-api', 'namespace']
+ARCHIVE = files_archive({"script.py": b"print('hello')\n"})
+
+
+async def run_once(backend, name: str) -> tuple:
+    """
+    Returns:
+        tuple: (seconds of the whole execution, seconds until the sandbox was started)
+    """
+    start = time.perf_counter()
+    if not await backend.start_sandbox(name, SANDBOX_IMAGE, SANDBOX_LIMITS, ["sleep", "infinity"]):
+        raise RuntimeError(f"{name}: sandbox failed to start")
+    started = time.perf_counter() - start
+
+    await backend.copy_into(name, SANDBOX_WORKDIR, ARCHIVE)
+    process = await backend.exec(name, ["true"])
+    await process.stdout.read()
+    await process.wait()
+    await backend.kill_sandbox(name)
+    return time.perf_counter() - start, started
+
+
+def report(label: str, timings: list):
+    timings.sort()
+    print(f"{label:>24}: mean {statistics.mean(timings) * 1000:7.1f} ms  "
+          f"p50 {timings[len(timings) // 2] * 1000:7.1f} ms  "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.1f} ms")
+
+
+async def benchmark(label: str, backend, iterations: int):
+    await run_once(backend, f"bench-{os.getpid()}-warmup")
+    results = [await run_once(backend, f"bench-{os.getpid()}-{i}") for i in range(iterations)]
+    report(label, [total for total, _ in results])
+    report(f"{label} start", [started for _, started in results])
+    await backend.close()
+
+
+async def main(iterations: int, backends: list, fake: bool):
+    for name in backends:
+        if name == 'docker-cli':
+            await benchmark(name, DockerCLIDriver(), iterations)
+        elif name == 'namespace':
+            await benchmark(name, NamespaceBackend(), iterations)
+        elif fake:
+            socket_path = os.path.join(tempfile.mkdtemp(), 'docker.sock')
+            server = asyncio.create_task(FakeDaemon().serve(socket_path))
+            while not os.path.exists(socket_path):
+                await asyncio.sleep(0.01)
+
+            await benchmark(f"{name} (fake)", DockerAPIDriver(socket_path), iterations)
+            await asyncio.sleep(0.1)  # Let the daemon see the closed connections
+            server.cancel()
+        else:
+            await benchmark(name, DockerAPIDriver(), iterations)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    iterations = int(args[0]) if args and args[0].isdigit() else 50
+    backends = [arg for arg in args if arg in BACKENDS] or BACKENDS
+    asyncio.run(main(iterations, backends, '--fake' in sys.argv))
@@ -0,0 +1,190 @@
+"""
+Fake Docker Engine API daemon listening on a unix socket.
+
+Implements the subset of the Engine API used by the server's API driver
+(src/sandbox/docker_api.py), so the driver can be exercised and benchmarked
+on a machine without Docker. "Containers" are temporary directories and
+exec'd commands run as local processes inside them; their output is
+multiplexed over the hijacked connection exactly like the real daemon does.
+
+Usage:
+    python3 fake_docker_daemon.py <socket path>
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+from urllib.parse import urlsplit, parse_qs
+
+ids = itertools.count(1)
+
+
+class FakeDaemon:
+    def __init__(self):
+        self.containers = {}  # name -> {"dir": path, "running": bool, "labels": dict}
+        self.execs = {}  # exec id -> {"container": name, "cmd": list, "exit": int | None, "env": list}
+        self.images = {'python_runner': 'sha256:fake'}
+
+    async def serve(self, socket_path: str):
+        server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                url = urlsplit(target)
+                path = re.sub(r'^/v[\d.]+', '', url.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                if method == 'POST' and re.fullmatch(r'/exec/[^/]+/start', path):
+                    await self.exec_start(path.split('/')[2], reader, writer)
+                    return  # Hijacked connection is closed when the process ends
+
+                status, payload = self.route(method, path, params, body)
+                if isinstance(payload, bytes):
+                    data, content_type = payload, 'application/x-tar'
+                else:
+                    data, content_type = json.dumps(payload).encode() if payload is not None else b'', 'application/json'
+                head = f"HTTP/1.1 {status} X\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n"
+                writer.write(head.encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method, path, params, body):
+        if method == 'POST' and path == '/containers/create':
+            name = params['name']
+            labels = json.loads(body).get('Labels') or {}
+            self.containers[name] = {"dir": tempfile.mkdtemp(prefix='fake-container-'), "running": False, "labels": labels}
+            return 201, {"Id": name}
+
+        if method == 'GET' and path == '/containers/json':
+            wanted = json.loads(params.get('filters', '{}')).get('label', [])
+            return 200, [
+                {"Names": [f"/{name}"], "Labels": container['labels']}
+                for name, container in self.containers.items()
+                if all(label in container['labels'] for label in wanted)
+            ]
+
+        match = re.fullmatch(r'/containers/([^/]+)(/\w+)?', path)
+        if match:
+            name, action = match.group(1), match.group(2)
+            container = self.containers.get(name)
+            if container is None:
+                return 404, {"message": f"No such container: {name}"}
+
+            if method == 'POST' and action == '/start':
+                container['running'] = True
+                return 204, None
+            if method == 'POST' and action == '/kill':
+                if not container['running']:
+                    return 409, {"message": "Container is not running"}
+                container['running'] = False
+                shutil.rmtree(container['dir'], ignore_errors=True)
+                del self.containers[name]  # AutoRemove
+                return 204, None
+            if method == 'POST' and action == '/update':
+                return 200, {"Warnings": []}
+            if method == 'POST' and action == '/wait':
+                return 200, {"StatusCode": 0}
+            if method == 'DELETE' and action is None:
+                shutil.rmtree(container['dir'], ignore_errors=True)
+                del self.containers[name]
+                return 204, None
+            if method == 'PUT' and action == '/archive':
+                with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                    tar.extractall(container['dir'])
+                return 200, None
+            if method == 'GET' and action == '/archive':
+                return self.get_archive(container, params['path'])
+            if method == 'POST' and action == '/exec':
+                config = json.loads(body)
+                exec_id = f"exec{next(ids)}"
+                self.execs[exec_id] = {"container": name, "cmd": config['Cmd'], "env": config.get('Env') or [], "exit": None}
+                return 201, {"Id": exec_id}
+
+        match = re.fullmatch(r'/exec/([^/]+)/json', path)
+        if match and match.group(1) in self.execs:
+            instance = self.execs[match.group(1)]
+            return 200, {"ExitCode": instance['exit'], "Running": instance['exit'] is None}
+
+        match = re.fullmatch(r'/images/([^/]+)/json', path)
+        if match:
+            image_id = self.images.get(match.group(1))
+            return (200, {"Id": image_id}) if image_id else (404, {"message": "No such image"})
+
+        return 404, {"message": f"Unsupported: {method} {path}"}
+
+    @staticmethod
+    def get_archive(container, path):
+        # Container paths are resolved inside its directory
+        host_path = os.path.join(container['dir'], path.lstrip('/'))
+        if not os.path.exists(host_path):
+            return 404, {"message": f"Could not find the file {path} in container"}
+
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            tar.add(host_path, arcname=os.path.basename(host_path.rstrip('/')))
+        return 200, buffer.getvalue()
+
+    async def exec_start(self, exec_id, reader, writer):
+        instance = self.execs[exec_id]
+        container = self.containers[instance['container']]
+
+        writer.write(b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.raw-stream\r\n"
+                     b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n")
+        await writer.drain()
+
+        env = dict(item.split('=', 1) for item in instance['env'])
+        process = await asyncio.create_subprocess_exec(
+            *instance['cmd'], cwd=container['dir'], env=env or None,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+
+        async def pump_stdin():
+            while data := await reader.read(65536):
+                process.stdin.write(data)
+                await process.stdin.drain()
+            process.stdin.close()
+
+        async def pump_output(stream, stream_type):
+            while data := await stream.read(65536):
+                writer.write(bytes([stream_type, 0, 0, 0]) + len(data).to_bytes(4, 'big') + data)
+                await writer.drain()
+
+        stdin_task = asyncio.create_task(pump_stdin())
+        await asyncio.gather(pump_output(process.stdout, 1), pump_output(process.stderr, 2))
+        instance['exit'] = await process.wait()
+        stdin_task.cancel()
+        writer.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Correct args usage: py fake_docker_daemon.py <socket path>")
+    else:
+        asyncio.run(FakeDaemon().serve(sys.argv[1]))
@@ -0,0 +1,93 @@
+"""
+Run several sandbox runners on this machine, for testing the remote backend.
+
+Starts N runner_server.py processes on consecutive ports, each with a
+sandbox directory of its own, and prints the RUNNER_ADDRESSES to give the
+server (SANDBOX_BACKEND=remote). Runs until interrupted.
+
+Usage:
+    python3 local_runners.py [count] [--port N] [--backend namespace|docker]
+
+    count: Number of runners (default: 2)
+    --port: Port of the first runner (default: 7070)
+    --backend: Local backend of the runners (default: namespace)
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+
+RUNNER_SERVER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'sandbox', 'runner_server.py'))
+DEFAULT_COUNT = 2
+DEFAULT_PORT = 7070
+START_TIMEOUT = 10  # Seconds
+
+
+async def wait_listening(port: int):
+    deadline = asyncio.get_running_loop().time() + START_TIMEOUT
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Runner on port {port} did not start")
+            await asyncio.sleep(0.1)
+
+
+async def start_runners(count: int, port: int = DEFAULT_PORT, backend: str = 'namespace', token: str = '') -> tuple:
+    """
+    Returns:
+        tuple: (runner processes, RUNNER_ADDRESSES value)
+    """
+    processes = []
+    for i in range(count):
+        env = {
+            **os.environ,
+            "SANDBOX_BACKEND": backend,
+            "SANDBOX_NAMESPACE_DIR": tempfile.mkdtemp(prefix=f"codebox-runner{i}-"),
+            "RUNNER_HOST": '127.0.0.1',
+            "RUNNER_NAME": f"local-{i}",
+            "RUNNER_TOKEN": token,
+        }
+        processes.append(await asyncio.create_subprocess_exec(
+            sys.executable, RUNNER_SERVER, "--port", str(port + i), env=env
+        ))
+
+    await asyncio.gather(*(wait_listening(port + i) for i in range(count)))
+    return processes, ','.join(f"127.0.0.1:{port + i}" for i in range(count))
+
+
+async def stop_runners(processes: list):
+    for process in processes:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)  # Lets the runner kill its sandboxes
+    await asyncio.gather(*(process.wait() for process in processes))
+
+
+async def main(count: int, port: int, backend: str):
+    processes, addresses = await start_runners(count, port, backend)
+    print(f"RUNNER_ADDRESSES={addresses}")
+    try:
+        await asyncio.gather(*(process.wait() for process in processes))
+    finally:
+        await stop_runners(processes)
+
+
+def option(name: str, default: str) -> str:
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    positional = [arg for i, arg in enumerate(args) if not arg.startswith('--') and (i == 0 or not args[i - 1].startswith('--'))]
+    count = int(positional[0]) if positional else DEFAULT_COUNT
+    try:
+        asyncio.run(main(count, int(option("--port", DEFAULT_PORT)), option("--backend", 'namespace')))
+    except KeyboardInterrupt:
+        pass
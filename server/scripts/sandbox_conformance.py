@@ -0,0 +1,213 @@
+"""
+Conformance checks of the sandbox backends.
+
+Runs the same checks against every given backend: the behavior execution
+relies on (I/O, exit codes, environment, file copies, the launcher and the
+fork server, timeouts, signals) and the isolation sandboxes must provide
+(PID namespace, no network, read-only system files, memory limit, and
+live limit updates on backends supporting them).
+Prints a line per check and exits with status 1 if any check failed.
+
+Usage:
+    python3 sandbox_conformance.py [backend ...]
+
+    backend: docker-cli, docker-api, namespace, remote (default: namespace)
+             remote runs the checks through two local runners (local_runners.py)
+             using the namespace backend
+"""
+
+import asyncio
+import io
+import os
+import signal
+import sys
+import tarfile
+
+# Add the src directory to sys.path to allow access packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from sandbox import supervisor  # noqa: E402
+from sandbox.archive import files_archive  # noqa: E402
+from sandbox.docker_driver import DockerAPIDriver, DockerCLIDriver  # noqa: E402
+from sandbox.namespace_backend import NamespaceBackend  # noqa: E402
+from sandbox.pool import SANDBOX_IMAGE, SANDBOX_LIMITS, SANDBOX_WORKDIR  # noqa: E402
+from sandbox.remote_backend import RemoteBackend  # noqa: E402
+
+from local_runners import start_runners, stop_runners  # noqa: E402
+
+BACKENDS = {
+    'docker-cli': DockerCLIDriver,
+    'docker-api': DockerAPIDriver,
+    'namespace': NamespaceBackend,
+    'remote': RemoteBackend,
+}
+LOCAL_RUNNERS = 2
+CHECK_TIMEOUT = 30  # Seconds
+
+
+async def run(backend, name: str, command: list, stdin_data: bytes = b'', env: dict = None) -> tuple:
+    """
+    Returns:
+        tuple: (return code, stdout, stderr) of a command run in the sandbox
+    """
+    process = await backend.exec(name, command, env=env)
+
+    async def feed():
+        process.stdin.write(stdin_data)
+        await process.stdin.drain()
+        process.stdin.close()
+
+    _, stdout, stderr = await asyncio.gather(feed(), process.stdout.read(), process.stderr.read())
+    return await process.wait(), stdout, stderr
+
+
+class Conformance:
+    """Runs the checks against one backend, each in a fresh sandbox."""
+
+    def __init__(self, label: str, backend):
+        self.label = label
+        self.backend = backend
+        self.counter = 0
+        self.failed = 0
+
+    async def sandbox(self, forkserver: bool = False) -> str:
+        self.counter += 1
+        name = f"conformance-{os.getpid()}-{self.counter}"
+        command = supervisor.sandbox_main_command(forkserver)
+        assert await self.backend.start_sandbox(name, SANDBOX_IMAGE, SANDBOX_LIMITS, command), "sandbox failed to start"
+        return name
+
+    async def check(self, description: str, body, forkserver: bool = False):
+        name = None
+        try:
+            name = await self.sandbox(forkserver)
+            await asyncio.wait_for(body(name), timeout=CHECK_TIMEOUT)
+            print(f"  PASS  {description}")
+        except Exception as exc:
+            self.failed += 1
+            print(f"  FAIL  {description}: {type(exc).__name__} {exc}")
+        finally:
+            if name is not None:
+                await self.backend.kill_sandbox(name)
+
+    async def run_all(self) -> int:
+        print(f"{self.label}:")
+        backend = self.backend
+
+        async def io_and_exit_code(name):
+            code, stdout, stderr = await run(backend, name, ["sh", "-c", "cat; echo err >&2; exit 3"], b"ping\n")
+            assert (code, stdout, stderr) == (3, b"ping\n", b"err\n"), (code, stdout, stderr)
+
+        async def environment_and_workdir(name):
+            _, stdout, _ = await run(backend, name, ["sh", "-c", 'echo "$X:$(pwd)"'], env={"X": "1"})
+            assert stdout == f"1:{SANDBOX_WORKDIR}\n".encode(), stdout
+
+        async def copy_in_and_out(name):
+            await backend.copy_into(name, SANDBOX_WORKDIR, files_archive({"data.txt": b"content"}))
+            _, stdout, _ = await run(backend, name, ["cat", "data.txt"])
+            assert stdout == b"content", stdout
+
+            archive = await backend.copy_from(name, f"{SANDBOX_WORKDIR}/data.txt")
+            with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+                assert tar.extractfile("data.txt").read() == b"content"
+            assert await backend.copy_from(name, f"{SANDBOX_WORKDIR}/missing") is None
+
+        async def launcher(name):
+            await backend.copy_into(name, SANDBOX_WORKDIR, files_archive({"script.py": b"print(input() * 2)\n"}))
+            command = supervisor.run_command("script.py", 10, SANDBOX_WORKDIR, False)
+            code, stdout, _ = await run(backend, name, command, b"ab\n")
+            assert code == 0 and stdout == b"abab\n", (code, stdout)
+
+        async def forkserver(name):
+            await backend.copy_into(name, SANDBOX_WORKDIR, files_archive({"script.py": b"import sys; print(sys.argv[0]); sys.exit(5)\n"}))
+            command = supervisor.run_command("script.py", 10, SANDBOX_WORKDIR, True)
+            code, stdout, _ = await run(backend, name, command)
+            assert code == 5 and stdout == b"script.py\n", (code, stdout)
+
+        async def timeout(name):
+            await backend.copy_into(name, SANDBOX_WORKDIR, files_archive({"script.py": b"while True: pass\n"}))
+            code, _, _ = await run(backend, name, supervisor.run_command("script.py", 1, SANDBOX_WORKDIR, False))
+            assert code == 124, code
+
+        async def signals(name):
+            process = await backend.exec(name, ["sleep", "30"])
+            await asyncio.sleep(0.5)
+            await backend.signal(name, signal.SIGTERM)
+            code = await asyncio.wait_for(process.wait(), timeout=5)
+            assert code in (128 + signal.SIGTERM, -signal.SIGTERM), code
+
+            # The main process survives
+            code, _, _ = await run(backend, name, ["true"])
+            assert code == 0, code
+
+        async def pid_namespace(name):
+            _, stdout, _ = await run(backend, name, ["cat", "/proc/1/cmdline"])
+            assert stdout.split(b'\0')[0] == b"sleep", stdout
+
+        async def no_network(name):
+            script = "import socket; socket.create_connection(('1.1.1.1', 53), timeout=2)"
+            code, _, _ = await run(backend, name, ["python3", "-c", script])
+            assert code != 0, "connected"
+
+        async def read_only_system(name):
+            code, _, _ = await run(backend, name, ["sh", "-c", "echo x > /usr/conformance"])
+            assert code != 0, "wrote to /usr"
+
+        async def memory_limit(name):
+            script = f"b = bytearray({SANDBOX_LIMITS['memory'] * 2}); b[::4096] = b'x' * len(b[::4096])"
+            code, _, _ = await run(backend, name, ["python3", "-c", script])
+            assert code != 0, "allocated twice the memory limit"
+
+        async def raised_limits(name):
+            limits = {**SANDBOX_LIMITS, "memory": SANDBOX_LIMITS['memory'] * 4}
+            assert await backend.update_limits(name, limits), "update failed"
+            script = f"b = bytearray({SANDBOX_LIMITS['memory'] * 2}); b[::4096] = b'x' * len(b[::4096])"
+            code, _, _ = await run(backend, name, ["python3", "-c", script])
+            assert code == 0, "couldn't allocate twice the initial memory limit after raising it"
+
+        async def killed(name):
+            await backend.kill_sandbox(name)
+            try:
+                code, _, _ = await run(backend, name, ["true"])
+            except Exception:
+                return
+            assert code != 0, "exec succeeded after kill"
+
+        await self.check("stdin / stdout / stderr and exit code", io_and_exit_code)
+        await self.check("environment and working directory", environment_and_workdir)
+        await self.check("copy into / out of the sandbox", copy_in_and_out)
+        await self.check("script through the launcher", launcher)
+        await self.check("script through the fork server", forkserver, forkserver=True)
+        await self.check("timeout", timeout)
+        await self.check("signal", signals)
+        await self.check("PID namespace", pid_namespace)
+        await self.check("no network", no_network)
+        await self.check("read-only system files", read_only_system)
+        await self.check("memory limit", memory_limit)
+        if backend.live_limits:
+            await self.check("raised limits of a running sandbox", raised_limits)
+        await self.check("killed sandbox", killed)
+
+        image_id = await backend.image_id(SANDBOX_IMAGE)
+        print(f"  image: {image_id}")
+        await backend.close()
+        return self.failed
+
+
+async def main(backends: list) -> int:
+    failed = 0
+    for label in backends:
+        if label == 'remote':
+            runners, addresses = await start_runners(LOCAL_RUNNERS)
+            try:
+                failed += await Conformance(label, RemoteBackend(addresses.split(','))).run_all()
+            finally:
+                await stop_runners(runners)
+        else:
+            failed += await Conformance(label, BACKENDS[label]()).run_all()
+    return failed
+
+
+if __name__ == '__main__':
+    backends = [arg for arg in sys.argv[1:] if arg in BACKENDS] or ['namespace']
+    sys.exit(1 if asyncio.run(main(backends)) else 0)
@@ -0,0 +1,259 @@
+"""
+Execution scheduler with an admission queue and per-user fairness.
+
+Every code execution (EXEC / RUNF) has to be admitted by the scheduler before
+a sandbox is started. This keeps a burst of requests (e.g. a whole classroom
+pressing "Run" at once) from oversubscribing the host with containers.
+
+Policy:
+    - At most `max_concurrent` executions run at the same time
+    - At most `max_per_user` executions of a single user run at the same time
+    - Excess requests wait in per-user FIFO queues, which are served
+      round-robin so one user's burst cannot starve everybody else
+    - Waiting requests are told their (estimated) position in the queue
+      whenever it changes
+
+Statistics:
+    Queue depth, wait time and run time are tracked and exposed via stats()
+
+Environment Variables:
+    EXEC_MAX_CONCURRENT: Global cap on running executions (default: 2 per CPU core)
+    EXEC_MAX_PER_USER: Cap on running executions per user (default: 2)
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+DEFAULT_MAX_PER_USER = 2
+
+
+class ExecutionTicket:
+    """
+    Admission ticket of a single execution request.
+
+    Attributes:
+        user (str): Key of the user the execution belongs to
+        enqueued_at (float): Monotonic time the request arrived
+        started_at (float): Monotonic time the request was admitted
+        position (int): Last queue position reported to the waiter
+        updates (asyncio.Queue): Position updates, None once admitted
+    """
+
+    def __init__(self, user: str):
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.position = None
+        self.updates = asyncio.Queue()
+
+    @property
+    def admitted(self) -> bool:
+        return self.started_at is not None
+
+
+class ExecutionScheduler:
+    """
+    Admits executions under a global and a per-user concurrency cap,
+    queueing the rest with round-robin fairness across users.
+
+    Attributes:
+        max_concurrent (int): Global cap on running executions
+        max_per_user (int): Cap on running executions per user
+        queues (dict): Maps user key -> deque of waiting tickets
+        order (deque): Round-robin order of users with waiting tickets
+        running (dict): Maps user key -> number of running executions
+    """
+
+    def __init__(self, max_concurrent: int = None, max_per_user: int = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrent (int): Global cap on running executions
+            max_per_user (int): Cap on running executions per user
+        """
+        load_dotenv()
+        default_concurrent = 2 * (os.cpu_count() or 1)  # Sandboxes get half a CPU each
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(os.getenv("EXEC_MAX_CONCURRENT", default_concurrent))
+        self.max_per_user = max_per_user if max_per_user is not None else int(os.getenv("EXEC_MAX_PER_USER", DEFAULT_MAX_PER_USER))
+
+        self.queues: dict[str, deque] = {}
+        self.order = deque()
+        self.running: dict[str, int] = {}
+        self.running_total = 0
+
+        # Statistics
+        self.admitted_count = 0
+        self.finished_count = 0
+        self.max_queue_depth = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+
+    async def acquire(self, user: str, on_position=None) -> ExecutionTicket:
+        """
+        Wait until an execution of `user` may start.
+
+        Args:
+            user (str): Key identifying the user (used for fairness)
+            on_position (coroutine function): Called with the queue position
+                while waiting, and with 0 once admitted after waiting
+
+        Returns:
+            ExecutionTicket: Ticket to pass to release() when the execution ends
+        """
+        ticket = ExecutionTicket(user)
+
+        if user not in self.queues:
+            self.queues[user] = deque()
+            self.order.append(user)
+        self.queues[user].append(ticket)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth())
+
+        self.dispatch()
+
+        try:
+            while True:
+                position = await ticket.updates.get()
+
+                # Only the latest position matters
+                while not ticket.updates.empty():
+                    position = ticket.updates.get_nowait()
+
+                if position is None:
+                    break  # Admitted
+                if on_position:
+                    await on_position(position)
+
+            if on_position and ticket.position is not None:
+                await on_position(0)
+
+        except BaseException:
+            if ticket.admitted:
+                self.release(ticket)
+            else:
+                self.cancel(ticket)
+            raise
+
+        return ticket
+
+    def release(self, ticket: ExecutionTicket):
+        """
+        Mark an admitted execution as finished and admit waiting ones.
+
+        Args:
+            ticket (ExecutionTicket): Ticket returned by acquire()
+        """
+        run_time = time.monotonic() - ticket.started_at
+        self.finished_count += 1
+        self.run_time_total += run_time
+        self.run_time_max = max(self.run_time_max, run_time)
+
+        self.running[ticket.user] -= 1
+        if not self.running[ticket.user]:
+            del self.running[ticket.user]
+        self.running_total -= 1
+
+        self.dispatch()
+
+    def cancel(self, ticket: ExecutionTicket):
+        """Remove a waiting ticket from the queue (e.g. the client disconnected)."""
+        queue = self.queues.get(ticket.user)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                self.remove_user(ticket.user)
+            self.update_positions()
+
+    def remove_user(self, user: str):
+        """Forget a user that has no waiting tickets left."""
+        del self.queues[user]
+        self.order.remove(user)
+
+    def can_run(self, user: str) -> bool:
+        return self.running.get(user, 0) < self.max_per_user
+
+    def dispatch(self):
+        """Admit waiting tickets round-robin across users while capacity allows."""
+        while self.running_total < self.max_concurrent:
+            # Find the next user in round-robin order allowed to run
+            for _ in range(len(self.order)):
+                user = self.order[0]
+                self.order.rotate(-1)  # Served users move to the back of the line
+                if self.can_run(user):
+                    break
+            else:
+                break  # Nobody can run right now
+
+            ticket = self.queues[user].popleft()
+            if not self.queues[user]:
+                self.remove_user(user)
+            self.admit(ticket)
+
+        self.update_positions()
+
+    def admit(self, ticket: ExecutionTicket):
+        """Start the execution of a ticket."""
+        ticket.started_at = time.monotonic()
+        wait_time = ticket.started_at - ticket.enqueued_at
+        self.admitted_count += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+        self.running[ticket.user] = self.running.get(ticket.user, 0) + 1
+        self.running_total += 1
+        ticket.updates.put_nowait(None)
+
+    def update_positions(self):
+        """
+        Recompute the estimated position of every waiting ticket and notify
+        the ones whose position changed.
+
+        With round-robin service, the i-th ticket of a user is served in
+        round i. It is preceded by up to i tickets of every other user, and by
+        the i-th ticket of users earlier in the rotation order.
+        """
+        lengths = [(user, len(self.queues[user])) for user in self.order]
+
+        for rank, (user, _) in enumerate(lengths):
+            for i, ticket in enumerate(self.queues[user]):
+                position = 1 + i
+                for other_rank, (other, length) in enumerate(lengths):
+                    if other == user:
+                        continue
+                    position += min(length, i)
+                    if other_rank < rank and length > i:
+                        position += 1
+
+                if position != ticket.position:
+                    ticket.position = position
+                    ticket.updates.put_nowait(position)
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Queue depth, running executions, wait and run times (ms)
+        """
+        avg_wait = self.wait_time_total / self.admitted_count if self.admitted_count else 0.0
+        avg_run = self.run_time_total / self.finished_count if self.finished_count else 0.0
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "running": self.running_total,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted_count,
+            "finished": self.finished_count,
+            "wait_ms_avg": round(avg_wait * 1000, 2),
+            "wait_ms_max": round(self.wait_time_max * 1000, 2),
+            "run_ms_avg": round(avg_run * 1000, 2),
+            "run_ms_max": round(self.run_time_max * 1000, 2),
+        }
@@ -16,9 +16,10 @@ Key Components:
    - Handles file operations and user storage
    - Implements real-time code output streaming
    - Manages interactive input/output for running programs
+   - Runs code cells in the session's persistent REPL kernel
 
 Security Features:
-- Sandboxed execution using Docker containers
+- Sandboxed execution using Docker containers (kept warm in a pool)
 - Resource limits on containers (CPU, memory, PIDs)
 - Network isolation for executed code
 - Execution timeout limits
@@ -46,11 +47,82 @@ import json
 import protocol
 import errors
 import traceback
+import hashlib
+import functools
+import time
 
 from db.remote.database_socket_client import DatabaseSocketClient
 
 from utils import user_file_manager
 
+from controllers.execution_scheduler import ExecutionScheduler
+
+from sandbox import supervisor
+from sandbox.accounting import UsageStats, read_usage
+from sandbox.archive import directory_archive, files_archive
+from sandbox.bytecode_cache import (
+    BytecodeCache,
+    PROJECT_CACHE_DIR,
+    PROJECT_CACHE_PARENT
+)
+from sandbox.batch import (
+    BatchConfig,
+    output_matches,
+    parse_request,
+    run_case,
+    shard_cases
+)
+from sandbox.backend import create_backend
+from sandbox.environments import (
+    EnvironmentManager,
+    RequirementsError,
+    REQUIREMENTS_FILE,
+    MAX_REQUIREMENTS_BYTES
+    )
+from sandbox.limits import LimitsPolicy
+from sandbox.kernel import (
+    KernelManager,
+    KernelSession,
+    INTERRUPT_GRACE,
+    STATE_DIED,
+    STATE_EXPIRED,
+    STATE_RESTARTED,
+    STATE_STARTED,
+    STATE_STOPPED,
+    TIMEOUT_STATUS
+)
+
+from sandbox.output import (
+    OutputCoalescer,
+    OutputBudget,
+    OutputStats,
+    READ_SIZE
+)
+
+from sandbox.preflight import CompileChecker, read_script
+from sandbox.profiling import profile_environment, read_profile
+
+from sandbox.pool import (
+    SandboxPool,
+    Sandbox,
+    SANDBOX_WORKDIR,
+    SANDBOX_LIMITS
+)
+
+from sandbox.reaper import SandboxReaper
+from sandbox.test_suite import (
+    SuiteResults,
+    TestDurations,
+    TestSuiteConfig,
+    run_runner,
+    shard_tests
+)
+
+from sandbox.result_cache import (
+    ResultCache,
+    result_key
+)
+
 from utils.logger import (
     Logger,
     Level,
@@ -64,18 +136,33 @@ from utils.b64 import (
 
 # Globals
 DB_CLIENTS_NUM = 3
-SANDBOX_WORKDIR = '/home/sandboxuser/app'
 EXECUTION_TIMEOUT = 60  # seconds
+SANDBOX_LEASE_MARGIN = 30  # seconds a sandbox is held past its timeouts (setup, usage, bytecode)
+CLIENT_SEND_BUFFER_LIMIT = 256 * 1024  # bytes queued to a client before output reading pauses
+CLIENT_DRAIN_INTERVAL = 0.05  # seconds
+DEFAULT_MAX_SESSION_RUNS = 4  # concurrent runs of a client session
+RUN_CANCELLED = 4  # Return code (DONE) of cancelled runs
+MAX_INPUT_BUFFER = 1024 * 1024  # characters of input buffered ahead per run
+INPUT_FEED_SIZE = 64 * 1024  # characters of buffered input written per read of the program
+
+# Requests starting a run (see Run)
+RUN_REQUESTS = (
+    protocol.CODE_RUN_SCRIPT,
+    protocol.CODE_RUN_FILE,
+    protocol.CODE_RUN_PROFILE,
+    protocol.CODE_RUN_TESTS,
+    protocol.CODE_RUN_TEST_SUITE,
+    protocol.CODE_KERNEL_RUN,
+)
 
+# Requests that may carry the run's input up front (<request>~<code or path>~<base64 input>)
+UPFRONT_INPUT_REQUESTS = (
+    protocol.CODE_RUN_SCRIPT,
+    protocol.CODE_RUN_FILE,
+    protocol.CODE_RUN_PROFILE,
+    protocol.CODE_KERNEL_RUN,
+)
 
-def user_container_id():
-    """Generator function that produces unique container IDs."""
-    id = 0
-    while True:
-        id += 1
-        yield id
-
-container_id_gen = user_container_id()
 
 class Server:
     """
@@ -84,6 +171,7 @@ class Server:
     This class is responsible for:
     - Managing active WebSocket client connections
     - Maintaining a pool of database connections
+    - Maintaining a warm pool of sandbox containers
     - Handling client authentication and registration
     - Logging server events
     
@@ -92,6 +180,22 @@ class Server:
         logger (Logger): Server event logger
         db_server_ip (str): IP address of the database server
         db_connections (list): Pool of database connections
+        sandbox_backend (SandboxBackend): Backend managing sandboxes (Docker or Linux namespaces)
+        sandbox_pool (SandboxPool): Warm pool of sandbox containers
+        sandbox_reaper (SandboxReaper): Killer of leaked sandboxes
+        sandbox_limits (LimitsPolicy): Load-adaptive resource limits of the sandboxes of runs
+        scheduler (ExecutionScheduler): Admission control for code executions
+        output_stats (OutputStats): Output frame statistics of finished runs
+        result_cache (ResultCache): Recorded results of deterministic runs
+        usage_stats (UsageStats): Resource usage of finished runs
+        batch_config (BatchConfig): Limits of batch (test case) executions
+        test_suite_config (TestSuiteConfig): Limits of test suite runs
+        test_durations (TestDurations): Durations of the users' tests, for sharding test suites
+        bytecode_cache (BytecodeCache): Bytecode written by users' RUNF runs
+        kernels (KernelManager): Persistent REPL kernels of the client sessions
+        compile_checker (CompileChecker): Pre-flight compile check of executed scripts
+        environments (EnvironmentManager): Python environments of the projects' requirements
+        max_session_runs (int): Max number of concurrent runs of a client session
     """
 
     def __init__(self, db_server_ip):
@@ -109,6 +213,52 @@ class Server:
 
         # Active connections with DB server
         self.db_connections = []
+
+        # Backend managing sandboxes (Docker containers or Linux namespaces)
+        self.sandbox_backend = create_backend()
+
+        # Python environments of the projects' requirements, mounted into every sandbox
+        self.environments = EnvironmentManager()
+
+        # Pre-started sandboxes for code execution
+        self.sandbox_pool = SandboxPool(self.sandbox_backend, mounts=self.environments.mounts())
+
+        # Kills sandboxes of crashed server instances and runs past their lease
+        self.sandbox_reaper = SandboxReaper(self.sandbox_pool)
+
+        # Resource limits of the runs' sandboxes, adapted to the host's load
+        self.sandbox_limits = LimitsPolicy(self.sandbox_backend)
+
+        # Admission control for code executions
+        self.scheduler = ExecutionScheduler()
+
+        # Output frame statistics of finished runs
+        self.output_stats = OutputStats()
+
+        # Recorded results of deterministic runs (opt-in)
+        self.result_cache = ResultCache()
+
+        # Resource usage of finished runs, read from their cgroups
+        self.usage_stats = UsageStats()
+
+        # Limits of batch (test case) executions
+        self.batch_config = BatchConfig()
+
+        # Limits of test suite runs, and the durations of the users' tests they are sharded by
+        self.test_suite_config = TestSuiteConfig()
+        self.test_durations = TestDurations()
+
+        # Bytecode written by users' RUNF runs
+        self.bytecode_cache = BytecodeCache()
+
+        # Persistent REPL kernels, holding pooled sandboxes between cells
+        self.kernels = KernelManager(self.sandbox_pool, cell_lease=EXECUTION_TIMEOUT + SANDBOX_LEASE_MARGIN)
+
+        # Compiles scripts before they are executed, failing syntax errors without a sandbox
+        self.compile_checker = CompileChecker()
+
+        # Concurrent runs allowed per client session (SESSION_MAX_RUNS)
+        self.max_session_runs = int(os.getenv("SESSION_MAX_RUNS", DEFAULT_MAX_SESSION_RUNS))
         
     async def initialize_db_connections(self):
         """Initialize the database connection pool."""
@@ -117,6 +267,37 @@ class Server:
 
         # Initialize connections
         await asyncio.gather(*(conn.init_connection() for conn in self.db_connections))
+
+    async def initialize_sandbox_pool(self):
+        """Start the sandbox reaper, then start filling the sandbox pool with warm containers."""
+        await self.sandbox_reaper.start()
+        await self.sandbox_pool.start()
+        self.compile_checker.start(self.sandbox_pool)
+        self.environments.start(self.sandbox_pool)
+        self.sandbox_limits.start()
+
+    def stats(self) -> dict:
+        """
+        Collect runtime statistics of the server components.
+
+        Returns:
+            dict: Statistics grouped by component
+        """
+        return {
+            "sandbox_backend": self.sandbox_backend.stats(),
+            "sandbox_pool": self.sandbox_pool.stats(),
+            "sandbox_reaper": self.sandbox_reaper.stats(),
+            "sandbox_limits": self.sandbox_limits.stats(),
+            "scheduler": self.scheduler.stats(),
+            "output": self.output_stats.stats(),
+            "result_cache": self.result_cache.stats(),
+            "run_usage": self.usage_stats.stats(),
+            "bytecode_cache": self.bytecode_cache.stats(),
+            "kernels": self.kernels.stats(),
+            "preflight": self.compile_checker.stats(),
+            "environments": self.environments.stats(),
+            "test_durations": self.test_durations.stats(),
+        }
             
     async def handle_client(self, websocket):
         """
@@ -180,6 +361,15 @@ class Server:
         for conn in self.db_connections:
             await conn.close_connection()
 
+        # Destroy idle sandbox containers
+        await self.compile_checker.close()
+        await self.environments.close()
+        await self.sandbox_limits.close()
+        await self.kernels.close()
+        await self.sandbox_reaper.close()
+        await self.sandbox_pool.close()
+        await self.sandbox_backend.close()
+
         # Close all websocket connections
         for sock in self.active_clients:
             try:
@@ -191,12 +381,131 @@ class Server:
         self.logger.log_connection_event(Level.LEVEL_INFO, Event.SERVER_CLOSED)
 
 
+class Run:
+    """
+    State of one execution of a client session.
+
+    Every EXEC, RUNF, RUNP, RUNT, TEST and KRUN request starts a run with an ID
+    unique within the session. The ID is announced to the client (RNID)
+    and carried in the run's messages (QUEU, OUTP, INPT, DONE, PROF, TSTR, TRES, TSUM),
+    so the client can tell the output and input requests of concurrent runs
+    apart, send input to a specific run and cancel it.
+
+    Input the program doesn't wait for yet (sent up front with the request,
+    or typed ahead) is buffered, and fed to the program whenever it is about
+    to block on stdin. The client is only asked for input (INPT) once the
+    buffer runs dry, so input-heavy programs don't wait for a round trip per line.
+
+    Attributes:
+        id (int): Run ID
+        code (str): Request code that started the run
+        task (asyncio.Task): Task executing the run
+        sandbox (Sandbox): Pooled sandbox used by the run, while it holds one
+        process (asyncio.subprocess.Process): Running process (the kernel's for cells)
+        kernel (KernelSession): Kernel running the cell, for KRUN runs
+        output (OutputCoalescer): Output decoder/coalescer of the running process
+        output_budget (OutputBudget): Output budget of the running process
+        output_offset (int): Number of output bytes read from the running process
+        output_progress (asyncio.Condition): Notified whenever output is read
+        input_pending (bool): Whether the process waits for input
+        input_buffer (str): Input received before the program asked for it
+        input_eof (bool): Whether the end of input follows the buffered input
+        started (float): Monotonic time the process started
+        usage (dict): Resource usage of the run, sent with DONE
+        profile (dict): Profile of a profiled run, sent after DONE
+    """
+
+    def __init__(self, id: int, code: str):
+        self.id = id
+        self.code = code
+        self.task = None
+        self.sandbox = None
+        self.process = None
+        self.kernel = None
+
+        # Output of the running process (input events wait on it)
+        self.output = None
+        self.recorded_frames = None  # Output frames of the running process, for the result cache
+        self.input_consumed = False
+        self.output_budget = None
+        self.client_pauses = 0  # Times output reading paused for a slow client
+        self.output_offset = 0
+        self.output_eof = False
+        self.output_progress = asyncio.Condition()
+        self.output_lock = asyncio.Lock()
+        self.input_pending = False
+        self.input_buffer = ''
+        self.input_eof = False
+
+        # Resource usage (see sandbox/accounting.py) and profile (see sandbox/profiling.py)
+        self.started = None
+        self.usage = None
+        self.profile = None
+
+    def attach(self, process, record: bool = False):
+        """
+        Reset the output state for a newly started process.
+
+        Args:
+            process (asyncio.subprocess.Process): The process
+            record (bool): Whether to record the output frames (for the result cache)
+        """
+        self.process = process
+        self.recorded_frames = [] if record else None
+        self.input_consumed = False
+        self.output = OutputCoalescer()
+        self.output_budget = OutputBudget()
+        self.client_pauses = 0
+        self.output_offset = 0
+        self.output_eof = False
+        self.input_pending = False
+
+    def buffer_input(self, input: str | None) -> bool:
+        """
+        Buffer input ahead of the program reading it.
+
+        Args:
+            input (str | None): Text, None for the end of input. Input after
+                                the end of input is dropped
+
+        Returns:
+            bool: False if the input was refused, it would overflow MAX_INPUT_BUFFER
+        """
+        if self.input_eof:
+            return True
+        if input is None:
+            self.input_eof = True
+        elif len(self.input_buffer) + len(input) <= MAX_INPUT_BUFFER:
+            self.input_buffer += input
+        else:
+            return False
+        return True
+
+    def take_input(self) -> str | None:
+        """
+        Returns:
+            str | None: Next chunk of buffered input, None for the end of input
+        """
+        input, self.input_buffer = self.input_buffer[:INPUT_FEED_SIZE], self.input_buffer[INPUT_FEED_SIZE:]
+        return input if input or not self.input_eof else None
+
+    @property
+    def input_buffered(self) -> bool:
+        """Whether input (or its end) is waiting for the program."""
+        return bool(self.input_buffer) or self.input_eof
+
+
 class ClientHandler:
     """
     Handles individual WebSocket client connections and their operations.
     
     Manages WebSocket communication, authentication, Docker containers for code execution,
     file operations, and real-time code I/O streaming.
+
+    Only the handler loop receives messages. Runs execute in tasks of their
+    own, so a session can hold several of them at once (up to the server's
+    max_session_runs); the loop passes input, interrupts and cancellations
+    on to them.
     
     Attributes:
         websocket (WebSocketServerProtocol): Client WebSocket connection
@@ -205,11 +514,8 @@ class ClientHandler:
         server (Server): Main server instance
         logger (Logger): Client logger
         email (str): User email (set after login)
-        container_name (str): Docker container name
-        container_running (bool): Container running status
-        process (asyncio.subprocess.Process): Running container process
-        pid (int): Python script process ID
-        process_ready_event (asyncio.Event): Process ready event
+        runs (dict): Maps run ID -> run in progress (see Run)
+        kernel (KernelSession): REPL kernel of the session, if one was started
     """
 
     def __init__(self, websocket, ip, port, server):
@@ -231,10 +537,12 @@ class ClientHandler:
         self.email = None  # will be set when user is logged in
         self.disconnect_flag = False  # Will be set to True when user logs out
 
-        self.container_name = f"n-{next(container_id_gen)}"
-        self.container_running = None  # Will be set True when container is running
-        self.process = None
-        self.pid = None
+        # Runs in progress, by run ID
+        self.runs: dict[int, Run] = {}
+        self.last_run_id = 0
+
+        # Persistent REPL kernel (see sandbox/kernel.py)
+        self.kernel: KernelSession | None = None
 
     async def send(self, msg: str) -> None:
         """
@@ -273,7 +581,8 @@ class ClientHandler:
         except websockets.exceptions.ConnectionClosed:
             self.logger.log_connection_event(Level.LEVEL_INFO, Event.CONNECTION_CLOSED)
         finally:
-            await self.close_container()
+            await self.cancel_runs()
+            await self.shutdown_kernel()
             self.unregister_user()
 
     def unregister_user(self):
@@ -344,12 +653,68 @@ class ClientHandler:
             execution_finished, data = data
 
             if not execution_finished:
-                to_send = f"{protocol.CODE_OUTPUT}~{data}"
+                run_id, output = data
+                to_send = f"{protocol.CODE_OUTPUT}~{run_id}~{output}"
             else:
-                to_send = f"{protocol.CODE_RUN_END}~{data}"
+                # Return code, followed by the run's resource usage (JSON) when available
+                run_id, returncode, usage = data
+                to_send = f"{protocol.CODE_RUN_END}~{run_id}~{returncode}"
+                if usage is not None:
+                    to_send += f"~{json.dumps(usage)}"
         
+        elif request == protocol.CODE_KERNEL_RUN:
+            run_id, status, usage = data
+            if status is not None:
+                to_send = f"{protocol.CODE_RUN_END}~{run_id}~{status}"
+                if usage is not None:
+                    to_send += f"~{json.dumps(usage)}"
+            else:
+                to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_KERNEL_UNAVAILABLE}"
+
+        elif request == protocol.CODE_KERNEL_STATE:
+            if data is not None:
+                to_send = f"{protocol.CODE_KERNEL_STATE}~{data}"
+            else:
+                to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_KERNEL_UNAVAILABLE}"
+
+        elif request == protocol.CODE_RUN_PROFILE:
+            # The profile follows the run's DONE, null if the run wrote none
+            run_id, profile = data
+            to_send = f"{protocol.CODE_PROFILE}~{run_id}~{json.dumps(profile)}"
+
+        elif request == protocol.CODE_RUN_TESTS:
+            run_id, results = data
+            if results is not None:
+                to_send = f"{protocol.CODE_TEST_RESULTS}~{run_id}~{json.dumps(results)}"
+            else:
+                to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_INVALID_TEST_CASES}"
+
+        elif request == protocol.CODE_RUN_TEST_SUITE:
+            run_id, summary = data
+            to_send = f"{protocol.CODE_TEST_SUMMARY}~{run_id}~{json.dumps(summary)}"
+
+        elif request == protocol.CODE_TEST_RESULT:
+            run_id, result = data
+            to_send = f"{protocol.CODE_TEST_RESULT}~{run_id}~{json.dumps(result)}"
+
+        elif request == protocol.CODE_RUN_ID:
+            if data is not None:
+                to_send = f"{protocol.CODE_RUN_ID}~{data}"
+            else:  # The session holds as many runs as allowed
+                to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_TOO_MANY_RUNS}"
+
+        elif request == protocol.CODE_CANCEL_RUN:
+            to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_RUN_NOT_FOUND}"
+
+        elif request == protocol.CODE_INPUT:  # Input refused, data is the run's ID (None for input up front)
+            to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_INPUT_REFUSED}" + (f"~{data}" if data is not None else "")
+
         elif request == protocol.CODE_BLOCKED_INPUT:
-            to_send = f"{protocol.CODE_BLOCKED_INPUT}"
+            to_send = f"{protocol.CODE_BLOCKED_INPUT}~{data}"
+
+        elif request == protocol.CODE_QUEUED:
+            run_id, position = data
+            to_send = f"{protocol.CODE_QUEUED}~{run_id}~{position}"
 
         if general_error:
             to_send = f"{protocol.CODE_ERROR}~{protocol.ERROR_GENERAL}"
@@ -361,7 +726,8 @@ class ClientHandler:
         Process an incoming client request.
         
         Parses the request message and dispatches to appropriate handler based on
-        the request code.
+        the request code. Execution requests start a run and return right away,
+        the run sends its responses itself (see start_run).
         
         Args:
             msg (str): The incoming request message
@@ -400,18 +766,35 @@ class ClientHandler:
                 data: dict = json.loads(data[0])
                 async with await self.server.get_db_conn() as db_conn:
                     res = await update_user_file(self.email, data["path"], data["content"], db_conn)
+                    if res:
+                        self.server.bytecode_cache.invalidate(await db_conn.get_user_id(self.email), data["path"])
                 to_send = self.server_create_response(code, res)
 
-            elif code == protocol.CODE_RUN_FILE:
-                res = await self.run_from_storage(data[0])
-                to_send = self.server_create_response(code, (True, res))
-            
-            elif code == protocol.CODE_RUN_SCRIPT:
-                res = await self.run_script(data[0])
-                to_send = self.server_create_response(code, (True, res))
+            elif code in RUN_REQUESTS:
+                to_send = await self.start_run(code, data)
+
+            elif code == protocol.CODE_CANCEL_RUN:
+                run = self.find_run(data)
+                if run is not None:
+                    await self.cancel_run(run)  # The run ends with DONE
+                else:
+                    to_send = self.server_create_response(code, None)
+
+            elif code == protocol.CODE_KERNEL_RESTART:
+                res = await self.restart_kernel()
+                to_send = self.server_create_response(protocol.CODE_KERNEL_STATE, res)
 
-            elif code == protocol.CODE_INPUT:
-                return base64_decode(data[0])
+            elif code == protocol.CODE_KERNEL_SHUTDOWN:
+                res = await self.shutdown_kernel()
+                to_send = self.server_create_response(protocol.CODE_KERNEL_STATE, res)
+
+            elif code == protocol.CODE_INPUT or code == protocol.CODE_INPUT_EOF:
+                await self.deliver_input(code, data)
+
+            elif code == protocol.CODE_KERNEL_INTERRUPT:
+                # Only a running cell can be interrupted
+                if self.kernel is not None and self.kernel.busy:
+                    await self.kernel.interrupt()
 
             elif code == protocol.CODE_STORAGE_ADD:
                 async with await self.server.get_db_conn() as db_conn:
@@ -422,6 +805,8 @@ class ClientHandler:
                 file_path = data[0]
                 async with await self.server.get_db_conn() as db_conn:
                     res = await user_file_delete(self.email, file_path, db_conn)
+                    if res:
+                        self.server.bytecode_cache.invalidate(await db_conn.get_user_id(self.email), file_path)
                 to_send = self.server_create_response(protocol.CODE_DELETE_FILE, (res, file_path))
 
             elif code == protocol.CODE_DOWNLOAD_FILE:
@@ -431,7 +816,8 @@ class ClientHandler:
                 to_send = self.server_create_response(protocol.CODE_DOWNLOAD_FILE, res)
 
             elif code == protocol.CODE_LOGOUT:
-                await self.close_container()
+                await self.cancel_runs()
+                await self.shutdown_kernel()
                 self.unregister_user()
                 self.logger.log_connection_event(Level.LEVEL_INFO, Event.USER_LOGOUT)
         
@@ -442,156 +828,828 @@ class ClientHandler:
 
         return to_send
 
-    async def run_script(self, data) -> int:
+    async def start_run(self, code: str, data: list) -> str:
+        """
+        Start a run for an execution request, announcing its ID to the client.
+
+        Args:
+            code (str): Execution request code (see RUN_REQUESTS)
+            data (list): Fields of the request
+
+        Returns:
+            str: Error response if the run can't start, '' otherwise
+        """
+        if code == protocol.CODE_KERNEL_RUN and any(run.code == code for run in self.runs.values()):
+            return self.server_create_response(code, (None, None))  # The kernel runs one cell at a time
+        if len(self.runs) >= self.server.max_session_runs:
+            return self.server_create_response(protocol.CODE_RUN_ID, None)
+
+        run = Run(self.last_run_id + 1, code)
+        if code in UPFRONT_INPUT_REQUESTS and len(data) > 1 and not run.buffer_input(base64_decode(data[1])):
+            return self.server_create_response(protocol.CODE_INPUT, None)
+        self.last_run_id = run.id
+        self.runs[run.id] = run
+        await self.send(self.server_create_response(protocol.CODE_RUN_ID, run.id))
+
+        run.task = asyncio.create_task(self.drive_run(run, data))
+        return ''
+
+    async def drive_run(self, run: Run, data: list):
+        """
+        Execute a run and send its final response (DONE, PROF, TSTR or an error).
+        A cancelled run ends with DONE and RUN_CANCELLED.
+        """
+        try:
+            try:
+                response = await self.execute_run(run, data)
+            except asyncio.CancelledError:
+                response = self.server_create_response(protocol.CODE_RUN_SCRIPT, (True, (run.id, RUN_CANCELLED, None)))
+            except websockets.exceptions.ConnectionClosed:
+                return
+            except Exception as e:
+                print(f"Error: {e}")
+                print(traceback.format_exc())
+                response = self.server_create_response(None, None, general_error=True)
+            finally:
+                self.runs.pop(run.id, None)
+
+            await self.send(response)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def execute_run(self, run: Run, data: list) -> str:
+        """
+        Returns:
+            str: Final response of the run
+        """
+        if run.code == protocol.CODE_RUN_SCRIPT:
+            res = await self.run_script(run, data[0])
+            return self.server_create_response(run.code, (True, (run.id, res, run.usage)))
+
+        if run.code == protocol.CODE_RUN_FILE:
+            res = await self.run_from_storage(run, data[0])
+            return self.server_create_response(run.code, (True, (run.id, res, run.usage)))
+
+        if run.code == protocol.CODE_RUN_PROFILE:
+            res = await self.run_from_storage(run, data[0], profile=True)
+            await self.send(self.server_create_response(protocol.CODE_RUN_FILE, (True, (run.id, res, run.usage))))
+            return self.server_create_response(run.code, (run.id, run.profile))
+
+        if run.code == protocol.CODE_RUN_TESTS:
+            res = await self.run_tests(json.loads(data[0]))
+            return self.server_create_response(run.code, (run.id, res))
+
+        if run.code == protocol.CODE_RUN_TEST_SUITE:
+            res = await self.run_test_suite(run)
+            return self.server_create_response(run.code, (run.id, res))
+
+        res = await self.run_cell(run, data[0])
+        return self.server_create_response(run.code, (run.id, res, run.usage))
+
+    def find_run(self, data: list) -> Run | None:
+        """
+        Returns:
+            Run | None: The run whose ID is the first field of a request, None if there is none
+        """
+        try:
+            return self.runs.get(int(data[0]))
+        except (IndexError, ValueError):
+            return None
+
+    async def cancel_run(self, run: Run):
+        """Cancel a run: its sandbox is torn down right away and its slot freed."""
+        run.task.cancel()
+        await asyncio.gather(run.task, return_exceptions=True)
+        self.runs.pop(run.id, None)
+
+    async def cancel_runs(self):
+        """Cancel all runs of the session (logout or disconnect)."""
+        await asyncio.gather(*(self.cancel_run(run) for run in list(self.runs.values())))
+
+    async def deliver_input(self, code: str, data: list):
+        """
+        Pass input (INPR~<run ID>~<base64 text>, or end of input with INPE~<run ID>)
+        to the run it is meant for. Input the run's program doesn't wait for
+        yet is buffered until it does (type-ahead), input for ended runs is dropped.
+        """
+        run = self.find_run(data)
+        if run is None:
+            return
+
+        input = None
+        if code == protocol.CODE_INPUT:
+            input = base64_decode(data[1]) if len(data) > 1 else ''
+
+            # Make sure input ends with new-line
+            if not input.endswith('\n'):
+                input += '\n'
+
+        if not run.input_pending:
+            if not run.buffer_input(input):
+                await self.send(self.server_create_response(protocol.CODE_INPUT, run.id))
+            return
+        run.input_pending = False
+        await self.feed_input(run, input)
+
+    async def feed_input(self, run: Run, input: str | None):
+        """Pass input to the program of a run, a process or a kernel cell (None for the end of input)."""
+        if run.kernel is not None:
+            if input is None:
+                await run.kernel.send("eof")
+            else:
+                await run.kernel.send("input", data=input)
+        else:
+            await self.write_input(run, input)
+
+    async def run_script(self, run: Run, data) -> int:
         """
         Execute Python code in a sandboxed Docker container.
         
-        Creates a new container with resource limits and security constraints,
-        writes the code to a file, and executes it with a timeout. Handles
-        real-time output streaming and interactive input.
+        Takes a warm container from the sandbox pool, copies the code into its
+        working directory as a tar archive and executes it with a timeout.
+        Handles real-time output streaming and interactive input.
         
         Args:
+            run (Run): The run
             data (str): Base64 encoded Python code to execute
             
         Returns:
             int: Process return code
         """
         # Decode the base64 encoded Python code
-        code = base64_decode(data)
+        code = base64_decode(data).encode('utf-8')
 
-        # Build docker command with security constraints:
-        # - Limited CPU and memory
-        # - Limited number of processes
-        # - No network access
-        # - Auto-remove container when done
-        command = [
-            "docker", "run", "-i",
-            "--rm",
-            "--cpus=0.5",
-            "--memory=128m",
-            "--pids-limit=64",
-            "--network", "none",
-            "--name", self.container_name,
-            "python_runner",
-            "/bin/bash", "-c",
-            # Create script file, write code to it, run with timeout
-            f"touch script.py && echo '{code}' > script.py && timeout {EXECUTION_TIMEOUT}s python3 -u script.py"
-        ]
-        
-        async def run_process():
-            # Start the docker process with pipes for I/O
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-            )
+        # The code travels as a file, never on the command line (quoting, argv size limits)
+        archive = files_archive({"script.py": code})
 
-            self.process = process
-            await asyncio.sleep(0.1)  # Wait a bit for the process to start
-            # Get the Python process ID inside the container
-            self.pid = await self.get_python_pid(self.container_name)
+        # Scripts that don't compile fail without a sandbox
+        error = await self.server.compile_checker.check(code, "script.py")
+        if error is not None:
+            await self.send_output(run, error)
+            return 1
 
-            # Start monitoring input and streaming output concurrently
-            await asyncio.gather(
-                self.monitor_input(),
-                self.stream_output()
-            )
+        async def copy_script(sandbox: Sandbox):
+            await self.server.sandbox_backend.copy_into(sandbox.name, SANDBOX_WORKDIR, archive)
 
-            await process.wait()
-            return process.returncode
+        command = supervisor.run_command(
+            "script.py", EXECUTION_TIMEOUT, SANDBOX_WORKDIR, self.server.sandbox_pool.forkserver
+        )
 
-        self.container_running = True
+        cache_key = None
+        if self.server.result_cache.enabled:
+            cache_key = self.result_key(command, files={"script.py": hashlib.sha256(code).hexdigest()})
 
-        try:
-            # Run the process with a timeout (plus 1 second buffer)
-            returncode = await asyncio.wait_for(
-                run_process(),
-                timeout=EXECUTION_TIMEOUT + 1  # slight buffer
-            )
-        except asyncio.TimeoutError:
-            # Log timeout error and cleanup
-            self.logger.log_connection_event(Level.LEVEL_ERROR, Event.EXECUTION_TIMEOUT)
-            try:
-                self.process.kill()
-            except:
-                pass
-            await self.process.wait()
-            return 3
-        except websockets.exceptions.ConnectionClosedOK:
-            try:
-                await self.close_container()
-                self.process.kill()
-            except:
-                pass
-            return
-
-        return returncode
+        return await self.execute_in_sandbox(run, command, prepare=copy_script, cache_key=cache_key)
 
-    async def run_from_storage(self, path: str) -> int:
+    async def run_from_storage(self, run: Run, path: str, profile: bool = False) -> int:
         """
         Execute a Python file from user storage in a sandboxed container.
         
         Similar to run_script() but executes an existing file from the user's
-        storage directory. Mounts the storage directory read-only in the container.
+        storage directory. The storage directory is copied into the container's
+        working directory before execution, along with the bytecode cached by
+        the user's previous runs (see sandbox/bytecode_cache.py).
+
+        A profiled run executes under cProfile and tracemalloc, and its
+        profile is kept in run.profile (see sandbox/profiling.py).
+
+        The packages of the project's requirements.txt are importable from
+        an environment built from the server's wheelhouse (see sandbox/environments.py).
         
         Args:
+            run (Run): The run
             path (str): Path to the Python file to execute
+            profile (bool): Whether to profile the run
             
         Returns:
             int: Process return code
         """
 
+        user_id, copy_project = await self.project_copier()
+
+        # Scripts that don't compile fail without a sandbox
+        checker = self.server.compile_checker
+        if checker.active:
+            source = await asyncio.to_thread(
+                read_script, user_file_manager.user_folder_name(user_id), path, checker.max_bytes
+            )
+            error = await checker.check(source, path) if source is not None else None
+            if error is not None:
+                await self.send_output(run, error)
+                return 1
+
+        bytecode_cache = self.server.bytecode_cache
+        generation = bytecode_cache.generation(user_id)
+
+        async def prepare(sandbox: Sandbox):
+            await copy_project(sandbox)
+
+            # Restore the bytecode of the user's previous runs
+            archive = await asyncio.to_thread(bytecode_cache.archive, user_id)
+            if archive:
+                await self.server.sandbox_backend.copy_into(sandbox.name, PROJECT_CACHE_PARENT, archive)
+
+        async def save_bytecode(sandbox: Sandbox):
+            archive = await self.server.sandbox_backend.copy_from(sandbox.name, PROJECT_CACHE_DIR)
+            if archive:
+                try:
+                    await asyncio.to_thread(bytecode_cache.store, user_id, archive, generation)
+                except OSError:
+                    pass
+
+        async def finish(sandbox: Sandbox):
+            if bytecode_cache.enabled:
+                await save_bytecode(sandbox)
+            if profile:
+                run.profile = await read_profile(self.server.sandbox_backend, sandbox.name)
+
+        # Packages of the project's requirements, failing the run if they can't be installed
+        environments = self.server.environments
+        try:
+            environment = await self.acquire_environment(user_id)
+        except RequirementsError as e:
+            await self.send_output(run, f"{e}\n")
+            return 1
+
+        try:
+            env = bytecode_cache.environment() if bytecode_cache.enabled else None
+            if profile:
+                env = {**(env or {}), **profile_environment()}
+            if environment is not None:
+                env = {**(env or {}), **environments.environment(environment)}
+            command = supervisor.run_command(
+                path, EXECUTION_TIMEOUT, SANDBOX_WORKDIR, self.server.sandbox_pool.forkserver, env=env
+            )
+
+            # Profiled runs always execute, their profile is the point
+            cache_key = None
+            if self.server.result_cache.enabled and not profile:
+                snapshot = await asyncio.to_thread(user_file_manager.project_snapshot, user_id)
+                # The command doesn't always carry the environment, and the wheelhouse may change
+                key_command = [*command, environment] if environment is not None else command
+                cache_key = self.result_key(key_command, files=snapshot)
+
+            if env is None:
+                return await self.execute_in_sandbox(run, command, prepare=copy_project, cache_key=cache_key)
+
+            return await self.execute_in_sandbox(
+                run, command, prepare=prepare if bytecode_cache.enabled else copy_project,
+                cache_key=cache_key, env=env, finish=finish
+            )
+        finally:
+            if environment is not None:
+                environments.release(environment)
+
+    async def acquire_environment(self, user_id: int) -> str | None:
+        """
+        Get the environment of the packages in the user's requirements.txt
+        (see sandbox/environments.py), to be released once the run ended.
+
+        Returns:
+            str | None: Digest of the environment, None if the project needs none
+
+        Raises:
+            RequirementsError: If the requirements can't be installed
+        """
+        environments = self.server.environments
+        if not environments.enabled:
+            return None
+
+        requirements = await asyncio.to_thread(
+            read_script, user_file_manager.user_folder_name(user_id), REQUIREMENTS_FILE, MAX_REQUIREMENTS_BYTES
+        )
+        if requirements is None:
+            return None
+        return await environments.acquire(requirements)
+
+    async def project_copier(self) -> tuple:
+        """
+        Prepare copying the user's storage directory into sandboxes.
+
+        Returns:
+            tuple: (user ID, coroutine function copying the directory into a sandbox's working directory)
+        """
         # Retrieve a database connection
         async with await self.server.get_db_conn() as db_conn:
             # Get the user's storage directory path
             user_id = await db_conn.get_user_id(self.email)
-            
+
         user_path = user_file_manager.user_folder_name(user_id)
-        
-        # Build docker run command with security constraints
-        # - Limited CPU and memory
-        # - Limited number of processes
-        # - No network access
-        # - Auto-remove container when done
-        command = [
-            "docker", "run", "-i",
-            "--rm",
-            "--cpus=0.5",
-            "--memory=128m",
-            "--pids-limit=64",
-            "--network", "none",
-            # Mount user directory read-only into container
-            "-v", f"{os.path.abspath(user_path)}:{SANDBOX_WORKDIR}:ro",
-            "--name", self.container_name,
-            "python_runner",
-            "timeout", f"{EXECUTION_TIMEOUT}s", "python3", "-u", path
-        ]
-        
-        async def run_process():
-            # Start the docker process with pipes for I/O
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
+
+        async def copy_project(sandbox: Sandbox):
+            # Copy user directory into the container's working directory
+            archive = await asyncio.to_thread(directory_archive, os.path.abspath(user_path))
+            await self.server.sandbox_backend.copy_into(sandbox.name, SANDBOX_WORKDIR, archive)
+
+        return user_id, copy_project
+
+    async def run_tests(self, request: dict) -> dict | None:
+        """
+        Run a file from user storage against a list of test cases.
+
+        The cases are spread over a few sandboxes, each running its share of
+        the cases one after the other (see sandbox/batch.py).
+
+        Args:
+            request (dict): {"path": str, "cases": [{"input": str, "expected": str (optional)}, ...],
+                             "timeout": per-case timeout in seconds (optional)}
+
+        Returns:
+            dict | None: Per-case results and a summary, None if the request is invalid
+        """
+        config = self.server.batch_config
+        parsed = parse_request(request, config, EXECUTION_TIMEOUT)
+        if parsed is None:
+            return None
+
+        path, cases, timeout = parsed
+        command = ["python3", "-u", path]
+        _, copy_project = await self.project_copier()
+
+        results = [None] * len(cases)
+        shard_limits = []
+        started = time.monotonic()
+
+        async def run_shard(indices: list):
+            ticket = await self.server.scheduler.acquire(self.user_key())
+            try:
+                lease = len(indices) * (timeout + 2) + SANDBOX_LEASE_MARGIN
+                sandbox = await self.server.sandbox_pool.acquire(lease=lease)
+                if sandbox is None:
+                    for i in indices:
+                        results[i] = {"returncode": 2}  # Execution environment failed
+                    return
+
+                try:
+                    sandbox.used = True
+                    await self.server.sandbox_limits.admit(sandbox)
+                    await copy_project(sandbox)
+                    for i in indices:
+                        case = cases[i]
+                        result = await run_case(
+                            self.server.sandbox_backend, sandbox.name, command, case.get("input", ""),
+                            timeout, config.max_case_output
+                        )
+                        if case.get("expected") is not None:
+                            result["passed"] = result["returncode"] == 0 and output_matches(result["stdout"], case["expected"])
+                        results[i] = result
+                finally:
+                    shard_limits.append(self.server.sandbox_limits.release(sandbox))
+                    await self.server.sandbox_pool.release(sandbox)
+            finally:
+                self.server.scheduler.release(ticket)
+
+        await asyncio.gather(*(run_shard(indices) for indices in shard_cases(len(cases), config.max_sandboxes)))
+
+        return {
+            "results": results,
+            "passed": sum(1 for result in results if result.get("passed")),
+            "total": len(cases),
+            "time_ms": round((time.monotonic() - started) * 1000),
+            "limits": shard_limits,
+        }
+
+    async def run_test_suite(self, run: Run) -> dict:
+        """
+        Discover and run the pytest / unittest tests of the user's storage,
+        sharded across sandboxes by the tests' durations in earlier runs (see
+        sandbox/test_suite.py). Every test's result is sent as it finishes.
+
+        Args:
+            run (Run): The run
+
+        Returns:
+            dict: Summary of the results, {"error": str} if the tests couldn't be discovered
+        """
+        user_id, copy_project = await self.project_copier()
+        environments = self.server.environments
+        try:
+            environment = await self.acquire_environment(user_id)
+        except RequirementsError as e:
+            return {"error": str(e)}
+
+        try:
+            env = environments.environment(environment) if environment is not None else None
+            return await self.execute_test_suite(run, user_id, copy_project, env)
+        finally:
+            if environment is not None:
+                environments.release(environment)
+
+    async def execute_test_suite(self, run: Run, user_id: int, copy_project, env: dict | None) -> dict:
+        """
+        Returns:
+            dict: Summary of the results (see run_test_suite)
+        """
+        config = self.server.test_suite_config
+        backend = self.server.sandbox_backend
+        pool = self.server.sandbox_pool
+        scheduler = self.server.scheduler
+        limits = self.server.sandbox_limits
+        lease = config.timeout + 2 + SANDBOX_LEASE_MARGIN
+        started = time.monotonic()
+
+        collected = {"tests": [], "errors": []}
+        results = None
+
+        async def on_collect_event(event: dict):
+            if event['event'] == 'found' and len(collected["tests"]) <= config.max_tests:
+                collected["tests"].append(str(event.get('id')))
+            elif event['event'] == 'collection_error':
+                collected["errors"].append({"id": str(event.get('id')), "message": str(event.get('message', ''))})
+            elif event['event'] == 'collected':
+                collected["framework"] = str(event.get('framework'))
+
+        async def on_test_event(test_ids: set, event: dict):
+            result = results.add(event, test_ids) if event['event'] == 'test' else None
+            if result is not None:
+                self.server.test_durations.record(user_id, result["id"], result["duration_ms"] / 1000)
+                await self.send(self.server_create_response(protocol.CODE_TEST_RESULT, (run.id, result)))
+
+        async def run_shard(sandbox: Sandbox, test_ids: list):
+            log = await run_runner(
+                backend, sandbox.name, ["run", collected["framework"]], json.dumps(test_ids).encode(), env,
+                config.timeout, functools.partial(on_test_event, set(test_ids))
             )
+            for result in results.missing(test_ids, log):
+                await self.send(self.server_create_response(protocol.CODE_TEST_RESULT, (run.id, result)))
+
+        async def run_new_shard(test_ids: list):
+            ticket = await scheduler.acquire(self.user_key())
+            try:
+                sandbox = await pool.acquire(lease=lease)
+                if sandbox is None:
+                    for result in results.missing(test_ids, b"No sandbox available"):
+                        await self.send(self.server_create_response(protocol.CODE_TEST_RESULT, (run.id, result)))
+                    return
+                try:
+                    sandbox.used = True
+                    await limits.admit(sandbox)
+                    await copy_project(sandbox)
+                    await run_shard(sandbox, test_ids)
+                finally:
+                    results.limits.append(limits.release(sandbox))
+                    await pool.release(sandbox)
+            finally:
+                scheduler.release(ticket)
+
+        async def finish_discovery():
+            # Called when the first shard ends (or the suite fails): the other shards wait for
+            # tickets of their own, holding this one meanwhile could deadlock the scheduler
+            nonlocal sandbox, ticket
+            try:
+                if sandbox is not None:
+                    discovering, sandbox = sandbox, None
+                    shard_limits = limits.release(discovering)
+                    if results is not None:
+                        results.limits.insert(0, shard_limits)
+                    await pool.release(discovering)
+            finally:
+                if ticket is not None:
+                    held, ticket = ticket, None
+                    scheduler.release(held)
+
+        async def run_first_shard(test_ids: list):
+            try:
+                await run_shard(sandbox, test_ids)
+            finally:
+                await finish_discovery()
+
+        # The sandbox discovering the tests runs the first shard
+        sandbox = None
+        ticket = await scheduler.acquire(self.user_key(), on_position=functools.partial(self.send_queue_position, run))
+        try:
+            sandbox = await pool.acquire(lease=lease)
+            if sandbox is None:
+                return {"error": "Execution environment unavailable"}
+            sandbox.used = True
+            await limits.admit(sandbox)
+            await copy_project(sandbox)
+            log = await run_runner(backend, sandbox.name, ["collect"], b'', env, config.timeout, on_collect_event)
+            if "framework" not in collected:
+                return {"error": "Test discovery failed\n" + log.decode('utf-8', errors='replace')}
+            if len(collected["tests"]) > config.max_tests:
+                return {"error": f"More than {config.max_tests} tests"}
+
+            results = SuiteResults(collected["framework"], collected["errors"])
+            test_ids = collected["tests"]
+            estimates = self.server.test_durations.estimate(user_id, test_ids)
+            max_shards = min(config.max_sandboxes, scheduler.max_per_user, scheduler.max_concurrent)
+            shards = shard_tests(test_ids, estimates, max_shards)
+            results.shards = len(shards)
+
+            if shards:
+                pool.renew(sandbox, lease)  # The lease covered the discovery, now the first shard
+                await asyncio.gather(run_first_shard(shards[0]), *(run_new_shard(shard) for shard in shards[1:]))
+        finally:
+            await finish_discovery()
+
+        return results.summary(round((time.monotonic() - started) * 1000))
+
+    async def run_cell(self, run: Run, data) -> int | None:
+        """
+        Run a code cell in the session's REPL kernel, starting the kernel first if needed.
+
+        Output and input requests are streamed like those of EXEC runs. While
+        the cell runs, the client can interrupt it (KINT). Cancelling the run
+        shuts the kernel down.
+
+        Args:
+            run (Run): The run
+            data (str): Base64 encoded code of the cell
+
+        Returns:
+            int | None: Status of the cell (see server/docker/kernel.py, TIMEOUT_STATUS
+                        at the execution timeout), None if no kernel is available
+        """
+        code = base64_decode(data)
+
+        if self.kernel is not None and self.kernel.busy:
+            return None  # A cell is already running
+        if self.kernel is None:
+            if await self.start_kernel() is None:
+                return None
+            await self.send(self.server_create_response(protocol.CODE_KERNEL_STATE, STATE_STARTED))
+
+        kernel = self.kernel
+        kernel.reserve()  # Keeps the idle timeout from reclaiming it while queued
+        try:
+            ticket = await self.server.scheduler.acquire(
+                self.user_key(), on_position=functools.partial(self.send_queue_position, run)
+            )
+            try:
+                await self.server.sandbox_limits.admit(kernel.sandbox)
+                try:
+                    status = await self.execute_cell(run, kernel, code)
+                finally:
+                    limits = self.server.sandbox_limits.release(kernel.sandbox)
+                run.usage = {"limits": limits}
+            finally:
+                self.server.scheduler.release(ticket)
+        except asyncio.CancelledError:
+            # The cell's state can't be trusted anymore
+            if kernel is self.kernel:
+                await self.shutdown_kernel()
+                await self.send(self.server_create_response(protocol.CODE_KERNEL_STATE, STATE_STOPPED))
+            raise
+        finally:
+            kernel.finished()
+
+        if kernel is self.kernel and not kernel.alive():
+            await self.shutdown_kernel(STATE_DIED)
+            await self.send(self.server_create_response(protocol.CODE_KERNEL_STATE, STATE_DIED))
+        return status
 
-            self.process = process
-            await asyncio.sleep(0.1)  # Wait a bit for the process to start
-            # Get the Python process ID inside the container
-            self.pid = await self.get_python_pid(self.container_name, code_path=path)
+    async def start_kernel(self) -> KernelSession | None:
+        """
+        Start a REPL kernel for the session, with the user's project copied
+        into its sandbox when logged in.
+
+        Returns:
+            KernelSession | None: The kernel, None if none is available
+        """
+        prepare = None
+        if self.email:
+            _, prepare = await self.project_copier()
+
+        self.kernel = await self.server.kernels.start(prepare, on_expire=self.kernel_expired)
+        return self.kernel
+
+    async def restart_kernel(self) -> str | None:
+        """
+        Replace the session's kernel with a fresh one, or start one if there is none.
+
+        Returns:
+            str | None: The new kernel state, None if no kernel is available
+        """
+        state = STATE_STARTED
+        if self.kernel is not None:
+            await self.shutdown_kernel()
+            state = STATE_RESTARTED
+
+        if await self.start_kernel() is None:
+            return None
+        return state
+
+    async def shutdown_kernel(self, reason: str = STATE_STOPPED) -> str:
+        """
+        Shut down the session's kernel, if any, and reclaim its sandbox.
+
+        Returns:
+            str: The new kernel state
+        """
+        kernel, self.kernel = self.kernel, None
+        if kernel is not None:
+            await kernel.close(reason)
+        return STATE_STOPPED
+
+    async def kernel_expired(self, kernel: KernelSession):
+        """Inform the client that its kernel was shut down for being idle."""
+        if kernel is not self.kernel:
+            return
+        self.kernel = None
+        try:
+            await self.send(self.server_create_response(protocol.CODE_KERNEL_STATE, STATE_EXPIRED))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def execute_cell(self, run: Run, kernel: KernelSession, code: str) -> int:
+        """
+        Run a cell in a kernel and stream its I/O (see run_cell).
+
+        Returns:
+            int: Status of the cell
+        """
+        run.kernel = kernel
+        run.attach(kernel.process)
+
+        output_task = asyncio.create_task(self.pump_output(run))
+        cell_task = asyncio.create_task(self.monitor_cell(run))
+        try:
+            await kernel.run(code)
+            try:
+                status = await asyncio.wait_for(asyncio.shield(cell_task), timeout=EXECUTION_TIMEOUT + 1)
+            except asyncio.TimeoutError:
+                self.logger.log_connection_event(Level.LEVEL_ERROR, Event.EXECUTION_TIMEOUT)
+                status = await self.stop_cell(kernel, cell_task)
+        finally:
+            cell_task.cancel()
+            # Not while a frame is being sent, its output would be lost
+            async with run.output_lock:
+                output_task.cancel()
+                try:
+                    await output_task
+                except asyncio.CancelledError:
+                    pass
+            run.input_pending = False
+
+        if status is None:
+            status = await kernel.process.wait()  # The kernel exited
+
+        await self.flush_output(run, final=True, extra=run.output_budget.take_tail(final=True))
+        self.record_output_stats(run)
+        return status
+
+    async def monitor_cell(self, run: Run) -> int | None:
+        """
+        Read the kernel's side channel until the running cell finishes,
+        asking the client for input whenever the cell blocks on it.
+
+        Returns:
+            int | None: Status of the cell, None if the kernel exited
+        """
+        while True:
+            line = await run.process.stderr.readline()
+            if not line:
+                return None
+
+            event = supervisor.parse_event(line)
+            if event is None:
+                await self.flush_output(run, extra=line.decode('utf-8', errors='replace'))
+                continue
+
+            # Make sure the output preceding the event is read first
+            async with run.output_progress:
+                await run.output_progress.wait_for(
+                    lambda: run.output_eof or run.output_offset >= event.get('offset', 0)
+                )
+
+            if event['event'] == supervisor.EVENT_DONE:
+                return event.get('status', 1)
+
+            if event['event'] == supervisor.EVENT_INPUT:
+                await self.request_input(run)
+
+    async def stop_cell(self, kernel: KernelSession, cell_task: asyncio.Task) -> int:
+        """
+        Interrupt a cell that reached the execution timeout, restarting the
+        kernel if it doesn't stop in time.
+
+        Returns:
+            int: TIMEOUT_STATUS
+        """
+        await kernel.interrupt()
+        try:
+            await asyncio.wait_for(asyncio.shield(cell_task), timeout=INTERRUPT_GRACE)
+        except asyncio.TimeoutError:
+            if kernel is self.kernel:
+                state = await self.restart_kernel()
+                await self.send(self.server_create_response(protocol.CODE_KERNEL_STATE, state))
+        return TIMEOUT_STATUS
 
-            # Start monitoring input and streaming output concurrently
+    def result_key(self, command: list, files: dict = None) -> str | None:
+        """
+        Compute the result cache key of an execution.
+
+        Args:
+            command (list): Command executed inside the container
+            files (dict): Project snapshot (path -> content digest) copied into the sandbox
+
+        Returns:
+            str | None: The key, None if the result must not be cached
+        """
+        image_id = self.server.sandbox_pool.image_id
+        if not self.server.result_cache.enabled or image_id is None:
+            return None
+
+        return result_key(
+            image=image_id,
+            limits=SANDBOX_LIMITS,  # Results of runs above these aren't cached (see sandbox/limits.py)
+            timeout=EXECUTION_TIMEOUT,
+            command=command,
+            files=files or {}
+        )
+
+    async def execute_in_sandbox(self, run: Run, command: list, prepare=None, cache_key: str = None,
+                                 env: dict = None, finish=None) -> int:
+        """
+        Run a command inside a pooled sandbox container and stream its I/O.
+
+        If the result of an identical execution is cached, its output is
+        replayed instead of starting a container.
+
+        Args:
+            run (Run): The run
+            command (list): Command to execute inside the container
+            prepare (coroutine function): Optional setup run on the sandbox before execution
+            cache_key (str): Result cache key (see result_key), None to bypass the cache
+            env (dict): Environment variables of the command
+            finish (coroutine function): Optional step run on the sandbox after execution
+
+        Returns:
+            int: Process return code
+        """
+        if cache_key:
+            cached = self.server.result_cache.get(cache_key)
+            if cached is not None:
+                for frame in cached.frames:
+                    await self.send_output(run, frame)
+                return cached.returncode
+
+        # Wait for the scheduler to admit the execution
+        ticket = await self.server.scheduler.acquire(
+            self.user_key(), on_position=functools.partial(self.send_queue_position, run)
+        )
+        try:
+            returncode = await self.execute_admitted(run, command, prepare, env, finish)
+        finally:
+            self.server.scheduler.release(ticket)
+
+        # Only runs that ended on their own without reading input are deterministic, and keys assume the base limits
+        frames, run.recorded_frames = run.recorded_frames, None
+        raised = self.server.sandbox_limits.raised((run.usage or {}).get("limits"))
+        if (cache_key and frames is not None and not run.input_consumed and not raised and returncode is not None
+                and returncode < 124):
+            self.server.result_cache.put(cache_key, frames, returncode)
+
+        return returncode
+
+    async def execute_admitted(self, run: Run, command: list, prepare=None, env: dict = None, finish=None) -> int:
+        """
+        Run an execution admitted by the scheduler (see execute_in_sandbox).
+
+        A cancelled run (or one whose client disconnected) has its sandbox
+        torn down right away, without collecting its usage.
+
+        Args:
+            run (Run): The run
+            command (list): Command to execute inside the container
+            prepare (coroutine function): Optional setup run on the sandbox before execution
+            env (dict): Environment variables of the command
+            finish (coroutine function): Optional step run on the sandbox after execution
+
+        Returns:
+            int: Process return code
+        """
+        sandbox = await self.server.sandbox_pool.acquire(lease=EXECUTION_TIMEOUT + SANDBOX_LEASE_MARGIN)
+        if sandbox is None:
+            return 2  # Execution environment failed
+
+        run.sandbox = sandbox
+
+        async def run_process():
+            # Sandbox is dirty from here on, it must not be reused
+            sandbox.used = True
+            await self.server.sandbox_limits.admit(sandbox)
+            if prepare:
+                await prepare(sandbox)
+
+            # Start the script inside the container with pipes for I/O
+            # (stderr carries the launcher's event side channel)
+            run.started = time.monotonic()
+            process = await self.server.sandbox_backend.exec(sandbox.name, command, env=env)
+            run.attach(process, record=True)
+
+            # Start monitoring sandbox events and streaming output concurrently
             await asyncio.gather(
-                self.monitor_input(),
-                self.stream_output()
+                self.monitor_events(run),
+                self.stream_output(run)
             )
 
             await process.wait()
             return process.returncode
 
-        self.container_running = True
+        run.started = None
+        aborted = False
 
         try:
             # Run the process with a timeout (plus 1 second buffer)
@@ -602,162 +1660,248 @@ class ClientHandler:
         except asyncio.TimeoutError:
             # Log timeout error and cleanup
             self.logger.log_connection_event(Level.LEVEL_ERROR, Event.EXECUTION_TIMEOUT)
-            self.process.kill()
-            await self.process.wait()
+            run.recorded_frames = None
+            if run.process is not None:
+                try:
+                    run.process.kill()
+                except:
+                    pass
+                await run.process.wait()
+            else:
+                # Timed out preparing the sandbox (before the command started), its state is unknown
+                aborted = True
+                await self.server.sandbox_pool.destroy(sandbox)
             return 3
-        except websockets.exceptions.ConnectionClosedOK:
-            try:
-                await self.close_container()
-                self.process.kill()
-            except:
-                pass
+        except websockets.exceptions.ConnectionClosed:
+            aborted = True
+            await self.server.sandbox_pool.destroy(sandbox)
             return
+        except asyncio.CancelledError:
+            aborted = True
+            await self.server.sandbox_pool.destroy(sandbox)
+            raise
+        finally:
+            run.sandbox = None
+            limits = self.server.sandbox_limits.release(sandbox)
+            if not aborted and run.started is not None:
+                await self.collect_run_usage(run, sandbox)
+                if limits is not None:
+                    run.usage = {**(run.usage or {}), "limits": limits}
+                if finish:
+                    await finish(sandbox)
+            await self.server.sandbox_pool.release(sandbox)
+            self.record_output_stats(run)
 
         return returncode
 
-    async def get_python_pid(self, container_name: str, code_path: str = 'script.py') -> int:
+    def record_output_stats(self, run: Run):
+        """Log the output frame statistics of the finished run and add them to the server's."""
+        if run.output is None:
+            return
+
+        run_stats = run.output.stats()
+        self.server.output_stats.record(run.output, run.output_budget, run.client_pauses)
+        self.logger.log_connection_event(
+            Level.LEVEL_INFO, Event.RUN_OUTPUT,
+            message=f"frames={run_stats['frames']} avg={run_stats['bytes_per_frame']}B"
+        )
+        run.output = None
+
+    async def collect_run_usage(self, run: Run, sandbox: Sandbox):
         """
-        Use `docker exec` to retrieve the PID of the Python process inside the running container.
+        Read the resource usage of the finished run from its sandbox's cgroup,
+        log it and add it to the server's statistics. It is sent to the client
+        along with the run's return code.
         """
-        # Use `docker exec` to run `pgrep` to get Python execution process id
-        command = f"docker exec {container_name} pgrep -f {code_path}"
-        
-        async def run_pgrep():
-            process = await asyncio.create_subprocess_shell(
-                command,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+        usage_stats = self.server.usage_stats
+        if not usage_stats.enabled:
+            return
+
+        wall_time = time.monotonic() - run.started
+        run.usage = await read_usage(self.server.sandbox_backend, sandbox.name, wall_time)
+        usage_stats.record(run.usage)
+
+        if run.usage is not None:
+            cpu_ms = run.usage['cpu_user_ms'] + run.usage['cpu_system_ms']
+            self.logger.log_connection_event(
+                Level.LEVEL_INFO, Event.RUN_USAGE,
+                message=f"wall={run.usage['wall_ms']}ms cpu={cpu_ms}ms"
             )
 
-            # Read the output from the command
-            pid = await process.stdout.readline()
-            await process.wait()
+    def user_key(self) -> str:
+        """
+        Returns:
+            str: Key identifying the user for fair scheduling (email, or the
+                 connection address for users who are not logged in)
+        """
+        return self.email or f"{self.client_ip}:{self.client_port}"
 
-            return pid
-        
+    async def send_queue_position(self, run: Run, position: int):
+        """
+        Inform the client about the position of a run in the execution queue.
 
-        while self.is_process_running():
-            pid = await run_pgrep()
-            pid_str = pid.strip().decode('utf-8')  # decode bytes to string
-            if pid_str:
-                try:
-                    return int(pid_str)  # Convert the PID string to an integer
-                except ValueError:
-                    self.logger.log_connection_event(Level.LEVEL_ERROR, Event.GENERAL_SERVER_ERROR, message="Failed to fetch pid.")
-                    return None
+        Args:
+            run (Run): The run
+            position (int): Position in the queue, 0 once the execution starts
+        """
+        await self.send(self.server_create_response(protocol.CODE_QUEUED, (run.id, position)))
 
-    async def stream_output(self):
+    async def stream_output(self, run: Run):
         """
         Streams process output from Docker container to WebSocket client.
         
-        Reads stdout in 1024-byte chunks, base64-encodes the data, and sends
-        it to the client until EOF is reached. Performs cleanup on completion.
+        Output is decoded incrementally and coalesced into frames: pending
+        output is sent once the flush interval passes or enough of it piles
+        up, so a chatty program produces a few large frames instead of many
+        tiny ones. Performs cleanup on completion.
         """
+        await self.pump_output(run)
+        
+        # Send the remaining output, and a truncation summary if the budget was exceeded
+        await self.flush_output(run, final=True, extra=run.output_budget.take_tail(final=True))
+
+        await run.process.wait()
+
+        async with run.output_progress:
+            run.output_eof = True
+            run.output_progress.notify_all()
+
+    async def pump_output(self, run: Run):
+        """Read the process's output into the coalescer until EOF, sending frames as they are due."""
         while True:
-            # Read chunk from stdout
-            chunk = await self.process.stdout.read(1024)
+            # Don't read more output while the client can't keep up
+            await self.wait_for_client_drain(run)
+
+            # Read output, but no longer than until pending output is due
+            try:
+                chunk = await asyncio.wait_for(run.process.stdout.read(READ_SIZE), timeout=run.output.time_left())
+            except asyncio.TimeoutError:
+                await self.flush_output(run)
+                continue
+
             if not chunk:
                 break  # EOF reached
-            
-            # Encode in base64 format
-            encoded_line = base64_encode(chunk.decode()).decode('utf-8')
 
-            # Send to client
-            await self.send(self.server_create_response(protocol.CODE_RUN_SCRIPT, (False, encoded_line)))
-        
-        await self.process.wait()
-        self.container_running = False
+            # Past the output budget only the most recent output is kept
+            if run.output_budget.admit(len(chunk)):
+                run.output.feed(chunk)
+                if run.output.full():
+                    await self.flush_output(run)
+            else:
+                run.output_budget.retain(chunk)
 
-    async def is_proc_asleep(self):
+            # Let input requests waiting for this output go ahead
+            async with run.output_progress:
+                run.output_offset += len(chunk)
+                run.output_progress.notify_all()
+
+    async def flush_output(self, run: Run, final=False, extra=''):
         """
-        Continuously polls the process state using `ps` command to detect when
-        the process enters sleep state ('S'), indicating it's waiting for stdin.
+        Send the pending program output of a run to the client as a single frame.
+
+        Args:
+            run (Run): The run
+            final (bool): Whether the output ended (flushes the decoder)
+            extra (str): Text to append to the frame
         """
-        # Command to run in shell
-        command = f"docker exec {self.container_name} ps -o state= -p {self.pid}"
+        async with run.output_lock:
+            text = run.output.finish() if final else run.output.take()
+            text += extra
+            if text:
+                await self.send_output(run, text)
 
-            
-        # Run command
-        process = await asyncio.create_subprocess_shell(
-            command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+    async def wait_for_client_drain(self, run: Run):
+        """
+        Pause while the client's websocket send buffer is backed up, so a
+        program flooding output is throttled instead of piling up in memory.
+        """
+        transport = getattr(self.websocket, 'transport', None)
+        if transport is None or transport.get_write_buffer_size() <= CLIENT_SEND_BUFFER_LIMIT:
+            return
 
-        # Read command execution output
-        res = await process.stdout.read()
-        return res.decode().strip() == 'S'
+        run.client_pauses += 1
+        while transport.get_write_buffer_size() > CLIENT_SEND_BUFFER_LIMIT and not transport.is_closing():
+            await asyncio.sleep(CLIENT_DRAIN_INTERVAL)
 
-    async def monitor_input(self):
+    async def send_output(self, run: Run, text: str):
         """
-        Monitors the running container process for input blocking state
-        and Triggers input streaming when blocking is detected.
+        Send program output of a run to the client.
 
-        Runs until container execution completes.
+        Args:
+            run (Run): The run
+            text (str): Output text
         """
+        if run.recorded_frames is not None:
+            run.recorded_frames.append(text)
 
-        while self.container_running:
-            if await self.is_proc_asleep():
-                await self.stream_input()
+        # Encode in base64 format
+        encoded_output = base64_encode(text).decode('utf-8')
 
-    async def stream_input(self):
-        """
-        Handles user input streaming to the blocked container process.
-        
-        Notifies the client that input is required, receives input from WebSocket,
-        and forwards it to the container's stdin via process file descriptor.
-        Ensures proper newline termination for input processing.
+        # Send to client
+        await self.send(self.server_create_response(protocol.CODE_RUN_SCRIPT, (False, (run.id, encoded_output))))
+
+    async def monitor_events(self, run: Run):
         """
+        Reads sandbox events sent by the in-container launcher over the
+        side channel (container stderr) and asks the client for input when
+        the program blocks on stdin.
 
+        Runs until container execution completes.
+        """
         while True:
-            try:
-                # Inform client that input is required
-                await self.send(self.server_create_response(protocol.CODE_BLOCKED_INPUT, None))
-
-                # Get input entered by user
-                input = await self.handle_request(await asyncio.wait_for(self.recv(), timeout=1))
-                if input:
-                    break
-            except asyncio.TimeoutError:
-                res = await self.is_proc_asleep()
-                if not res:
-                    return
-
-        # Command to write to process's stdin in the container
-        command = [
-            "docker", "exec", "-i", self.container_name,
-            "bash", "-c", f"cat > /proc/{self.pid}/fd/0"
-        ]
-
-        # Run command
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+            line = await run.process.stderr.readline()
+            if not line:
+                break  # Launcher exited
+
+            event = supervisor.parse_event(line)
+            if event is None:
+                # Not an event (e.g. launcher or docker error), show it to the user
+                await self.flush_output(run, extra=line.decode('utf-8', errors='replace'))
+                continue
+
+            if event['event'] == supervisor.EVENT_INPUT:
+                # Make sure the output preceding the input request (the prompt) is sent first
+                async with run.output_progress:
+                    await run.output_progress.wait_for(
+                        lambda: run.output_eof or run.output_offset >= event.get('offset', 0)
+                    )
+                await self.request_input(run)
+
+    async def request_input(self, run: Run):
+        """
+        Inform the client that a run's program blocks on input, after sending
+        the output preceding it. The input arrives through the handler loop
+        (see deliver_input). Buffered input is fed right away instead.
+        """
+        run.input_consumed = True
+        if not run.input_buffered:
+            await self.flush_output(run, extra=run.output_budget.take_tail())
+        # Buffered input (possibly typed ahead while the output was sent) is fed without asking the client
+        if run.input_buffered:
+            await self.feed_input(run, run.take_input())
+            return
 
-        # Make sure input ends with new-line
-        if not input.endswith('\n'):
-            input += '\n'
+        run.input_pending = True
+        await self.send(self.server_create_response(protocol.CODE_BLOCKED_INPUT, run.id))
 
-        # Send the input string
-        await process.communicate(input.encode())
+    async def write_input(self, run: Run, input: str | None):
+        """
+        Write input to a run's process stdin.
 
-    def is_process_running(self):
-        return self.process.returncode is None
-    
-    async def close_container(self):
-        # Command to 'kill' active container
-        command = ["docker", "kill", self.container_name]
-
-        # Run command
-        await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.DEVNULL,  # Avoid stdout/stderr printed to console
-            stderr=asyncio.subprocess.DEVNULL
-        )
+        Args:
+            run (Run): The run
+            input (str | None): Text to write, None to close stdin (EOF)
+        """
+        stdin = run.process.stdin
+        try:
+            if input is None:
+                stdin.close()
+                return
+
+            stdin.write(input.encode())
+            await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Process exited before reading its input
 
 
 async def register_user(email: str, password: str, db_conn: DatabaseSocketClient) -> bool:
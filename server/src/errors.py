@@ -39,4 +39,10 @@ class FolderAlreadyExists(CustomError):
 class InvalidEntry(CustomError):
     """Raised when encountering invalid entries in JSON/dictionary data structures."""
     def __init__(self, entry, value):
-        super().__init__(f"Invalid Json/dictionary entry encountered - {entry}: {value}")
\ No newline at end of file
+        super().__init__(f"Invalid Json/dictionary entry encountered - {entry}: {value}")
+
+class DockerAPIError(CustomError):
+    """Raised when the Docker daemon responds to an Engine API request with an error."""
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
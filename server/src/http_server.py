@@ -4,11 +4,39 @@ HTTPS server implementation for serving the web editor interface.
 This module provides a secure HTTPS server using aiohttp that serves:
 - A web-based editor interface at the root path
 - Static files from the editor directory
+- Runtime statistics of the execution server (JSON) at /stats
+
+Statistics:
+    /stats exposes the server's internals (sandbox pool, scheduler queue,
+    per-user counts, caches, host headroom), so it isn't public like the
+    editor. Requests must present STATS_TOKEN as a bearer token
+    ("Authorization: Bearer <token>"), and without a token configured only
+    requests from the loopback interface are served. Others get 403.
+
+Environment Variables:
+    STATS_TOKEN: Secret /stats requests must present (default: none, only served on the loopback interface)
 """
+import hmac
+import ipaddress
 import os
 from aiohttp import web
+from dotenv import load_dotenv
+
 
-async def start_http_server(host_ip: str, port: int, ssl_context) -> None:
+def stats_allowed(request, token: str) -> bool:
+    """
+    Returns:
+        bool: Whether a /stats request presents the token, or comes from
+              the loopback interface if no token is configured
+    """
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    try:
+        return ipaddress.ip_address(request.remote or '').is_loopback
+    except ValueError:
+        return False
+
+async def start_http_server(host_ip: str, port: int, ssl_context, stats_provider=None) -> None:
     """
     Initialize and start the HTTPS server.
 
@@ -16,6 +44,7 @@ async def start_http_server(host_ip: str, port: int, ssl_context) -> None:
         host_ip: IP address to bind the server to
         port: Port number to listen on
         ssl_context: SSL context for HTTPS encryption
+        stats_provider: Optional callable returning a statistics dict
 
     The server serves the editor's index.html at root path and
     static files from the editor directory.
@@ -29,6 +58,19 @@ async def start_http_server(host_ip: str, port: int, ssl_context) -> None:
 
     app.router.add_get('/', index_handler)
 
+    # Serve runtime statistics (registered before the static catch-all route)
+    if stats_provider is not None:
+        load_dotenv()
+        stats_token = os.getenv("STATS_TOKEN", "")
+
+        async def stats_handler(request):
+            """Serve the server's runtime statistics as JSON (see Statistics in the module docstring)."""
+            if not stats_allowed(request, stats_token):
+                raise web.HTTPForbidden()
+            return web.json_response(stats_provider())
+
+        app.router.add_get('/stats', stats_handler)
+
     # Serve static files
     app.router.add_static('/', path='../../editor', show_index=False)
 
@@ -7,12 +7,49 @@ the client and server components. It includes:
 Client to Server codes:
     - Authentication: Registration and login
     - File operations: Create, read, save, delete, download
-    - Execution: Run scripts and handle input
+    - Execution: Run scripts (optionally profiled), run test case batches and project test suites,
+      handle input and cancel runs
+    - Kernel: Run code cells in a persistent interpreter, interrupt, restart, shut down
 
 Server to Client codes:
     - Operation responses and confirmations
     - Error notifications with specific error codes
 
+Runs:
+    Every execution request (EXEC, RUNF, RUNP, RUNT, TEST, KRUN) starts a run, and
+    a session may hold several runs at once. The server answers with the
+    run's ID (RNID~<run ID>), which leads the fields of the run's messages:
+        QUEU~<run ID>~<position>, OUTP~<run ID>~<output>, INPT~<run ID>,
+        DONE~<run ID>~<return code>[~<usage>], PROF~<run ID>~<profile>,
+        TSTR~<run ID>~<results>, TRES~<run ID>~<test result>, TSUM~<run ID>~<summary>
+    Input is sent as INPR~<run ID>~<input> / INPE~<run ID>, and CNCL~<run ID>
+    cancels a run, which then ends with DONE and return code 4.
+
+Input:
+    EXEC, RUNF, RUNP and KRUN take the run's input up front as an optional
+    last field (e.g. EXEC~<code>~<input>), and input sent before the program
+    asks for it (type-ahead) is buffered by the server. The program reads the
+    buffered input as it needs it, and INPT is only sent once the buffer runs
+    dry (unless INPE ended the input ahead of time). At most 1Mi characters of input
+    is buffered per run: up front input past it refuses the request with
+    ERRR~208 (no run is started), typed-ahead input past it is refused as a
+    whole with ERRR~208~<run ID> and can be sent again once the program read
+    the buffered input.
+
+Limits:
+    Runs get more CPU and memory than the base limits while the server's
+    host has headroom (see sandbox/limits.py). The usage of a run (DONE,
+    also ending kernel cells: DONE~<run ID>~<status>[~<usage>]) includes
+    the limits it ran with ("limits"), as do RUNT results and TSUM
+    summaries for each of their sandboxes.
+
+Test suites:
+    TEST runs the pytest / unittest tests of the user's storage, sharded
+    across sandboxes. Every test's result is sent as it finishes
+    (TRES, JSON {"id", "outcome", "duration_ms", "message"}), followed by
+    a summary (TSUM, JSON with counts per outcome, or {"error"} if the
+    tests couldn't be discovered).
+
 Error codes are three-digit numbers categorized by their first digit:
     - 0xx: General errors
     - 1xx: Authentication errors
@@ -28,17 +65,33 @@ CODE_STORAGE_ADD = 'CREA'
 CODE_GET_FILE = 'GETF'
 CODE_SAVE_FILE = 'SAVF'
 CODE_RUN_FILE = 'RUNF'
+CODE_RUN_TESTS = 'RUNT'
+CODE_RUN_PROFILE = 'RUNP'
+CODE_RUN_TEST_SUITE = 'TEST'
 CODE_INPUT = 'INPR'
+CODE_INPUT_EOF = 'INPE'
+CODE_CANCEL_RUN = 'CNCL'
 CODE_DELETE_FILE = 'DELF'
 CODE_DOWNLOAD_FILE = 'DNLD'
 CODE_LOGOUT = 'OUTT'
+CODE_KERNEL_RUN = 'KRUN'
+CODE_KERNEL_INTERRUPT = 'KINT'
+CODE_KERNEL_RESTART = 'KRST'
+CODE_KERNEL_SHUTDOWN = 'KEND'
 
 ### Server --> Client ###
 CODE_REGISTER_SUCCESS = 'REGR'
 CODE_LOGIN_SUCCESS = 'LOGR'
+CODE_RUN_ID = 'RNID'
 CODE_OUTPUT = 'OUTP'
 CODE_BLOCKED_INPUT = 'INPT'
 CODE_RUN_END = 'DONE'
+CODE_QUEUED = 'QUEU'
+CODE_TEST_RESULTS = 'TSTR'
+CODE_TEST_RESULT = 'TRES'
+CODE_TEST_SUMMARY = 'TSUM'
+CODE_PROFILE = 'PROF'
+CODE_KERNEL_STATE = 'KSTA'
 CODE_STORAGE_UPDATED = 'CRER'
 CODE_FILE_CONTENT = 'FILC'
 CODE_FILE_SAVED = 'SAVR'
@@ -54,6 +107,11 @@ CODE_ERROR = 'ERRR'
 201: File Was not found in the system
 202: Execution Failed
 203: Execution exeeded max run time
+204: Invalid test case batch (no cases or too many)
+205: Kernel unavailable (disabled, too many kernels or busy running a cell)
+206: Run was not found (cancelling a run that already ended)
+207: Too many concurrent runs in the session
+208: Input refused, the run's input buffer is full
 301: Failed to create file or folder
 302: Failed to delete file
 '''
@@ -62,6 +120,11 @@ ERROR_LOGIN_FAILED = '101'
 ERROR_USER_EXIST = '102'
 ERROR_FILE_NOT_FOUND = '201'
 ERROR_EXECUTION_TIMEOUT = '202'
+ERROR_INVALID_TEST_CASES = '204'
+ERROR_KERNEL_UNAVAILABLE = '205'
+ERROR_RUN_NOT_FOUND = '206'
+ERROR_TOO_MANY_RUNS = '207'
+ERROR_INPUT_REFUSED = '208'
 ERROR_STORAGE_CREATE = '301'
 ERROR_FILE_DELETE = '302'
 
@@ -0,0 +1,235 @@
+"""
+Per-run resource accounting from the sandbox container's cgroup.
+
+Sandboxes are never reused, so the cgroup of a sandbox container accounts
+for a single run (plus the idle `sleep` process keeping it alive). Once
+the program exits, its counters are read from inside the container, which
+sees its own cgroup at /sys/fs/cgroup. Both cgroup v2 and v1 hierarchies
+are supported.
+
+Run Usage:
+    wall_ms: Time from starting the program until it exited
+    cpu_user_ms / cpu_system_ms: CPU time
+    memory_peak_bytes / memory_limit_bytes: Peak memory usage and its limit
+    pids_peak / pids_limit: Max number of processes and threads and its limit
+    cpu_periods / cpu_throttled_periods / cpu_throttled_ms: CFS quota throttling
+    oom_kills: Processes killed for exceeding the memory limit
+    limits_hit: Limits the run ran into ("cpu", "memory", "pids")
+
+Environment Variables:
+    RUN_ACCOUNTING_ENABLED: "true"/"false" - Collect resource usage of runs (default: true)
+"""
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+import errors
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+READ_TIMEOUT = 2  # Seconds
+
+CGROUP_FILES = [
+    # cgroup v2
+    'cpu.stat', 'memory.peak', 'memory.current', 'memory.max', 'memory.events',
+    'pids.peak', 'pids.current', 'pids.max', 'pids.events',
+    # cgroup v1
+    'cpuacct/cpuacct.stat', 'cpu/cpu.stat', 'memory/memory.max_usage_in_bytes',
+    'memory/memory.limit_in_bytes', 'memory/memory.oom_control', 'memory/memory.failcnt',
+    'pids/pids.current', 'pids/pids.max', 'pids/pids.events',
+]
+
+# Prints every readable file as "@ <name>" followed by its content
+READ_COMMAND = [
+    "sh", "-c",
+    f"cd {CGROUP_ROOT} && for f in {' '.join(CGROUP_FILES)}; do "
+    "if [ -r $f ]; then echo \"@ $f\"; cat $f; fi; done"
+]
+
+USER_HZ = 100  # Unit of cpuacct.stat
+
+
+def split_sections(output: str) -> dict:
+    """
+    Returns:
+        dict: Maps cgroup file name -> content, from the output of READ_COMMAND
+    """
+    sections = {}
+    name = None
+    for line in output.splitlines():
+        if line.startswith('@ '):
+            name = line[2:]
+            sections[name] = ''
+        elif name is not None:
+            sections[name] += line + '\n'
+    return sections
+
+
+def _keyed(content: str | None) -> dict:
+    """Parse a flat keyed cgroup file ("<key> <value>" per line)."""
+    values = {}
+    for line in (content or '').splitlines():
+        key, _, value = line.partition(' ')
+        if value.strip().isdigit():
+            values[key] = int(value)
+    return values
+
+
+def _number(content: str | None) -> int | None:
+    """Parse a single value cgroup file ("max" meaning unlimited)."""
+    value = (content or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def parse_usage(sections: dict) -> dict:
+    """
+    Normalize cgroup v2 / v1 counters into the run usage fields (see module docstring).
+
+    Args:
+        sections (dict): Maps cgroup file name -> content
+
+    Returns:
+        dict: Run usage, without wall_ms
+    """
+    if 'cpu.stat' in sections:
+        # cgroup v2
+        cpu = _keyed(sections['cpu.stat'])
+        memory_events = _keyed(sections.get('memory.events'))
+        usage = {
+            "cpu_user_ms": cpu.get('user_usec', 0) // 1000,
+            "cpu_system_ms": cpu.get('system_usec', 0) // 1000,
+            "memory_peak_bytes": _number(sections.get('memory.peak')) or _number(sections.get('memory.current')),
+            "memory_limit_bytes": _number(sections.get('memory.max')),
+            "pids_peak": _number(sections.get('pids.peak')) or _number(sections.get('pids.current')),
+            "pids_limit": _number(sections.get('pids.max')),
+            "cpu_periods": cpu.get('nr_periods', 0),
+            "cpu_throttled_periods": cpu.get('nr_throttled', 0),
+            "cpu_throttled_ms": cpu.get('throttled_usec', 0) // 1000,
+            "oom_kills": memory_events.get('oom_kill', 0),
+        }
+        memory_limit_hits = memory_events.get('max', 0)
+    else:
+        # cgroup v1
+        cpuacct = _keyed(sections.get('cpuacct/cpuacct.stat'))
+        cpu = _keyed(sections.get('cpu/cpu.stat'))
+        usage = {
+            "cpu_user_ms": cpuacct.get('user', 0) * 1000 // USER_HZ,
+            "cpu_system_ms": cpuacct.get('system', 0) * 1000 // USER_HZ,
+            "memory_peak_bytes": _number(sections.get('memory/memory.max_usage_in_bytes')),
+            "memory_limit_bytes": _number(sections.get('memory/memory.limit_in_bytes')),
+            "pids_peak": _number(sections.get('pids/pids.current')),
+            "pids_limit": _number(sections.get('pids/pids.max')),
+            "cpu_periods": cpu.get('nr_periods', 0),
+            "cpu_throttled_periods": cpu.get('nr_throttled', 0),
+            "cpu_throttled_ms": cpu.get('throttled_time', 0) // 1_000_000,
+            "oom_kills": _keyed(sections.get('memory/memory.oom_control')).get('oom_kill', 0),
+        }
+        memory_limit_hits = _number(sections.get('memory/memory.failcnt')) or 0
+
+    pids_limit_hits = _keyed(sections.get('pids.events') or sections.get('pids/pids.events')).get('max', 0)
+
+    limits_hit = []
+    if usage['cpu_throttled_periods']:
+        limits_hit.append('cpu')
+    if usage['oom_kills'] or memory_limit_hits:
+        limits_hit.append('memory')
+    if pids_limit_hits:
+        limits_hit.append('pids')
+    usage['limits_hit'] = limits_hit
+
+    return usage
+
+
+async def read_usage(backend, name: str, wall_time: float) -> dict | None:
+    """
+    Read the resource usage of the run of a sandbox container.
+
+    Args:
+        backend (SandboxBackend): Backend managing the sandbox
+        name (str): Container name
+        wall_time (float): Seconds the program ran
+
+    Returns:
+        dict | None: Run usage (see module docstring), None if it could not be read
+    """
+    async def read():
+        process = await backend.exec(name, READ_COMMAND)
+        output = await process.stdout.read()
+        await process.wait()
+        return output
+
+    try:
+        output = await asyncio.wait_for(read(), timeout=READ_TIMEOUT)
+    except (asyncio.TimeoutError, OSError, errors.DockerAPIError):
+        return None
+
+    sections = split_sections(output.decode(errors='replace'))
+    if not sections:
+        return None
+
+    return {"wall_ms": round(wall_time * 1000), **parse_usage(sections)}
+
+
+class UsageStats:
+    """
+    Aggregated resource usage across runs, for capacity planning.
+
+    Attributes:
+        enabled (bool): Whether the usage of runs is collected
+    """
+
+    def __init__(self, enabled: bool = None):
+        load_dotenv()
+        self.enabled = enabled if enabled is not None else os.getenv("RUN_ACCOUNTING_ENABLED", "true").lower() == "true"
+
+        self.runs = 0
+        self.wall_ms = 0
+        self.cpu_ms = 0
+        self.max_wall_ms = 0
+        self.max_cpu_ms = 0
+        self.max_memory_bytes = 0
+        self.memory_bytes = 0
+        self.limits_hit = {"cpu": 0, "memory": 0, "pids": 0}
+        self.oom_kills = 0
+        self.unavailable = 0
+
+    def record(self, usage: dict | None):
+        """Add the usage of a finished run (None if it could not be read)."""
+        if usage is None:
+            self.unavailable += 1
+            return
+
+        cpu_ms = usage['cpu_user_ms'] + usage['cpu_system_ms']
+        memory = usage['memory_peak_bytes'] or 0
+
+        self.runs += 1
+        self.wall_ms += usage['wall_ms']
+        self.cpu_ms += cpu_ms
+        self.memory_bytes += memory
+        self.max_wall_ms = max(self.max_wall_ms, usage['wall_ms'])
+        self.max_cpu_ms = max(self.max_cpu_ms, cpu_ms)
+        self.max_memory_bytes = max(self.max_memory_bytes, memory)
+        self.oom_kills += usage['oom_kills']
+        for limit in usage['limits_hit']:
+            self.limits_hit[limit] += 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Mean / max usage per run and how many runs hit each limit
+        """
+        runs = self.runs or 1
+        return {
+            "enabled": self.enabled,
+            "runs": self.runs,
+            "unavailable": self.unavailable,
+            "wall_ms_avg": round(self.wall_ms / runs, 1),
+            "wall_ms_max": self.max_wall_ms,
+            "cpu_ms_avg": round(self.cpu_ms / runs, 1),
+            "cpu_ms_max": self.max_cpu_ms,
+            "memory_peak_bytes_avg": round(self.memory_bytes / runs),
+            "memory_peak_bytes_max": self.max_memory_bytes,
+            "oom_kills": self.oom_kills,
+            "runs_hitting_limit": dict(self.limits_hit),
+        }
@@ -0,0 +1,77 @@
+"""
+Tar archive helpers for copying files into and out of sandboxes.
+
+Both Docker drivers copy files into a sandbox by extracting a tar archive
+into one of its directories. Entries are owned by root and keep their
+permission bits, so they are readable (but not writable) by the sandbox user.
+"""
+
+import io
+import tarfile
+import time
+from pathlib import Path
+
+
+def _reset_owner(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    info.uid = info.gid = 0
+    info.uname = info.gname = 'root'
+    return info
+
+
+def directory_archive(folder: str) -> bytes:
+    """
+    Build a tar archive holding the contents of a host directory.
+
+    Args:
+        folder: Host directory to archive (its contents end up in the archive root)
+
+    Returns:
+        bytes: The tar archive
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for path in sorted(Path(folder).iterdir()):
+            tar.add(str(path), arcname=path.name, filter=_reset_owner)
+    return buffer.getvalue()
+
+
+def files_archive(files: dict) -> bytes:
+    """
+    Build a tar archive from in-memory files.
+
+    Args:
+        files: Maps archive path -> file content (bytes)
+
+    Returns:
+        bytes: The tar archive
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, content in files.items():
+            info = _reset_owner(tarfile.TarInfo(name))
+            info.size = len(content)
+            info.mode = 0o644
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def read_file(archive: bytes, max_bytes: int) -> bytes | None:
+    """
+    Read the file of an archive holding a single file (see SandboxBackend.copy_from).
+
+    Args:
+        archive: The tar archive (untrusted, read from a sandbox)
+        max_bytes: Files larger than this are rejected
+
+    Returns:
+        bytes | None: Content of the file, None if there is no regular file or it is too large
+    """
+    try:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            info = tar.next()
+            if info is None or not info.isreg() or info.size > max_bytes:
+                return None
+            return tar.extractfile(info).read()
+    except tarfile.TarError:
+        return None
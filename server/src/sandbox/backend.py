@@ -0,0 +1,154 @@
+"""
+Pluggable sandbox backends.
+
+Code execution only talks to a SandboxBackend, which provides isolated,
+resource-limited, network-less sandboxes with the python_runner layout
+(launcher and fork server in /opt/codebox, working directory
+/home/sandboxuser/app, bytecode cache directory). Backends:
+    - docker (docker_driver.py): Containers of the python_runner image, managed
+      through the Docker Engine API or CLI (DOCKER_DRIVER)
+    - namespace (namespace_backend.py): Linux namespaces and a pivoted root set up
+      with unshare / nsenter, no daemon and no image
+    - remote (remote_backend.py): Sandboxes on runner hosts (runner_server.py),
+      each running one of the backends above
+
+Interface:
+    start_sandbox(name, image, limits, command, labels, mounts): Start a sandbox running `command` as its
+        main process, with host directories mounted read-only
+    kill_sandbox(name): Kill a sandbox and everything running in it
+    update_limits(name, limits): Change the resource limits of a running sandbox
+        (only backends with live_limits set, see limits.py)
+    list_sandboxes(label): All sandboxes having a label (also those of other server instances)
+    exec(name, command, env): Start a command inside a sandbox, attached to its
+        stdin / stdout / stderr. Returns a process-like object compatible with
+        asyncio.subprocess.Process (stdin / stdout / stderr / wait / kill / returncode)
+    signal(name, signum): Signal every process of a sandbox except its main process
+    copy_into(name, dest, archive) / copy_from(name, path): Tar archives in and out
+    image_id(image): Identity of the sandbox environment (part of result cache keys)
+    close(): Release the backend's resources
+    stats(): Backend statistics
+
+Resource limits are given as a dict:
+    {"cpus": <float>, "memory": <bytes>, "pids": <int>}
+
+Environment Variables:
+    SANDBOX_BACKEND: "docker" / "namespace" / "remote" (default: docker)
+"""
+
+import os
+from abc import ABC, abstractmethod
+
+from dotenv import load_dotenv
+
+DEFAULT_BACKEND = 'docker'
+
+
+class SandboxBackend(ABC):
+    """Starts, runs commands in and destroys sandboxes."""
+
+    name = ''
+    live_limits = False  # Whether update_limits() changes the limits of running sandboxes
+
+    @abstractmethod
+    async def start_sandbox(self, name: str, image: str, limits: dict, command: list, labels: dict = None,
+                            mounts: dict = None) -> bool:
+        """
+        Start a sandbox.
+
+        Args:
+            name (str): Unique sandbox name
+            image (str): Sandbox image (backends without images ignore it)
+            limits (dict): Resource limits
+            command (list): Main process of the sandbox
+            labels (dict): Metadata attached to the sandbox (see list_sandboxes)
+            mounts (dict): Maps host directory -> sandbox path it is mounted at, read-only
+
+        Returns:
+            bool: Whether the sandbox was started
+        """
+
+    @abstractmethod
+    async def kill_sandbox(self, name: str):
+        """Kill a sandbox and remove it."""
+
+    @abstractmethod
+    async def list_sandboxes(self, label: str) -> dict | None:
+        """
+        Returns:
+            dict | None: Maps sandbox name -> value of the label, for every sandbox
+                         having the label, None if the sandboxes couldn't be listed
+        """
+
+    @abstractmethod
+    async def exec(self, name: str, command: list, env: dict = None):
+        """
+        Start a command inside a sandbox with pipes for stdin/stdout/stderr.
+
+        Returns:
+            Process-like handle of the command
+        """
+
+    @abstractmethod
+    async def copy_into(self, name: str, dest: str, archive: bytes):
+        """Extract a tar archive into a directory of the sandbox."""
+
+    @abstractmethod
+    async def copy_from(self, name: str, path: str) -> bytes | None:
+        """
+        Returns:
+            bytes | None: Tar archive of a path of the sandbox, None if it doesn't exist
+        """
+
+    @abstractmethod
+    async def image_id(self, image: str) -> str | None:
+        """
+        Returns:
+            str | None: Identity of the sandbox environment, None if it is unavailable
+        """
+
+    async def update_limits(self, name: str, limits: dict) -> bool:
+        """
+        Change the resource limits of a running sandbox.
+
+        Returns:
+            bool: Whether the limits were changed
+        """
+        return False
+
+    async def signal(self, name: str, signum: int):
+        """
+        Send a signal to every process of a sandbox except its main process.
+
+        The main process is PID 1 of the sandbox's PID namespace, which
+        `kill -1` skips (as well as the shell sending the signal).
+        """
+        process = await self.exec(name, ["sh", "-c", f"kill -{int(signum)} -1"])
+        await process.wait()
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+def create_backend() -> SandboxBackend:
+    """
+    Create the sandbox backend selected by the environment.
+
+    Returns:
+        SandboxBackend: The backend
+    """
+    # Imported here, the backends themselves import this module
+    from sandbox.docker_driver import create_driver
+    from sandbox.namespace_backend import NamespaceBackend
+    from sandbox.remote_backend import RemoteBackend
+
+    load_dotenv()
+    backend = os.getenv("SANDBOX_BACKEND", DEFAULT_BACKEND).lower()
+
+    if backend == 'namespace':
+        return NamespaceBackend()
+    if backend == 'remote':
+        return RemoteBackend()
+    return create_driver()
@@ -0,0 +1,191 @@
+"""
+Batch execution of a program against a list of test cases.
+
+Grading a submission means running it against many stdin / expected-output
+cases. Instead of a RUNF round-trip (and a fresh container) per case, the
+cases are split into a few shards, each shard runs its cases one after the
+other in a single sandbox with one exec per case, and all results
+are returned together.
+
+Cases of a shard share the sandbox's filesystem: files written by one case
+are visible to the next ones.
+
+Case Result:
+    stdout / stderr: Captured output (truncated past the output limit)
+    returncode: Exit code of the program (124 when the case timed out)
+    time_ms: Time from starting the program until it exited
+    timed_out: Whether the per-case timeout was reached
+    truncated: Whether the output was truncated
+    passed: Whether stdout matched the expected output (only if one was given)
+
+Environment Variables:
+    BATCH_MAX_CASES: Max number of cases of a single request (default: 100)
+    BATCH_MAX_SANDBOXES: Sandboxes the cases of a request are spread over (default: 2)
+    BATCH_CASE_TIMEOUT: Default per-case timeout in seconds (default: 10)
+    BATCH_MAX_CASE_OUTPUT: Output kept per case and stream, in bytes (default: 64 KiB)
+"""
+
+import asyncio
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+
+DEFAULT_MAX_CASES = 100
+DEFAULT_MAX_SANDBOXES = 2
+DEFAULT_CASE_TIMEOUT = 10
+DEFAULT_MAX_CASE_OUTPUT = 64 * 1024
+TIMEOUT_RETURNCODE = 124  # Exit code of `timeout` when the command timed out
+READ_SIZE = 65536
+
+
+class BatchConfig:
+    """
+    Limits of batch executions.
+
+    Attributes:
+        max_cases (int): Max number of cases of a single request
+        max_sandboxes (int): Sandboxes the cases of a request are spread over
+        case_timeout (float): Default per-case timeout in seconds
+        max_case_output (int): Output kept per case and stream, in bytes
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self.max_cases = int(os.getenv("BATCH_MAX_CASES", DEFAULT_MAX_CASES))
+        self.max_sandboxes = int(os.getenv("BATCH_MAX_SANDBOXES", DEFAULT_MAX_SANDBOXES))
+        self.case_timeout = float(os.getenv("BATCH_CASE_TIMEOUT", DEFAULT_CASE_TIMEOUT))
+        self.max_case_output = int(os.getenv("BATCH_MAX_CASE_OUTPUT", DEFAULT_MAX_CASE_OUTPUT))
+
+
+def parse_request(request, config: BatchConfig, max_timeout: float) -> tuple | None:
+    """
+    Validate a batch request (see ClientHandler.run_tests).
+
+    Returns:
+        tuple | None: (path, cases, per-case timeout in seconds capped at
+                      max_timeout), None if the request is invalid
+    """
+    if not isinstance(request, dict) or not isinstance(request.get("path"), str):
+        return None
+
+    cases = request.get("cases")
+    if not isinstance(cases, list) or not cases or len(cases) > config.max_cases:
+        return None
+    for case in cases:
+        if (not isinstance(case, dict) or not isinstance(case.get("input", ""), str)
+                or not isinstance(case.get("expected", ""), (str, type(None)))):
+            return None
+
+    try:
+        timeout = float(request.get("timeout") or config.case_timeout)
+    except (TypeError, ValueError):
+        return None
+    # nan would survive min() and make every case time out at once
+    if not math.isfinite(timeout) or timeout <= 0:
+        return None
+    return request["path"], cases, min(timeout, max_timeout)
+
+
+def shard_cases(count: int, shards: int) -> list:
+    """
+    Split case indices into contiguous shards of (almost) equal size.
+
+    Returns:
+        list: List of index lists, without empty shards
+    """
+    shards = max(1, min(shards, count))
+    size, extra = divmod(count, shards)
+    result, start = [], 0
+    for shard in range(shards):
+        end = start + size + (shard < extra)
+        result.append(list(range(start, end)))
+        start = end
+    return [shard for shard in result if shard]
+
+
+def output_matches(actual: str, expected: str) -> bool:
+    """Compare program output ignoring trailing whitespace on lines and at the end."""
+    def normalize(text: str) -> list:
+        return [line.rstrip() for line in text.rstrip().splitlines()]
+
+    return normalize(actual) == normalize(expected)
+
+
+async def read_capped(stream, limit: int) -> tuple:
+    """
+    Read a stream to its end, keeping at most `limit` bytes.
+
+    The rest is still read (and dropped) so the program never blocks on a full pipe.
+
+    Returns:
+        tuple: (kept bytes, whether output was dropped)
+    """
+    kept = bytearray()
+    truncated = False
+    while chunk := await stream.read(READ_SIZE):
+        room = limit - len(kept)
+        if len(chunk) > room:
+            truncated = True
+        kept += chunk[:max(room, 0)]
+    return bytes(kept), truncated
+
+
+async def run_case(backend, sandbox_name: str, command: list, stdin_data: str,
+                   timeout: float, max_output: int) -> dict:
+    """
+    Run a single case inside a sandbox.
+
+    Args:
+        backend (SandboxBackend): Backend managing the sandbox
+        sandbox_name (str): Sandbox to run the case in
+        command (list): Program command (run under `timeout`)
+        stdin_data (str): Input fed to the program (stdin is closed afterwards)
+        timeout (float): Per-case timeout in seconds
+        max_output (int): Output kept per stream, in bytes
+
+    Returns:
+        dict: Case result (see module docstring)
+    """
+    started = time.monotonic()
+    process = await backend.exec(sandbox_name, ["timeout", "-k", "1s", f"{timeout}s", *command])
+
+    async def feed_input():
+        try:
+            process.stdin.write(stdin_data.encode('utf-8'))
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Program exited without reading all of its input
+
+    async def collect():
+        _, (stdout, stdout_truncated), (stderr, stderr_truncated) = await asyncio.gather(
+            feed_input(),
+            read_capped(process.stdout, max_output),
+            read_capped(process.stderr, max_output)
+        )
+        await process.wait()
+        return stdout, stderr, stdout_truncated or stderr_truncated
+
+    try:
+        # `timeout` ends the program itself, this only guards against a stuck exec
+        stdout, stderr, truncated = await asyncio.wait_for(collect(), timeout=timeout + 2)
+        returncode = process.returncode
+    except asyncio.TimeoutError:
+        process.kill()
+        stdout, stderr, truncated = b'', b'', False
+        returncode = TIMEOUT_RETURNCODE
+
+    elapsed = time.monotonic() - started
+    # A program ignoring SIGTERM is killed a second later (exit code 128 + SIGKILL)
+    timed_out = returncode == TIMEOUT_RETURNCODE or elapsed >= timeout
+
+    return {
+        "stdout": stdout.decode('utf-8', errors='replace'),
+        "stderr": stderr.decode('utf-8', errors='replace'),
+        "returncode": TIMEOUT_RETURNCODE if timed_out else returncode,
+        "time_ms": round(elapsed * 1000),
+        "timed_out": timed_out,
+        "truncated": truncated,
+    }
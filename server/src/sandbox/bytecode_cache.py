@@ -0,0 +1,204 @@
+"""
+Persistent per-user bytecode cache for projects executed via RUNF.
+
+Project files are copied into the sandbox owned by root, so Python can
+never write `__pycache__` next to them, and every run of a multi-module
+project recompiled every imported module. Runs now set PYTHONPYCACHEPREFIX
+to a cache directory of the sandbox image, which is seeded with the bytecode
+of the standard library and has a writable mirror of the working directory.
+After the run the bytecode written into that mirror is stored on the host
+per user, and copied into the sandbox of the user's next run.
+
+Validity:
+    Python checks every .pyc against the modification time and size of its
+    source. Since that misses a same-size edit within the same second, the
+    bytecode of a file is also dropped whenever the file is saved or deleted.
+    A per-user generation counter keeps a run that started before
+    such a change from storing its (now stale) bytecode.
+
+Safety:
+    The archive read back from the sandbox is untrusted: only regular .pyc
+    files below the working directory's mirror are stored, up to a size bound.
+
+Environment Variables:
+    BYTECODE_CACHE_ENABLED: "true"/"false" - Enable the bytecode cache (default: true)
+    BYTECODE_CACHE_MAX_BYTES: Bytecode stored per user (default: 16 MiB)
+"""
+
+import io
+import os
+import posixpath
+import shutil
+import tarfile
+import uuid
+from pathlib import Path, PurePosixPath
+
+from dotenv import load_dotenv
+
+from sandbox.pool import SANDBOX_WORKDIR
+from utils.user_file_manager import USER_FOLDER_NAME_PREFIX, USER_ID_LEN
+
+BYTECODE_CACHE_BASE_DIR = "../bytecode_cache"
+SANDBOX_CACHE_DIR = '/var/cache/codebox/pycache'  # PYTHONPYCACHEPREFIX (see docker/Dockerfile)
+PROJECT_CACHE_DIR = SANDBOX_CACHE_DIR + SANDBOX_WORKDIR  # Mirror of the working directory
+PROJECT_CACHE_PARENT, PROJECT_CACHE_NAME = posixpath.split(PROJECT_CACHE_DIR)
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+class BytecodeCache:
+    """
+    Host side store of the bytecode written by users' runs.
+
+    Attributes:
+        enabled (bool): Whether bytecode is stored and restored
+        max_bytes (int): Bound on the bytecode stored per user
+        base_dir (Path): Host directory holding a directory per user
+        generations (dict): Maps user ID -> number of invalidations so far
+    """
+
+    def __init__(self, enabled: bool = None, max_bytes: int = None, base_dir: str = BYTECODE_CACHE_BASE_DIR):
+        load_dotenv()
+        self.enabled = enabled if enabled is not None else os.getenv("BYTECODE_CACHE_ENABLED", "true").lower() == "true"
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("BYTECODE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.base_dir = Path(base_dir)
+        self.generations: dict[int, int] = {}
+
+        # Statistics
+        self.restores = 0
+        self.stores = 0
+        self.rejected = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def environment() -> dict:
+        """
+        Returns:
+            dict: Environment variables directing a run's bytecode into the cache directory
+        """
+        return {"PYTHONPYCACHEPREFIX": SANDBOX_CACHE_DIR}
+
+    def user_dir(self, uid: int) -> Path:
+        return self.base_dir / f"{USER_FOLDER_NAME_PREFIX}{str(uid).zfill(USER_ID_LEN)}"
+
+    def generation(self, uid: int) -> int:
+        return self.generations.get(uid, 0)
+
+    def archive(self, uid: int) -> bytes | None:
+        """
+        Build the archive restoring a user's bytecode into PROJECT_CACHE_PARENT.
+
+        Directories are world-writable so the sandbox user can add and
+        replace bytecode files.
+
+        Returns:
+            bytes | None: The tar archive, None if nothing is cached
+        """
+        folder = self.user_dir(uid)
+        if not folder.is_dir():
+            return None
+
+        def make_writable(info: tarfile.TarInfo) -> tarfile.TarInfo:
+            info.uid = info.gid = 0
+            info.uname = info.gname = 'root'
+            info.mode = 0o777 if info.isdir() else 0o666
+            return info
+
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            tar.add(str(folder), arcname=PROJECT_CACHE_NAME, filter=make_writable)
+
+        self.restores += 1
+        return buffer.getvalue()
+
+    def store(self, uid: int, archive: bytes, generation: int):
+        """
+        Replace a user's bytecode with the bytecode read back from a sandbox.
+
+        Args:
+            uid (int): User ID
+            archive (bytes): Tar archive of PROJECT_CACHE_DIR
+            generation (int): The user's generation when the run started
+        """
+        if generation != self.generation(uid):
+            return  # Sources changed during the run
+
+        staging = self.base_dir / f".staging-{uuid.uuid4().hex}"
+        try:
+            if not self.extract(archive, staging):
+                self.rejected += 1
+                return
+
+            # Sources may have changed while extracting
+            if generation != self.generation(uid):
+                return
+
+            target = self.user_dir(uid)
+            shutil.rmtree(target, ignore_errors=True)
+            staging.rename(target)
+            self.stores += 1
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def extract(self, archive: bytes, destination: Path) -> bool:
+        """
+        Extract the .pyc files of an untrusted PROJECT_CACHE_DIR archive.
+
+        Returns:
+            bool: False if the archive was rejected (unexpected content or too large)
+        """
+        total = 0
+        try:
+            with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+                for member in tar:
+                    path = PurePosixPath(member.name)
+                    if path.is_absolute() or '..' in path.parts or path.parts[:1] != (PROJECT_CACHE_NAME,):
+                        return False
+                    if member.isdir():
+                        continue
+                    if not member.isfile() or path.suffix != '.pyc':
+                        return False
+
+                    total += member.size
+                    if total > self.max_bytes:
+                        return False
+
+                    target = destination.joinpath(*path.parts[1:])
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    target.write_bytes(tar.extractfile(member).read())
+        except tarfile.TarError:
+            return False
+
+        destination.mkdir(parents=True, exist_ok=True)
+        return True
+
+    def invalidate(self, uid: int, path: str):
+        """
+        Drop the bytecode of a user's source file (saved, deleted or renamed).
+
+        Args:
+            uid (int): User ID
+            path (str): Path of the file within the user's storage
+        """
+        self.generations[uid] = self.generation(uid) + 1
+        self.invalidations += 1
+
+        source = PurePosixPath(path)
+        if source.is_absolute() or '..' in source.parts:
+            return
+
+        folder = self.user_dir(uid).joinpath(*source.parent.parts)
+        for bytecode in folder.glob(f"{source.stem}.*.pyc"):
+            bytecode.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Restore / store / invalidation counters
+        """
+        return {
+            "enabled": self.enabled,
+            "restores": self.restores,
+            "stores": self.stores,
+            "rejected": self.rejected,
+            "invalidations": self.invalidations,
+        }
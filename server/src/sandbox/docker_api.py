@@ -0,0 +1,500 @@
+"""
+Minimal asyncio client for the Docker Engine API over its unix socket.
+
+Driving Docker through the CLI costs a fork+exec and a full CLI startup for
+every operation. This client talks HTTP/1.1 directly to the daemon's socket
+and keeps a pool of persistent (keep-alive) connections, so container
+lifecycle operations cost a single request/response round-trip.
+
+Supported Operations:
+    - Containers: create, start, attach, kill, wait, remove, put / get archive
+    - Exec: create, start (attached), inspect
+    - Images: inspect
+
+Attached Streams:
+    Attaching to a container or starting an exec hijacks the HTTP connection
+    (`Upgrade: tcp`). Without a TTY, Docker multiplexes stdout and stderr over
+    it using 8-byte frame headers: [stream type, 0, 0, 0, size (uint32 BE)].
+    AttachedProcess demultiplexes them and exposes an interface compatible
+    with asyncio.subprocess.Process (stdin / stdout / stderr / wait / kill).
+    The daemon may still report an exec as running right after its stream
+    closed, so its exit code is polled for a short while.
+
+Environment Variables:
+    DOCKER_HOST: Daemon address, only unix:// addresses are supported
+                 (default: unix:///var/run/docker.sock)
+"""
+
+import asyncio
+import json
+import os
+from urllib.parse import quote, urlencode
+
+import errors
+
+DEFAULT_SOCKET_PATH = '/var/run/docker.sock'
+API_VERSION = 'v1.41'
+MAX_IDLE_CONNECTIONS = 8
+STREAM_BUFFER_LIMIT = 256 * 1024  # Demultiplexed bytes buffered before reading the socket pauses
+EXEC_EXIT_POLLS = 20
+EXEC_EXIT_POLL_INTERVAL = 0.05  # seconds
+EXEC_EXIT_UNKNOWN = 125  # Exit code of an exec the daemon reports none for (Docker's own error code)
+
+# Multiplexed stream types
+STREAM_STDOUT = 1
+STREAM_STDERR = 2
+
+
+def socket_path_from_env() -> str:
+    """
+    Returns:
+        str: Path of the Docker daemon's unix socket
+    """
+    docker_host = os.getenv("DOCKER_HOST", "")
+    if docker_host.startswith("unix://"):
+        return docker_host[len("unix://"):]
+    return DEFAULT_SOCKET_PATH
+
+
+class DemuxedStream:
+    """
+    Read side of one demultiplexed stream (stdout or stderr).
+
+    Offers the subset of asyncio.StreamReader used for process output
+    (read / readline / at_eof), with a buffer limit so a reader that falls
+    behind pauses the demultiplexer (and in turn the container's output).
+    """
+
+    def __init__(self, limit: int = STREAM_BUFFER_LIMIT):
+        self.buffer = bytearray()
+        self.limit = limit
+        self.eof = False
+        self.changed = asyncio.Condition()
+
+    async def feed(self, data: bytes):
+        async with self.changed:
+            await self.changed.wait_for(lambda: len(self.buffer) < self.limit)
+            self.buffer += data
+            self.changed.notify_all()
+
+    async def feed_eof(self):
+        async with self.changed:
+            self.eof = True
+            self.changed.notify_all()
+
+    def at_eof(self) -> bool:
+        return self.eof and not self.buffer
+
+    async def read(self, n: int = -1) -> bytes:
+        async with self.changed:
+            if n < 0:
+                await self.changed.wait_for(lambda: self.eof)
+                n = len(self.buffer)
+            else:
+                await self.changed.wait_for(lambda: self.buffer or self.eof)
+
+            data = bytes(self.buffer[:n])
+            del self.buffer[:n]
+            self.changed.notify_all()
+            return data
+
+    async def readline(self) -> bytes:
+        async with self.changed:
+            await self.changed.wait_for(lambda: b'\n' in self.buffer or self.eof or len(self.buffer) >= self.limit)
+
+            end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+            data = bytes(self.buffer[:end])
+            del self.buffer[:end]
+            self.changed.notify_all()
+            return data
+
+
+class StreamInput:
+    """Write side of an attached stream (the process's stdin)."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    def write(self, data: bytes):
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def close(self):
+        """Close stdin (EOF) while keeping the output streams open."""
+        if not self.writer.is_closing() and self.writer.can_write_eof():
+            self.writer.write_eof()
+
+
+class AttachedProcess:
+    """
+    Process-like handle of an attached container or exec instance.
+
+    Attributes:
+        stdin (StreamInput): Process stdin
+        stdout (DemuxedStream): Process stdout
+        stderr (DemuxedStream): Process stderr
+        returncode (int): Exit code, None while running
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, exit_code):
+        """
+        Args:
+            reader, writer: The hijacked connection
+            exit_code (coroutine function): Fetches the exit code once output ended
+        """
+        self.reader = reader
+        self.writer = writer
+        self.exit_code = exit_code
+        self.stdin = StreamInput(writer)
+        self.stdout = DemuxedStream()
+        self.stderr = DemuxedStream()
+        self.returncode = None
+        self.demux_task = asyncio.create_task(self.demux())
+
+    async def demux(self):
+        """Split the multiplexed connection into the stdout and stderr streams."""
+        try:
+            while True:
+                header = await self.reader.readexactly(8)
+                size = int.from_bytes(header[4:8], 'big')
+                payload = await self.reader.readexactly(size)
+                stream = self.stderr if header[0] == STREAM_STDERR else self.stdout
+                await stream.feed(payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # Connection closed, the process ended
+        finally:
+            await self.stdout.feed_eof()
+            await self.stderr.feed_eof()
+
+    async def wait(self) -> int:
+        """
+        Wait for the process to end.
+
+        Returns:
+            int: Process exit code
+        """
+        await asyncio.shield(self.demux_task)
+        if self.returncode is None:
+            self.returncode = await self.exit_code()
+            self.writer.close()
+        return self.returncode
+
+    def kill(self):
+        """Detach from the process (the sandbox itself is killed by its owner)."""
+        if self.returncode is None:
+            self.returncode = -9
+        self.writer.close()
+
+
+class DockerAPIClient:
+    """
+    Docker Engine API client with a pool of persistent connections.
+
+    Attributes:
+        socket_path (str): Path of the daemon's unix socket
+        idle (list): Idle keep-alive connections (reader, writer)
+    """
+
+    def __init__(self, socket_path: str = None, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self.socket_path = socket_path or socket_path_from_env()
+        self.max_idle = max_idle
+        self.idle: list[tuple] = []
+
+        # Statistics
+        self.requests = 0
+        self.connections_opened = 0
+
+    async def close(self):
+        """Close all idle connections."""
+        idle, self.idle = self.idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def connect(self) -> tuple:
+        self.connections_opened += 1
+        return await asyncio.open_unix_connection(self.socket_path)
+
+    def checkout(self) -> tuple | None:
+        """Take an idle connection that is still open, None if there is none."""
+        while self.idle:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def checkin(self, reader, writer):
+        """Return a connection to the pool for reuse."""
+        if len(self.idle) < self.max_idle and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+    @staticmethod
+    def build_request(method: str, path: str, params: dict = None, body=None, upgrade: bool = False) -> bytes:
+        """Serialize an HTTP/1.1 request (JSON bodies for dicts/lists, raw bytes as tar)."""
+        target = f"/{API_VERSION}{path}"
+        if params:
+            target += '?' + urlencode(params)
+
+        headers = [f"{method} {target} HTTP/1.1", "Host: docker"]
+        payload = b''
+        if body is not None:
+            if isinstance(body, (bytes, bytearray)):
+                payload = bytes(body)
+                headers.append("Content-Type: application/x-tar")
+            else:
+                payload = json.dumps(body).encode()
+                headers.append("Content-Type: application/json")
+        headers.append(f"Content-Length: {len(payload)}")
+        if upgrade:
+            headers += ["Connection: Upgrade", "Upgrade: tcp"]
+
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode() + payload
+
+    @staticmethod
+    async def read_head(reader: asyncio.StreamReader) -> tuple:
+        """
+        Read a response status line and headers.
+
+        Returns:
+            tuple: (status code, headers dict with lower-case names)
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Docker daemon closed the connection")
+
+        status = int(status_line.split(b' ', 2)[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        return status, headers
+
+    @staticmethod
+    async def read_body(reader: asyncio.StreamReader, status: int, headers: dict) -> bytes:
+        if status in (101, 204, 304):
+            return b''
+        if 'content-length' in headers:
+            return await reader.readexactly(int(headers['content-length']))
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)  # Chunk data + CRLF
+                if not size:
+                    return bytes(body)
+                body += chunk[:-2]
+        return await reader.read()
+
+    async def request(self, method: str, path: str, params: dict = None, body=None, ok_statuses=(), raw: bool = False):
+        """
+        Send a request over a pooled connection.
+
+        Args:
+            method (str): HTTP method
+            path (str): API path (without the version prefix)
+            params (dict): Query parameters
+            body: JSON serializable body, or bytes for a tar archive
+            ok_statuses (tuple): Error statuses to return instead of raising
+            raw (bool): Return the body as bytes instead of decoding it
+
+        Returns:
+            tuple: (status code, decoded JSON body or None / body bytes if raw)
+
+        Raises:
+            DockerAPIError: If the daemon responds with an error status
+        """
+        request = self.build_request(method, path, params, body)
+        self.requests += 1
+
+        for attempt in range(2):
+            connection = self.checkout()
+            reused = connection is not None
+            reader, writer = connection or await self.connect()
+
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, headers = await self.read_head(reader)
+                payload = await self.read_body(reader, status, headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused and attempt == 0:
+                    continue  # Stale keep-alive connection, retry on a fresh one
+                raise
+
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+            else:
+                self.checkin(reader, writer)
+            break
+
+        data = json.loads(payload) if payload and 'json' in headers.get('content-type', '') else None
+
+        if status >= 400 and status not in ok_statuses:
+            message = data.get('message') if isinstance(data, dict) else payload.decode(errors='replace')
+            raise errors.DockerAPIError(status, message)
+
+        return status, payload if raw else data
+
+    async def hijack(self, path: str, params: dict = None, body=None, exit_code=None) -> AttachedProcess:
+        """
+        Send a request that upgrades its connection to a raw attached stream.
+        Hijacked connections are never returned to the pool.
+        """
+        request = self.build_request('POST', path, params, body, upgrade=True)
+        self.requests += 1
+
+        reader, writer = await self.connect()
+        writer.write(request)
+        await writer.drain()
+
+        status, headers = await self.read_head(reader)
+        if status not in (101, 200):
+            payload = await self.read_body(reader, status, headers)
+            writer.close()
+            raise errors.DockerAPIError(status, payload.decode(errors='replace'))
+
+        return AttachedProcess(reader, writer, exit_code)
+
+    # --- Containers ---
+
+    async def create_container(self, name: str, config: dict) -> str:
+        """
+        Create a container.
+
+        Args:
+            name (str): Container name
+            config (dict): Container config (Image, Cmd, HostConfig, ...)
+
+        Returns:
+            str: Container ID
+        """
+        _, data = await self.request('POST', '/containers/create', params={'name': name}, body=config)
+        return data['Id']
+
+    async def list_containers(self, label: str) -> list:
+        """
+        Returns:
+            list: All containers (running or not) having the label
+        """
+        filters = json.dumps({"label": [label]})
+        _, data = await self.request('GET', '/containers/json', params={'all': 1, 'filters': filters})
+        return data
+
+    async def start_container(self, container: str):
+        await self.request('POST', f'/containers/{quote(container)}/start')
+
+    async def update_container(self, container: str, resources: dict):
+        """Change the resource limits of a container (NanoCpus, Memory, ...)."""
+        await self.request('POST', f'/containers/{quote(container)}/update', body=resources)
+
+    async def kill_container(self, container: str, signal: str = 'SIGKILL'):
+        """Kill a container, ignoring containers that are already gone or stopped."""
+        await self.request('POST', f'/containers/{quote(container)}/kill', params={'signal': signal}, ok_statuses=(404, 409))
+
+    async def wait_container(self, container: str) -> int:
+        """
+        Returns:
+            int: Exit code of the container's main process
+        """
+        _, data = await self.request('POST', f'/containers/{quote(container)}/wait')
+        return data['StatusCode']
+
+    async def remove_container(self, container: str, force: bool = True):
+        await self.request('DELETE', f'/containers/{quote(container)}', params={'force': int(force)}, ok_statuses=(404, 409))
+
+    async def put_archive(self, container: str, path: str, archive: bytes):
+        """Extract a tar archive into a directory of the container."""
+        await self.request('PUT', f'/containers/{quote(container)}/archive', params={'path': path}, body=archive)
+
+    async def get_archive(self, container: str, path: str) -> bytes | None:
+        """
+        Returns:
+            bytes | None: Tar archive of a path of the container, None if it doesn't exist
+        """
+        status, archive = await self.request(
+            'GET', f'/containers/{quote(container)}/archive', params={'path': path}, ok_statuses=(404,), raw=True
+        )
+        return archive if status == 200 else None
+
+    async def attach_container(self, container: str) -> AttachedProcess:
+        """Attach to the stdin/stdout/stderr of a container's main process."""
+        async def exit_code():
+            return await self.wait_container(container)
+
+        params = {'stream': 1, 'stdin': 1, 'stdout': 1, 'stderr': 1}
+        return await self.hijack(f'/containers/{quote(container)}/attach', params=params, exit_code=exit_code)
+
+    # --- Exec ---
+
+    async def exec_create(self, container: str, command: list, env: list = None, workdir: str = None) -> str:
+        """
+        Returns:
+            str: Exec instance ID
+        """
+        config = {
+            'Cmd': command,
+            'AttachStdin': True,
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Tty': False,
+        }
+        if env:
+            config['Env'] = env
+        if workdir:
+            config['WorkingDir'] = workdir
+
+        _, data = await self.request('POST', f'/containers/{quote(container)}/exec', body=config)
+        return data['Id']
+
+    async def exec_start(self, exec_id: str) -> AttachedProcess:
+        """Start an exec instance attached to its stdin/stdout/stderr."""
+        async def exit_code():
+            return await self.exec_exit_code(exec_id)
+
+        return await self.hijack(f'/exec/{exec_id}/start', body={'Detach': False, 'Tty': False}, exit_code=exit_code)
+
+    async def exec_exit_code(self, exec_id: str) -> int:
+        """
+        Wait for an exec instance whose stream closed to be reported as exited.
+
+        Returns:
+            int: Its exit code, EXEC_EXIT_UNKNOWN if the daemon still reports none
+                 after EXEC_EXIT_POLLS inspections
+        """
+        for poll in range(EXEC_EXIT_POLLS):
+            if poll:
+                await asyncio.sleep(EXEC_EXIT_POLL_INTERVAL)
+            data = await self.exec_inspect(exec_id)
+            if not data.get('Running') and data.get('ExitCode') is not None:
+                return data['ExitCode']
+        return EXEC_EXIT_UNKNOWN
+
+    async def exec_inspect(self, exec_id: str) -> dict:
+        _, data = await self.request('GET', f'/exec/{exec_id}/json')
+        return data
+
+    # --- Images ---
+
+    async def image_id(self, image: str) -> str | None:
+        """
+        Returns:
+            str | None: ID of the image, None if it doesn't exist
+        """
+        status, data = await self.request('GET', f'/images/{quote(image)}/json', ok_statuses=(404,))
+        return data['Id'] if status == 200 else None
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "idle_connections": len(self.idle),
+        }
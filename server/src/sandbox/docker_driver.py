@@ -0,0 +1,284 @@
+"""
+Docker sandbox backend: sandboxes are containers of the python_runner image.
+
+Two interchangeable drivers implement the backend (see backend.py):
+- DockerCLIDriver: Forks the `docker` CLI for every operation
+- DockerAPIDriver: Talks to the Docker Engine API over the daemon's unix
+  socket with pooled keep-alive connections (see docker_api.py)
+
+Sandbox containers never have network access.
+
+Environment Variables:
+    DOCKER_DRIVER: "api" / "cli" (default: "api" when the daemon socket exists)
+"""
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+import errors
+from sandbox.backend import SandboxBackend
+from sandbox.docker_api import (
+    DockerAPIClient,
+    socket_path_from_env
+)
+
+
+def cli_limit_args(limits: dict) -> list:
+    """
+    Returns:
+        list: `docker run` arguments applying the resource limits
+    """
+    return [
+        f"--cpus={limits['cpus']}",
+        f"--memory={limits['memory']}",
+        f"--pids-limit={limits['pids']}",
+        "--network", "none",
+    ]
+
+
+def cli_update_args(limits: dict) -> list:
+    """
+    Returns:
+        list: `docker update` arguments changing the resource limits (swap stays
+              twice the memory, the default of `docker run --memory`)
+    """
+    return [
+        f"--cpus={limits['cpus']}",
+        f"--memory={limits['memory']}",
+        f"--memory-swap={2 * limits['memory']}",
+        f"--pids-limit={limits['pids']}",
+    ]
+
+
+def api_host_config(limits: dict, mounts: dict = None) -> dict:
+    """
+    Returns:
+        dict: Engine API HostConfig applying the resource limits and read-only mounts
+    """
+    return {
+        "NanoCpus": int(limits['cpus'] * 1e9),
+        "Memory": limits['memory'],
+        "PidsLimit": limits['pids'],
+        "NetworkMode": "none",
+        "AutoRemove": True,
+        "Binds": [f"{source}:{target}:ro" for source, target in (mounts or {}).items()],
+    }
+
+
+def api_update_config(limits: dict) -> dict:
+    """
+    Returns:
+        dict: Engine API container update changing the resource limits (see cli_update_args)
+    """
+    return {
+        "NanoCpus": int(limits['cpus'] * 1e9),
+        "Memory": limits['memory'],
+        "MemorySwap": 2 * limits['memory'],
+        "PidsLimit": limits['pids'],
+    }
+
+
+class DockerCLIDriver(SandboxBackend):
+    """Manages sandbox containers by running `docker` CLI commands."""
+
+    name = 'docker'
+    driver = 'cli'
+    live_limits = True
+
+    async def run(self, *args, stdin_data: bytes = None) -> tuple:
+        """
+        Run a docker CLI command.
+
+        Returns:
+            tuple: (return code, stdout bytes)
+        """
+        process = await asyncio.create_subprocess_exec(
+            "docker", *args,
+            stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate(stdin_data)
+        return process.returncode, stdout
+
+    async def start_sandbox(self, name: str, image: str, limits: dict, command: list, labels: dict = None,
+                            mounts: dict = None) -> bool:
+        """
+        Start a detached, auto-removed container.
+
+        Returns:
+            bool: Whether the container was started
+        """
+        label_args = [arg for key, value in (labels or {}).items() for arg in ("--label", f"{key}={value}")]
+        mount_args = [arg for source, target in (mounts or {}).items() for arg in ("-v", f"{source}:{target}:ro")]
+        returncode, _ = await self.run(
+            "run", "-d", "--rm", *cli_limit_args(limits), *label_args, *mount_args, "--name", name, image, *command
+        )
+        return returncode == 0
+
+    async def kill_sandbox(self, name: str):
+        await self.run("kill", name)
+
+    async def update_limits(self, name: str, limits: dict) -> bool:
+        returncode, _ = await self.run("update", *cli_update_args(limits), name)
+        return returncode == 0
+
+    async def list_sandboxes(self, label: str) -> dict | None:
+        returncode, stdout = await self.run(
+            "ps", "--all", "--filter", f"label={label}", "--format", f'{{{{.Names}}}}\t{{{{.Label "{label}"}}}}'
+        )
+        if returncode != 0:
+            return None
+        return dict(line.split('\t', 1) for line in stdout.decode().splitlines() if '\t' in line)
+
+    async def exec(self, name: str, command: list, env: dict = None):
+        """
+        Start a command inside a container with pipes for stdin/stdout/stderr.
+
+        Returns:
+            asyncio.subprocess.Process: The `docker exec` process
+        """
+        env_args = [arg for key, value in (env or {}).items() for arg in ("-e", f"{key}={value}")]
+        return await asyncio.create_subprocess_exec(
+            "docker", "exec", "-i", *env_args, name, *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+    async def copy_into(self, name: str, dest: str, archive: bytes):
+        """Extract a tar archive into a directory of the container."""
+        await self.run("cp", "-", f"{name}:{dest}", stdin_data=archive)
+
+    async def copy_from(self, name: str, path: str) -> bytes | None:
+        """
+        Returns:
+            bytes | None: Tar archive of a path of the container, None if it doesn't exist
+        """
+        returncode, stdout = await self.run("cp", f"{name}:{path}", "-")
+        return stdout if returncode == 0 else None
+
+    async def image_id(self, image: str) -> str | None:
+        returncode, stdout = await self.run("image", "inspect", "--format", "{{.Id}}", image)
+        return stdout.decode().strip() if returncode == 0 else None
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "driver": self.driver}
+
+
+class DockerAPIDriver(SandboxBackend):
+    """Manages sandbox containers through the Docker Engine API."""
+
+    name = 'docker'
+    driver = 'api'
+    live_limits = True
+
+    def __init__(self, socket_path: str = None):
+        self.client = DockerAPIClient(socket_path)
+
+    async def start_sandbox(self, name: str, image: str, limits: dict, command: list, labels: dict = None,
+                            mounts: dict = None) -> bool:
+        """
+        Create and start an auto-removed container.
+
+        Returns:
+            bool: Whether the container was started
+        """
+        config = {
+            "Image": image,
+            "Cmd": command,
+            "OpenStdin": True,
+            "Labels": labels or {},
+            "HostConfig": api_host_config(limits, mounts),
+        }
+        try:
+            await self.client.create_container(name, config)
+            await self.client.start_container(name)
+        except (errors.DockerAPIError, OSError):
+            await self.kill_sandbox(name)
+            return False
+        return True
+
+    async def kill_sandbox(self, name: str):
+        try:
+            await self.client.kill_container(name)
+            await self.client.remove_container(name)
+        except (errors.DockerAPIError, OSError):
+            pass
+
+    async def update_limits(self, name: str, limits: dict) -> bool:
+        try:
+            await self.client.update_container(name, api_update_config(limits))
+        except (errors.DockerAPIError, OSError):
+            return False
+        return True
+
+    async def list_sandboxes(self, label: str) -> dict | None:
+        try:
+            containers = await self.client.list_containers(label)
+        except (errors.DockerAPIError, OSError):
+            return None
+        return {
+            container['Names'][0].lstrip('/'): (container.get('Labels') or {}).get(label, '')
+            for container in containers if container.get('Names')
+        }
+
+    async def exec(self, name: str, command: list, env: dict = None):
+        """
+        Start a command inside a container attached to its stdin/stdout/stderr.
+
+        Returns:
+            AttachedProcess: Process-like handle of the exec instance
+        """
+        env_list = [f"{key}={value}" for key, value in (env or {}).items()]
+        exec_id = await self.client.exec_create(name, command, env=env_list)
+        return await self.client.exec_start(exec_id)
+
+    async def copy_into(self, name: str, dest: str, archive: bytes):
+        """Extract a tar archive into a directory of the container."""
+        await self.client.put_archive(name, dest, archive)
+
+    async def copy_from(self, name: str, path: str) -> bytes | None:
+        """
+        Returns:
+            bytes | None: Tar archive of a path of the container, None if it doesn't exist
+        """
+        try:
+            return await self.client.get_archive(name, path)
+        except (errors.DockerAPIError, OSError):
+            return None
+
+    async def image_id(self, image: str) -> str | None:
+        try:
+            return await self.client.image_id(image)
+        except (errors.DockerAPIError, OSError):
+            return None
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "driver": self.driver, **self.client.stats()}
+
+
+def create_driver():
+    """
+    Create the Docker driver selected by the environment.
+
+    Returns:
+        DockerCLIDriver | DockerAPIDriver: The driver
+    """
+    load_dotenv()
+    driver = os.getenv("DOCKER_DRIVER", "").lower()
+
+    if not driver:
+        driver = 'api' if os.path.exists(socket_path_from_env()) else 'cli'
+
+    if driver == 'api':
+        return DockerAPIDriver()
+    return DockerCLIDriver()
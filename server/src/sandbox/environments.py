@@ -0,0 +1,440 @@
+"""
+Cached per-project Python environments built from a local wheelhouse.
+
+A RUNF project may list packages in a requirements.txt next to its files.
+Sandboxes have no network, so packages come from a wheelhouse on the server
+(a directory of wheels maintained by the operators). The requirements are
+resolved against it, and the resolved set of wheels is installed once into
+an environment directory named by the hash of the set. Projects (of any
+user) resolving to the same set share the environment.
+
+Mounting:
+    The environments directory is mounted read-only into every pooled
+    sandbox at SANDBOX_ENVIRONMENTS_DIR (sandboxes are started before it is
+    known which project runs in them). A run finds its environment through
+    PYTHONPATH=SANDBOX_ENVIRONMENTS_DIR/<hash>, so it can import its
+    packages but can't modify them. With the remote backend the runners mount
+    their own ENVIRONMENTS_DIR, which must hold the server's environments
+    (e.g. a shared file system).
+
+Resolution:
+    `pip install --dry-run --report` resolves the requirements with
+    --no-index against the wheelhouse only, for the sandboxes' Python
+    version (asked from a pooled sandbox once at startup). Only plain
+    requirement specifiers are accepted: pip options, URLs and paths in a
+    requirements file could read files of the server or reach the network.
+    Resolutions are cached by the requirements text until the wheelhouse changes.
+
+Eviction:
+    Environments in use by a run are referenced and never removed. When the
+    environments exceed their size bound, the least recently used
+    unreferenced ones are removed; they are rebuilt when needed again.
+
+Environment Variables:
+    ENVIRONMENTS_ENABLED: "true"/"false" - Enable project environments (default: true)
+    WHEELHOUSE_DIR: Directory of the wheels packages are installed from (default: none, disables environments)
+    ENVIRONMENTS_DIR: Directory holding the built environments (default: ../environments)
+    ENVIRONMENTS_MAX_BYTES: Size bound of the built environments (default: 2 GiB)
+    ENVIRONMENTS_WORKERS: Max number of concurrent pip processes (default: 2)
+    ENVIRONMENTS_TIMEOUT: Seconds a resolution or build may take (default: 300)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from dotenv import load_dotenv
+
+from sandbox.preflight import sandbox_python_version
+from utils.logger import (
+    Logger,
+    Level,
+    Event
+    )
+
+ENVIRONMENTS_BASE_DIR = "../environments"
+SANDBOX_ENVIRONMENTS_DIR = '/opt/environments'
+REQUIREMENTS_FILE = 'requirements.txt'
+MAX_REQUIREMENTS_BYTES = 64 * 1024
+MAX_REQUIREMENTS = 100
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 300  # seconds
+RESOLUTION_CACHE_SIZE = 1024
+BUILDS_DIR_NAME = '.building'  # Environments being built, renamed into place when done
+
+# A requirement specifier: name, optional extras, optional versions and markers
+REQUIREMENT_LINE = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]*\s*(\[[A-Za-z0-9._,\s-]*\])?\s*([<>=!~][^@/\\]*)?(;[^@/\\]*)?')
+PIP_COMMAND = [sys.executable, '-m', 'pip', 'install', '--disable-pip-version-check', '--no-input', '--no-index',
+               '--only-binary=:all:']
+
+
+class RequirementsError(Exception):
+    """A project's requirements can't be installed, the message says why."""
+
+
+def parse_requirements(text: str) -> list:
+    """
+    Parse a requirements file restricted to requirement specifiers.
+
+    Returns:
+        list: Requirement lines, without comments and blank lines
+
+    Raises:
+        RequirementsError: If a line is not a plain requirement specifier
+    """
+    requirements = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.split(' #', 1)[0].strip() if not line.lstrip().startswith('#') else ''
+        if not line:
+            continue
+        if not REQUIREMENT_LINE.fullmatch(line):
+            raise RequirementsError(f"{REQUIREMENTS_FILE}, line {number}: only package requirements are supported: {line}")
+        requirements.append(line)
+
+    if len(requirements) > MAX_REQUIREMENTS:
+        raise RequirementsError(f"{REQUIREMENTS_FILE}: more than {MAX_REQUIREMENTS} requirements")
+    return requirements
+
+
+def directory_size(path: Path) -> int:
+    """
+    Returns:
+        int: Total size of the files below a directory
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def pip_error(stderr: bytes) -> str:
+    """
+    Returns:
+        str: pip's error lines, or its whole error output if it has none
+    """
+    text = stderr.decode(errors='replace')
+    errors = [line for line in text.splitlines() if line.startswith('ERROR:')]
+    return '\n'.join(errors) if errors else text.rstrip()
+
+
+class Environment:
+    """
+    A built environment.
+
+    Attributes:
+        digest (str): Hash of the installed wheels, name of its directory
+        size (int): Size of its files in bytes
+        references (int): Number of runs using it
+    """
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+        self.references = 0
+
+
+class EnvironmentManager:
+    """
+    Resolves, builds and evicts project environments.
+
+    Attributes:
+        enabled (bool): Whether projects get environments (needs a wheelhouse)
+        wheelhouse (Path): Directory of the wheels, None if not configured
+        base_dir (Path): Host directory holding the environments
+        max_bytes (int): Size bound of the built environments
+        timeout (float): Seconds a pip process may take
+        sandbox_version (str): Python version of the sandboxes, None until known
+        environments (OrderedDict): Maps digest -> built Environment, least recently used first
+        builds (dict): Maps digest -> task building the environment
+        resolutions (OrderedDict): Maps requirements hash -> (digest, wheel paths)
+    """
+
+    def __init__(self, enabled: bool = None, wheelhouse: str = None, base_dir: str = None, max_bytes: int = None,
+                 workers: int = None, timeout: float = None):
+        load_dotenv()
+        wheelhouse = wheelhouse if wheelhouse is not None else os.getenv("WHEELHOUSE_DIR")
+        self.wheelhouse = Path(wheelhouse).resolve() if wheelhouse else None
+        enabled = enabled if enabled is not None else os.getenv("ENVIRONMENTS_ENABLED", "true").lower() == "true"
+        self.enabled = enabled and self.wheelhouse is not None
+        self.base_dir = Path(base_dir or os.getenv("ENVIRONMENTS_DIR", ENVIRONMENTS_BASE_DIR)).resolve()
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("ENVIRONMENTS_MAX_BYTES", DEFAULT_MAX_BYTES))
+        workers = workers if workers is not None else int(os.getenv("ENVIRONMENTS_WORKERS", DEFAULT_WORKERS))
+        self.timeout = timeout if timeout is not None else float(os.getenv("ENVIRONMENTS_TIMEOUT", DEFAULT_TIMEOUT))
+        self.logger = Logger()
+
+        self.slots = asyncio.Semaphore(workers)
+        self.sandbox_version = None
+        self.load_task = None
+        self.environments: OrderedDict[str, Environment] = OrderedDict()
+        self.builds: dict[str, asyncio.Task] = {}
+        self.resolutions: OrderedDict[str, tuple] = OrderedDict()
+        self.wheelhouse_mtime = None  # Resolutions are cached for this state of the wheelhouse
+
+        # Statistics
+        self.resolved = 0
+        self.built = 0
+        self.reused = 0
+        self.evicted = 0
+        self.failed = 0
+        self.build_time_total = 0.0
+
+    def mounts(self) -> dict:
+        """
+        Create the environments directory.
+
+        Returns:
+            dict: Mounts of pooled sandboxes (host directory -> sandbox path), none if disabled
+        """
+        if not self.enabled:
+            return {}
+        (self.base_dir / BUILDS_DIR_NAME).mkdir(parents=True, exist_ok=True)
+        return {str(self.base_dir): SANDBOX_ENVIRONMENTS_DIR}
+
+    def start(self, pool):
+        """
+        Load the environments built by earlier server processes and learn the
+        sandboxes' Python version from a pooled sandbox in the background.
+
+        Args:
+            pool (SandboxPool): Pool to borrow the sandbox from
+        """
+        if self.enabled:
+            self.load_task = asyncio.create_task(self.load(pool))
+
+    async def load(self, pool):
+        await asyncio.to_thread(self.scan)
+
+        sandbox = await pool.acquire()
+        if sandbox is None:
+            return
+        try:
+            self.sandbox_version = await sandbox_python_version(pool.backend, sandbox.name)
+        finally:
+            await pool.release(sandbox)  # Never used, it goes back to the pool
+
+    def scan(self):
+        """Register the built environments on disk and drop unfinished builds."""
+        builds = self.base_dir / BUILDS_DIR_NAME
+        shutil.rmtree(builds, ignore_errors=True)
+        builds.mkdir(parents=True, exist_ok=True)
+
+        for directory in sorted(self.base_dir.iterdir(), key=lambda path: path.stat().st_atime):
+            if directory.is_dir() and directory.name != BUILDS_DIR_NAME:
+                self.environments[directory.name] = Environment(directory.name, directory_size(directory))
+
+    async def close(self):
+        if self.load_task is not None:
+            self.load_task.cancel()
+        for task in self.builds.values():
+            task.cancel()
+
+    async def acquire(self, requirements: bytes) -> str:
+        """
+        Get the environment of a project's requirements, building it if needed.
+        It is not evicted until released.
+
+        Args:
+            requirements (bytes): Content of the project's requirements file
+
+        Returns:
+            str: Digest of the environment
+
+        Raises:
+            RequirementsError: If the requirements can't be resolved or installed
+        """
+        if self.load_task is not None and not self.load_task.done():
+            await asyncio.shield(self.load_task)
+        if self.sandbox_version is None:
+            raise RequirementsError("Packages can't be installed right now, try again later")
+
+        digest, wheels = await self.resolve(requirements)
+        if digest in self.environments:
+            self.reused += 1
+        # Loops when the environment is evicted again before this waiter resumes
+        while (environment := self.environments.get(digest)) is None:
+            if digest not in self.builds:
+                self.builds[digest] = asyncio.create_task(self.build(digest, wheels))
+            await asyncio.shield(self.builds[digest])
+
+        environment.references += 1
+        self.environments.move_to_end(digest)
+        return digest
+
+    def release(self, digest: str):
+        """Drop a run's reference to an environment (see acquire)."""
+        environment = self.environments.get(digest)
+        if environment is not None:
+            environment.references -= 1
+        self.evict()
+
+    @staticmethod
+    def environment(digest: str) -> dict:
+        """
+        Returns:
+            dict: Environment variables of a run using the environment
+        """
+        return {"PYTHONPATH": f"{SANDBOX_ENVIRONMENTS_DIR}/{digest}"}
+
+    async def resolve(self, requirements: bytes) -> tuple:
+        """
+        Resolve requirements against the wheelhouse.
+
+        Returns:
+            tuple: (digest of the resolved wheels, paths of the wheels)
+        """
+        key = hashlib.sha256(requirements).hexdigest()
+        mtime = self.wheelhouse.stat().st_mtime_ns
+        if mtime != self.wheelhouse_mtime:
+            self.resolutions.clear()
+            self.wheelhouse_mtime = mtime
+        if key in self.resolutions:
+            self.resolutions.move_to_end(key)
+            return self.resolutions[key]
+
+        lines = parse_requirements(requirements.decode(errors='replace'))
+        with tempfile.TemporaryDirectory() as directory:
+            requirements_path = os.path.join(directory, REQUIREMENTS_FILE)
+            with open(requirements_path, 'w') as file:
+                file.write('\n'.join(lines) + '\n')
+            # pip only targets another Python version with --target, which a dry run leaves empty
+            output = await self.pip(
+                '--dry-run', '--quiet', '--report', '-', '--target', os.path.join(directory, 'target'),
+                '--find-links', str(self.wheelhouse), '--python-version', self.sandbox_version, '-r', requirements_path
+            )
+
+        try:
+            report = json.loads(output)
+            installs = [(item['metadata']['name'], item['metadata']['version'], item['download_info']['url'])
+                        for item in report['install']]
+        except (ValueError, KeyError, TypeError):
+            raise RequirementsError("Couldn't resolve the requirements")
+
+        wheels = sorted(unquote(urlparse(url).path) for _, _, url in installs)
+        resolved = '\n'.join(sorted(f"{name.lower()}=={version}" for name, version, _ in installs))
+        digest = hashlib.sha256(f"{self.sandbox_version}\n{resolved}".encode()).hexdigest()[:32]
+
+        self.resolved += 1
+        self.resolutions[key] = (digest, wheels)
+        while len(self.resolutions) > RESOLUTION_CACHE_SIZE:
+            self.resolutions.popitem(last=False)
+        return digest, wheels
+
+    async def build(self, digest: str, wheels: list) -> Environment:
+        """
+        Install resolved wheels into a new environment directory.
+
+        Returns:
+            Environment: The built environment
+        """
+        start = time.monotonic()
+        staging = self.base_dir / BUILDS_DIR_NAME / f"{digest}-{uuid.uuid4().hex[:8]}"
+        try:
+            if wheels:
+                await self.pip(
+                    '--quiet', '--no-deps', '--target', str(staging), '--python-version', self.sandbox_version, *wheels
+                )
+            else:
+                staging.mkdir()
+            size = await asyncio.to_thread(directory_size, staging)
+            staging.rename(self.base_dir / digest)
+        finally:
+            self.builds.pop(digest, None)
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+
+        environment = Environment(digest, size)
+        self.environments[digest] = environment
+        self.built += 1
+        self.build_time_total += time.monotonic() - start
+        self.logger.log_connection_event(
+            Level.LEVEL_INFO, Event.SANDBOX_POOL,
+            message=f"Built environment {digest} ({len(wheels)} packages, {size} bytes)"
+        )
+        return environment
+
+    async def pip(self, *args: str) -> bytes:
+        """
+        Run pip in one of the worker slots.
+
+        Returns:
+            bytes: Standard output of pip
+
+        Raises:
+            RequirementsError: With pip's error if it failed or timed out
+        """
+        async with self.slots:
+            process = await asyncio.create_subprocess_exec(
+                *PIP_COMMAND, *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env={**os.environ, "PIP_CONFIG_FILE": os.devnull}
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self.failed += 1
+                raise RequirementsError("Installing the requirements timed out")
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+
+        if process.returncode != 0:
+            self.failed += 1
+            raise RequirementsError(pip_error(stderr))
+        return stdout
+
+    def evict(self):
+        """Remove least recently used unreferenced environments while over the size bound."""
+        total = sum(environment.size for environment in self.environments.values())
+        for digest, environment in list(self.environments.items()):
+            if total <= self.max_bytes:
+                break
+            if environment.references > 0:
+                continue
+            del self.environments[digest]
+            total -= environment.size
+            self.evicted += 1
+            # Renamed first, so a rebuild never finds a half removed directory
+            trash = self.base_dir / BUILDS_DIR_NAME / f"evicted-{digest}-{uuid.uuid4().hex[:8]}"
+            try:
+                (self.base_dir / digest).rename(trash)
+            except OSError:
+                continue
+            asyncio.get_running_loop().run_in_executor(None, shutil.rmtree, trash, True)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Built, reused, evicted and failed environments, their size and build time (ms)
+        """
+        avg = self.build_time_total / self.built if self.built else 0.0
+        return {
+            "enabled": self.enabled,
+            "sandbox_version": self.sandbox_version,
+            "environments": len(self.environments),
+            "bytes": sum(environment.size for environment in self.environments.values()),
+            "in_use": sum(1 for environment in self.environments.values() if environment.references),
+            "resolved": self.resolved,
+            "built": self.built,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "failed": self.failed,
+            "build_ms_avg": round(avg * 1000, 2),
+        }
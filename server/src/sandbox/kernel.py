@@ -0,0 +1,235 @@
+"""
+Persistent REPL kernels for incremental execution.
+
+Every EXEC starts a fresh interpreter, so users iterating on a slow setup
+(heavy imports, big data structures) pay for it on every run. A kernel is a
+long-lived interpreter (server/docker/kernel.py) in a sandbox taken from the
+pool and held by a single client session; code cells run one after the
+other in the same namespace.
+
+Lifecycle:
+    1. The first cell of a session starts the kernel in a pooled sandbox
+       (with the user's project copied in, so cells can import it)
+    2. Cells are sent over the kernel's stdin, their output and events come
+       back like those of a launcher run (see supervisor.py)
+    3. An interrupt sends SIGINT, raising KeyboardInterrupt in the running cell
+    4. A restart replaces the kernel with a fresh one in a fresh sandbox
+    5. A kernel idle for longer than the idle timeout is shut down and its
+       sandbox reclaimed, as are the kernels of closed sessions
+
+The sandbox's lease is renewed whenever a cell starts or ends, so the reaper
+only ever reaps the sandbox of a kernel nobody watches anymore.
+
+Environment Variables:
+    KERNEL_ENABLED: "true"/"false" - Allow kernel sessions (default: true)
+    KERNEL_IDLE_TIMEOUT: Seconds without a cell after which a kernel is shut down (default: 300)
+    KERNEL_MAX_SESSIONS: Max number of kernels alive at once, over all clients (default: 8)
+"""
+
+import asyncio
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+
+from sandbox import supervisor
+from sandbox.pool import Sandbox, SandboxPool
+
+DEFAULT_IDLE_TIMEOUT = 300  # seconds
+DEFAULT_MAX_SESSIONS = 8
+TIMEOUT_STATUS = 124  # Status of a cell stopped at the execution timeout (like `timeout`)
+INTERRUPT_GRACE = 2  # Seconds a timed out cell gets to handle the interrupt before the kernel is restarted
+
+# Kernel states reported to clients
+STATE_STARTED = 'started'
+STATE_RESTARTED = 'restarted'
+STATE_STOPPED = 'stopped'
+STATE_EXPIRED = 'expired'  # Shut down after the idle timeout
+STATE_DIED = 'died'  # The interpreter exited (e.g. os._exit or the memory limit)
+
+
+class KernelManager:
+    """
+    Limits and statistics of the kernels of all sessions.
+
+    Attributes:
+        pool (SandboxPool): Pool kernels take their sandboxes from
+        enabled (bool): Whether kernel sessions are allowed
+        idle_timeout (float): Seconds without a cell after which a kernel is shut down
+        max_sessions (int): Max number of kernels alive at once
+        cell_lease (float): Seconds a single cell may keep the sandbox busy
+        sessions (set): Kernels alive
+    """
+
+    def __init__(self, pool: SandboxPool, cell_lease: float, enabled: bool = None, idle_timeout: float = None,
+                 max_sessions: int = None):
+        load_dotenv()
+        self.pool = pool
+        self.cell_lease = cell_lease
+        self.enabled = enabled if enabled is not None else os.getenv("KERNEL_ENABLED", "true").lower() == "true"
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(
+            os.getenv("KERNEL_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT)
+        )
+        self.max_sessions = max_sessions if max_sessions is not None else int(
+            os.getenv("KERNEL_MAX_SESSIONS", DEFAULT_MAX_SESSIONS)
+        )
+        self.sessions: set[KernelSession] = set()
+
+        # Statistics
+        self.started = 0
+        self.start_failures = 0
+        self.cells = 0
+        self.interrupts = 0
+        self.stopped = {STATE_STOPPED: 0, STATE_EXPIRED: 0, STATE_DIED: 0}
+
+    async def start(self, prepare=None, on_expire=None) -> 'KernelSession | None':
+        """
+        Start a kernel in a pooled sandbox.
+
+        Args:
+            prepare (coroutine function): Optional setup run on the sandbox before the kernel starts
+            on_expire (coroutine function): Called with the kernel after it was shut down for being idle
+
+        Returns:
+            KernelSession | None: The kernel, None if kernels are disabled, the
+                                  session limit is reached or the sandbox failed
+        """
+        if not self.enabled or len(self.sessions) >= self.max_sessions:
+            return None
+
+        session = KernelSession(self, on_expire)
+        self.sessions.add(session)  # Counted right away, so concurrent starts respect the limit
+        if not await session.start(prepare):
+            self.sessions.discard(session)
+            self.start_failures += 1
+            return None
+
+        self.started += 1
+        return session
+
+    async def close(self):
+        """Shut down all kernels."""
+        await asyncio.gather(*(session.close() for session in list(self.sessions)))
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Kernels alive, started and stopped (per reason), cells and interrupts
+        """
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "started": self.started,
+            "start_failures": self.start_failures,
+            "cells": self.cells,
+            "interrupts": self.interrupts,
+            "stopped": dict(self.stopped),
+        }
+
+
+class KernelSession:
+    """
+    A kernel held by a client session.
+
+    Attributes:
+        manager (KernelManager): Manager of all kernels
+        sandbox (Sandbox): Sandbox the kernel runs in
+        process: Kernel process (see SandboxBackend.exec)
+        busy (bool): Whether a cell is running
+        last_used (float): Monotonic time the last cell ended
+    """
+
+    def __init__(self, manager: KernelManager, on_expire=None):
+        self.manager = manager
+        self.on_expire = on_expire
+        self.sandbox: Sandbox | None = None
+        self.process = None
+        self.busy = False
+        self.last_used = time.monotonic()
+        self.idle_task = None
+
+    @property
+    def lease(self) -> float:
+        return self.manager.idle_timeout + self.manager.cell_lease
+
+    async def start(self, prepare=None) -> bool:
+        pool = self.manager.pool
+        self.sandbox = await pool.acquire(lease=self.lease)
+        if self.sandbox is None:
+            return False
+
+        # Cells change the sandbox, it must not be reused
+        self.sandbox.used = True
+        try:
+            if prepare:
+                await prepare(self.sandbox)
+            self.process = await pool.backend.exec(self.sandbox.name, supervisor.kernel_command())
+        except (OSError, ProcessLookupError):
+            await pool.release(self.sandbox)
+            self.sandbox = None
+            return False
+
+        self.idle_task = asyncio.create_task(self.idle_watch())
+        return True
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def send(self, op: str, **fields):
+        """Write a request to the kernel's stdin (see server/docker/kernel.py)."""
+        try:
+            self.process.stdin.write(supervisor.kernel_request(op, **fields))
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Kernel exited, reading its side channel reports it
+
+    def reserve(self):
+        """Mark the kernel busy ahead of a cell (e.g. while it waits for admission)."""
+        self.busy = True
+        self.manager.pool.renew(self.sandbox, self.lease)
+
+    async def run(self, code: str):
+        """Start running a cell. Its output and events are read by the caller."""
+        self.reserve()
+        self.manager.cells += 1
+        await self.send("cell", code=code)
+
+    def finished(self):
+        """Mark the running cell as finished."""
+        self.busy = False
+        self.last_used = time.monotonic()
+        self.manager.pool.renew(self.sandbox, self.lease)
+
+    async def interrupt(self):
+        """Raise KeyboardInterrupt in the running cell (ignored between cells)."""
+        self.manager.interrupts += 1
+        await self.manager.pool.backend.signal(self.sandbox.name, signal.SIGINT)
+
+    async def idle_watch(self):
+        while True:
+            await asyncio.sleep(max(self.last_used + self.manager.idle_timeout - time.monotonic(), 0.1))
+            if not self.busy and time.monotonic() - self.last_used >= self.manager.idle_timeout:
+                break
+
+        self.idle_task = None  # Don't cancel this task while it closes the kernel
+        await self.close(STATE_EXPIRED)
+        if self.on_expire:
+            await self.on_expire(self)
+
+    async def close(self, reason: str = STATE_STOPPED):
+        """Kill the kernel and give its sandbox back to the pool (which destroys it)."""
+        if self not in self.manager.sessions:
+            return
+        self.manager.sessions.discard(self)
+        self.manager.stopped[reason] += 1
+
+        if self.idle_task is not None:
+            self.idle_task.cancel()
+        if self.alive():
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        await self.manager.pool.release(self.sandbox)
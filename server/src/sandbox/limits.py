@@ -0,0 +1,328 @@
+"""
+Load-adaptive resource limits of the sandboxes of running executions.
+
+Sandboxes are started with the base limits (SANDBOX_LIMITS), which every
+run is guaranteed. When a run starts in a sandbox its limits are set from
+the host's headroom and the number of active runs, and the limits of the
+running sandboxes are adjusted live as the load changes.
+
+Policy:
+    CPU: The host's CPUs are shared evenly by the active runs, capped at
+         SANDBOX_MAX_CPUS, so a run alone on an idle host gets more than
+         the base. The allowance above the base is scaled by the headroom
+         scale (below)
+    Memory: The base plus a share of MEMORY_SHARE of the host's available
+            memory, less the memory already granted above the base to active
+            runs, capped at SANDBOX_MAX_MEMORY and scaled by the headroom
+            scale. The memory limit of a running sandbox is only ever raised,
+            lowering it below the run's usage would OOM kill the run
+    Processes: Always the base
+
+Headroom:
+    The host's CPU busy time (/proc/stat, since the previous sample) and
+    available memory (/proc/meminfo) are sampled every
+    SANDBOX_LIMITS_INTERVAL seconds. Under pressure (CPU busier than
+    PRESSURE_CPU or available memory below PRESSURE_MEMORY) the headroom
+    scale is halved, when the host is idle again (CPU below IDLE_CPU) it
+    recovers by RECOVERY_STEP per sample. The gap between the thresholds
+    keeps the limits from flapping when runs use their raised allowance.
+
+Backends:
+    The docker backend (`docker update`) and the namespace backend with
+    cgroup limits change limits in place. Sandboxes of other backends
+    (rlimits, remote runner hosts, whose load the server doesn't see) keep
+    the base limits.
+
+Reports:
+    Every run's limits are reported with its usage: those it started with,
+    the range its CPU allowance moved in and the number of live updates.
+    Results of runs whose limits went above the base are not cached, the
+    result cache keys assume the base limits.
+
+Environment Variables:
+    SANDBOX_ADAPTIVE_LIMITS: "true"/"false" - Adapt the limits to the host's load (default: true)
+    SANDBOX_MAX_CPUS: Max CPUs of a run (default: 2)
+    SANDBOX_MAX_MEMORY: Max memory of a run in bytes (default: 512 MiB)
+    SANDBOX_LIMITS_INTERVAL: Seconds between samples of the host's load (default: 1)
+"""
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from sandbox.pool import SANDBOX_LIMITS
+from utils.logger import (
+    Logger,
+    Level,
+    Event
+    )
+
+DEFAULT_MAX_CPUS = 2.0
+DEFAULT_MAX_MEMORY = 512 * 1024 * 1024
+DEFAULT_INTERVAL = 1.0  # seconds
+PRESSURE_CPU = 0.9  # Busy fraction of the host's CPU time
+IDLE_CPU = 0.7
+PRESSURE_MEMORY = 0.1  # Available fraction of the host's memory
+MEMORY_SHARE = 0.5  # Share of the host's available memory the active runs may be granted
+RECOVERY_STEP = 0.25
+CPU_STEP = 0.05  # CPU limits are multiples of this
+MEMORY_STEP = 1024 * 1024  # Memory limits are multiples of this
+
+PROC_STAT = '/proc/stat'
+PROC_MEMINFO = '/proc/meminfo'
+
+
+def read_cpu_times() -> tuple | None:
+    """
+    Returns:
+        tuple | None: (idle, total) time of all CPUs of the host in clock
+                      ticks, None if it couldn't be read
+    """
+    try:
+        with open(PROC_STAT) as file:
+            fields = file.readline().split()
+    except OSError:
+        return None
+    # user nice system idle iowait irq softirq steal (guest time is part of user)
+    times = [int(value) for value in fields[1:9] if value.isdigit()]
+    if fields[:1] != ['cpu'] or len(times) < 5:
+        return None
+    return times[3] + times[4], sum(times)
+
+
+def read_memory() -> tuple | None:
+    """
+    Returns:
+        tuple | None: (available, total) memory of the host in bytes, None if it couldn't be read
+    """
+    values = {}
+    try:
+        with open(PROC_MEMINFO) as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key in ('MemAvailable', 'MemTotal'):
+                    values[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    if len(values) < 2:
+        return None
+    return values['MemAvailable'], values['MemTotal']
+
+
+class LimitsPolicy:
+    """
+    Sets and adjusts the resource limits of the sandboxes of active runs.
+
+    Attributes:
+        backend (SandboxBackend): Backend managing the sandboxes
+        base (dict): Limits sandboxes are started with, the minimum of every run
+        enabled (bool): Whether limits adapt to the host's load
+        max_cpus (float): Max CPUs of a run
+        max_memory (int): Max memory of a run in bytes
+        interval (float): Seconds between samples of the host's load
+        cpu_count (int): Number of CPUs of the host
+        scale (float): Share of the allowance above the base runs get (see module docstring)
+        cpu_busy (float): Busy fraction of the host's CPU time in the last interval
+        memory_available (int): Available memory of the host in bytes, None if unknown
+        memory_total (int): Memory of the host in bytes, None if unknown
+        active (dict): Maps sandbox name -> (Sandbox, report) of the active runs
+    """
+
+    def __init__(self, backend, base: dict = None, enabled: bool = None, max_cpus: float = None,
+                 max_memory: int = None, interval: float = None):
+        load_dotenv()
+        self.backend = backend
+        self.base = base or SANDBOX_LIMITS
+        self.enabled = enabled if enabled is not None else os.getenv("SANDBOX_ADAPTIVE_LIMITS", "true").lower() == "true"
+        self.max_cpus = max_cpus if max_cpus is not None else float(os.getenv("SANDBOX_MAX_CPUS", DEFAULT_MAX_CPUS))
+        self.max_memory = max_memory if max_memory is not None else int(
+            os.getenv("SANDBOX_MAX_MEMORY", DEFAULT_MAX_MEMORY)
+        )
+        self.interval = interval if interval is not None else float(
+            os.getenv("SANDBOX_LIMITS_INTERVAL", DEFAULT_INTERVAL)
+        )
+        self.logger = Logger()
+
+        self.cpu_count = os.cpu_count() or 1
+        self.scale = 1.0
+        self.cpu_busy = 0.0
+        self.cpu_times = None
+        self.memory_available = None
+        self.memory_total = None
+        self.under_pressure = False
+        self.active: dict[str, tuple] = {}
+        self.task = None
+
+        # Statistics
+        self.updates = 0
+        self.failed_updates = 0
+        self.pressure_events = 0
+
+    @property
+    def live(self) -> bool:
+        """Whether the limits of running sandboxes are adapted."""
+        return self.enabled and self.backend.live_limits
+
+    def start(self):
+        """Sample the host's load in the background and adjust the limits of active runs."""
+        if self.live:
+            self.sample()
+            self.task = asyncio.create_task(self.adjust_loop())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def sample(self):
+        """Measure the host's CPU and memory headroom and update the headroom scale."""
+        cpu_times = read_cpu_times()
+        if cpu_times is not None and self.cpu_times is not None:
+            idle = cpu_times[0] - self.cpu_times[0]
+            total = cpu_times[1] - self.cpu_times[1]
+            if total > 0:
+                self.cpu_busy = 1 - idle / total
+        self.cpu_times = cpu_times
+
+        memory = read_memory()
+        if memory is not None:
+            self.memory_available, self.memory_total = memory
+        memory_low = memory is not None and self.memory_available < self.memory_total * PRESSURE_MEMORY
+
+        if self.cpu_busy >= PRESSURE_CPU or memory_low:
+            self.scale = self.scale / 2 if self.scale > CPU_STEP else 0.0
+            if not self.under_pressure:
+                self.under_pressure = True
+                self.pressure_events += 1
+                self.logger.log_connection_event(
+                    Level.LEVEL_INFO, Event.SANDBOX_POOL,
+                    message=f"Host under pressure (CPU {self.cpu_busy:.0%} busy), shrinking sandbox limits"
+                )
+        elif self.cpu_busy <= IDLE_CPU:
+            self.scale = min(1.0, self.scale + RECOVERY_STEP)
+            self.under_pressure = False
+
+    def target(self, runs: int) -> dict:
+        """
+        Args:
+            runs (int): Number of active runs
+
+        Returns:
+            dict: Limits of a run (see module docstring)
+        """
+        runs = max(1, runs)
+        base_cpus, base_memory = self.base['cpus'], self.base['memory']
+
+        cpus = min(self.max_cpus, self.cpu_count / runs)
+        cpus = max(base_cpus, base_cpus + (cpus - base_cpus) * self.scale)
+
+        memory = base_memory
+        if self.memory_available is not None:
+            headroom = max(0.0, self.memory_available * MEMORY_SHARE - self.granted_memory())
+            memory = min(self.max_memory, base_memory + headroom / runs)
+            memory = max(base_memory, base_memory + (memory - base_memory) * self.scale)
+
+        return {
+            "cpus": max(base_cpus, round(round(cpus / CPU_STEP) * CPU_STEP, 2)),
+            "memory": max(base_memory, int(memory // MEMORY_STEP * MEMORY_STEP)),
+            "pids": self.base['pids'],
+        }
+
+    def granted_memory(self) -> int:
+        """
+        Returns:
+            int: Memory granted to the active runs above the base, in bytes
+        """
+        return sum(sandbox.limits['memory'] - self.base['memory'] for sandbox, _ in self.active.values())
+
+    def raised(self, report: dict | None) -> bool:
+        """
+        Args:
+            report (dict | None): Report of a run's limits (see release())
+
+        Returns:
+            bool: Whether the run's limits went above the base at any time
+        """
+        return report is not None and (report['cpus_max'] > self.base['cpus'] or report['memory_max'] > self.base['memory'])
+
+    async def admit(self, sandbox):
+        """
+        Set the limits of a sandbox a run starts in and track it until release().
+
+        Args:
+            sandbox (Sandbox): The run's sandbox
+        """
+        if self.live:
+            await self.apply(sandbox, self.target(len(self.active) + 1))
+        limits = sandbox.limits
+        report = {**limits, "cpus_min": limits['cpus'], "cpus_max": limits['cpus'], "memory_max": limits['memory'],
+                  "updates": 0}
+        self.active[sandbox.name] = (sandbox, report)
+
+    def release(self, sandbox) -> dict | None:
+        """
+        Stop adjusting the limits of a sandbox whose run finished.
+
+        Returns:
+            dict | None: Report of the run's limits (see module docstring), None if it wasn't admitted
+        """
+        _, report = self.active.pop(sandbox.name, (None, None))
+        return report
+
+    async def apply(self, sandbox, limits: dict) -> bool:
+        """
+        Change the limits of a running sandbox if they differ, never lowering its memory.
+
+        Returns:
+            bool: Whether the limits were changed
+        """
+        limits = {**limits, "memory": max(limits['memory'], sandbox.limits['memory'])}
+        if abs(limits['cpus'] - sandbox.limits['cpus']) < CPU_STEP / 2 and limits['memory'] == sandbox.limits['memory']:
+            return False
+
+        if not await self.backend.update_limits(sandbox.name, limits):
+            self.failed_updates += 1
+            return False
+        self.updates += 1
+        sandbox.limits = limits
+        return True
+
+    async def adjust_loop(self):
+        """Adjust the limits of the active runs to the host's load, every `interval` seconds."""
+        while True:
+            await asyncio.sleep(self.interval)
+            self.sample()
+            if not self.active:
+                continue
+
+            limits = self.target(len(self.active))
+            active = list(self.active.values())
+            changed = await asyncio.gather(*(self.apply(sandbox, limits) for sandbox, _ in active))
+            for (sandbox, report), updated in zip(active, changed):
+                if updated:
+                    report["cpus_min"] = min(report["cpus_min"], sandbox.limits['cpus'])
+                    report["cpus_max"] = max(report["cpus_max"], sandbox.limits['cpus'])
+                    report["memory_max"] = max(report["memory_max"], sandbox.limits['memory'])
+                    report["updates"] += 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Host headroom, the limits a new run would get and live update counters
+        """
+        return {
+            "enabled": self.enabled,
+            "live": self.live,
+            "cpu_busy": round(self.cpu_busy, 3),
+            "memory_available_bytes": self.memory_available,
+            "scale": self.scale,
+            "active_runs": len(self.active),
+            "next_run_limits": self.target(len(self.active) + 1) if self.live else dict(self.base),
+            "updates": self.updates,
+            "failed_updates": self.failed_updates,
+            "pressure_events": self.pressure_events,
+        }
@@ -0,0 +1,528 @@
+"""
+Namespace sandbox backend: sandboxes without a container daemon.
+
+A sandbox is a root directory with the python_runner layout, entered by
+`unshare` in fresh user, mount, PID, network, IPC and UTS namespaces and
+made their root with pivot_root (the host's root is detached, not just out
+of reach as after a chroot). The host's /usr is bind mounted read-only
+(sandboxes run the host's python3), the runner files (server/docker) at
+/opt/codebox, and a /proc of the sandbox's own PID namespace. Commands are started inside with
+`nsenter`. Starting a sandbox costs a few fork/execs instead of a container.
+
+Layout of a sandbox directory (SANDBOX_NAMESPACE_DIR/<name>):
+    root/        Root directory of the sandbox
+    pycache/     Writable mirror of the working directory in the bytecode cache
+    labels.json  Labels of the sandbox
+    pid          Host PID of the `unshare` process (to kill sandboxes left
+                 behind by an earlier server process)
+
+The bytecode cache directory (see bytecode_cache.py) is a read-only seed with
+the bytecode of the standard library, shared by all sandboxes and compiled
+when the backend starts its first sandbox.
+
+Differences to Docker sandboxes:
+    - No image: the host's /usr provides python3 and the tools the server runs
+      (sh, timeout, tar, cat). image_id() identifies the interpreter and the
+      runner files instead
+    - Commands run as sandboxuser (uid 1000) of the sandbox's user namespace,
+      without capabilities and with no_new_privs set. The namespace maps uid
+      1000 to the user running the server (which should therefore not be
+      root), its root user is unmapped
+    - Limits are enforced by cgroup v2 when a delegated cgroup is configured.
+      Otherwise memory, processes and CPU time are limited by rlimits
+      (RLIMIT_DATA, RLIMIT_NPROC, RLIMIT_CPU: the sandbox's CPUs for the
+      longest lease, per process). Only cgroup limits can be changed while a
+      sandbox runs (see limits.py)
+
+Environment Variables:
+    SANDBOX_NAMESPACE_DIR: Directory holding the sandboxes (default: /tmp/codebox-sandboxes)
+    SANDBOX_CGROUP: Writable cgroup v2 directory, with the cpu, memory and pids
+                    controllers enabled for its children, sandboxes get a child cgroup of (default: none)
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import shutil
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from sandbox.backend import SandboxBackend
+from sandbox.bytecode_cache import PROJECT_CACHE_DIR, SANDBOX_CACHE_DIR
+from sandbox.pool import DEFAULT_MAX_LEASE, SANDBOX_WORKDIR
+
+DEFAULT_NAMESPACE_DIR = '/tmp/codebox-sandboxes'
+RUNNER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'docker'))
+SANDBOX_PATH = '/usr/local/bin:/usr/bin:/bin'
+SANDBOX_HOME = '/home/sandboxuser'
+SANDBOX_UID = 1000
+OLD_ROOT = '/.oldroot'  # Where pivot_root puts the host's root until it is detached
+START_TIMEOUT = 5  # Seconds
+CGROUP_PERIOD = 100000  # cpu.max period in microseconds
+
+# Top-level host directories shared with sandboxes (symlinks are replicated, directories bind mounted)
+HOST_DIRS = ['usr', 'bin', 'sbin', 'lib', 'lib32', 'lib64', 'libx32']
+HOST_ETC_FILES = ['ld.so.cache', 'localtime']
+DEVICES = ['null', 'zero', 'random', 'urandom']
+
+ETC_FILES = {
+    'passwd': f"root:x:0:0:root:/root:/bin/sh\nsandboxuser:x:{SANDBOX_UID}:{SANDBOX_UID}::{SANDBOX_HOME}:/bin/sh\n",
+    'group': f"root:x:0:\nsandboxuser:x:{SANDBOX_UID}:\n",
+    'hosts': "127.0.0.1 localhost\n",
+}
+
+# The setup runs as sandboxuser with the namespace's capabilities (kept as ambient capabilities)
+UNSHARE_ARGS = [
+    "--user", f"--map-user={SANDBOX_UID}", f"--map-group={SANDBOX_UID}", "--keep-caps",
+    "--mount", "--pid", "--fork", "--kill-child", "--net", "--ipc", "--uts", "--propagation", "private",
+]
+NSENTER_ARGS = ["--user", "--mount", "--pid", "--net", "--ipc", "--uts", "--root",
+                "-S", str(SANDBOX_UID), "-G", str(SANDBOX_UID)]
+# Drops every capability before a sandbox command starts. Supplementary groups
+# are kept: setgroups() is denied in an unprivileged user namespace
+DROP_PRIVILEGES = ["setpriv", f"--reuid={SANDBOX_UID}", f"--regid={SANDBOX_UID}", "--keep-groups",
+                   "--inh-caps=-all", "--no-new-privs"]
+
+# umount(8) refuses non-root users, so the old root is detached with umount2(MNT_DETACH)
+DETACH_OLD_ROOT = (
+    "import ctypes, os; libc = ctypes.CDLL(None, use_errno=True)\n"
+    f"if libc.umount2(b'{OLD_ROOT}', 2) != 0: raise OSError(ctypes.get_errno(), 'umount2')\n"
+    f"os.rmdir('{OLD_ROOT}')"
+)
+
+# Runs inside the new namespaces: mounts the shared directories into the
+# sandbox root, pivots into it and becomes the sandbox's main process in it.
+# Arguments: sandbox directory, runner directory, bytecode seed, cgroup (or ""),
+# number of mounts, host directory and sandbox path of each mount, command...
+SETUP_SCRIPT = f"""
+set -e
+S=$1; RUNNER=$2; SEED=$3; CGROUP=$4; MOUNTS=$5; shift 5
+R=$S/root
+bind_ro() {{ mount --bind "$1" "$2"; mount -o remount,bind,ro "$2"; }}
+mount --bind "$R" "$R"  # pivot_root needs the new root to be a mount point
+while [ "$MOUNTS" -gt 0 ]; do bind_ro "$1" "$R$2"; shift 2; MOUNTS=$((MOUNTS - 1)); done
+for d in {' '.join(HOST_DIRS)}; do
+    if [ -d "/$d" ] && [ ! -L "/$d" ]; then bind_ro "/$d" "$R/$d"; fi
+done
+for f in {' '.join(HOST_ETC_FILES)}; do
+    if [ -f "$R/etc/$f" ]; then bind_ro "/etc/$f" "$R/etc/$f"; fi
+done
+for f in {' '.join(DEVICES)}; do bind_ro "/dev/$f" "$R/dev/$f"; done
+bind_ro "$RUNNER" "$R/opt/codebox"
+bind_ro "$SEED" "$R{SANDBOX_CACHE_DIR}"
+mount --bind "$S/pycache" "$R{PROJECT_CACHE_DIR}"
+if [ -n "$CGROUP" ]; then bind_ro "$CGROUP" "$R/sys/fs/cgroup"; fi
+mount -t proc proc "$R/proc"
+cd "$R"
+pivot_root . "{OLD_ROOT.lstrip('/')}"
+PATH={SANDBOX_PATH} python3 -I -S -c "{DETACH_OLD_ROOT}"
+exec {' '.join(DROP_PRIVILEGES)} /usr/bin/env -i PATH={SANDBOX_PATH} HOME={SANDBOX_HOME} "$@"
+"""
+
+
+def child_pid(pid: int) -> int | None:
+    """
+    Returns:
+        int | None: PID of a child process of `pid`, None if it has none (yet)
+    """
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as file:
+            children = file.read().split()
+        return int(children[0]) if children else None
+    except FileNotFoundError:
+        pass  # Kernel without CONFIG_PROC_CHILDREN
+
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as file:
+                    # The command name (field 2) may contain spaces, the parent PID follows it
+                    if int(file.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        return int(entry)
+            except (OSError, IndexError, ValueError):
+                continue
+    return None
+
+
+def dropped_privileges(pid: int) -> bool:
+    """
+    Returns:
+        bool: Whether a process has no effective capabilities left (the setup
+              of a sandbox runs with them, its main process without)
+    """
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            if line.startswith('CapEff:'):
+                return int(line.split()[1], 16) == 0
+    return False
+
+
+def valid_mount_point(point: str) -> bool:
+    """Whether a sandbox path can be mounted on: absolute and without `..`, so it stays inside the root."""
+    return point.startswith('/') and '..' not in point.split('/')
+
+
+def make_root(directory: Path, mount_points: list = ()):
+    """Create the skeleton of a sandbox directory (see module docstring)."""
+    if not all(valid_mount_point(point) for point in mount_points):
+        raise ValueError(f"Invalid mount point in {mount_points}")
+    root = directory / 'root'
+    for path in ['etc', 'dev/shm', 'proc', 'tmp', 'opt/codebox', 'sys/fs/cgroup', OLD_ROOT.lstrip('/'),
+                 SANDBOX_WORKDIR.lstrip('/'), SANDBOX_CACHE_DIR.lstrip('/'),
+                 *(point.lstrip('/') for point in mount_points)]:
+        (root / path).mkdir(parents=True, exist_ok=True)
+    (root / 'tmp').chmod(0o1777)
+    (directory / 'pycache').mkdir()
+    (directory / 'pycache').chmod(0o777)
+
+    for name in HOST_DIRS:
+        host = Path('/', name)
+        if host.is_symlink():
+            (root / name).symlink_to(os.readlink(host))
+        elif host.is_dir():
+            (root / name).mkdir()
+
+    for name, content in ETC_FILES.items():
+        (root / 'etc' / name).write_text(content)
+    for name in HOST_ETC_FILES:
+        if os.path.isfile(f'/etc/{name}'):
+            (root / 'etc' / name).touch()
+
+    for name in DEVICES:
+        (root / 'dev' / name).touch()
+    for fd, name in enumerate(['stdin', 'stdout', 'stderr']):
+        (root / 'dev' / name).symlink_to(f'/proc/self/fd/{fd}')
+    (root / 'dev' / 'fd').symlink_to('/proc/self/fd')
+
+
+def kill_leftover(directory: Path):
+    """Kill the `unshare` process of a sandbox started by an earlier server process."""
+    try:
+        pid = int((directory / 'pid').read_text())
+        with open(f'/proc/{pid}/cmdline', 'rb') as file:
+            cmdline = file.read()
+    except (OSError, ValueError):
+        return  # Not started or already gone
+
+    # Guard against the PID having been reused by an unrelated process
+    if str(directory).encode() in cmdline.split(b'\0'):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def seed_bytecode(seed: Path):
+    """Compile the standard library of the sandboxes' python3 into the bytecode seed."""
+    python = shutil.which("python3", path=SANDBOX_PATH)
+    if python is None:
+        return
+    subprocess.run(
+        [python, "-c", "import compileall, sysconfig; compileall.compile_dir(sysconfig.get_path('stdlib'), quiet=2)"],
+        env={"PATH": SANDBOX_PATH, "PYTHONPYCACHEPREFIX": str(seed)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def environment_id() -> str:
+    """
+    Returns:
+        str: Identity of the sandbox environment, from the interpreter and the runner files
+    """
+    digest = hashlib.sha256()
+    python = shutil.which("python3", path=SANDBOX_PATH)
+    if python is not None:
+        python = os.path.realpath(python)
+        stat = os.stat(python)
+        digest.update(f"{python}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    for name in sorted(os.listdir(RUNNER_DIR)):
+        path = os.path.join(RUNNER_DIR, name)
+        if os.path.isfile(path):
+            digest.update(name.encode())
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+
+    return f"namespace:{digest.hexdigest()}"
+
+
+def write_cgroup_limits(cgroup: Path, limits: dict):
+    """Apply resource limits to a sandbox's cgroup."""
+    (cgroup / 'cpu.max').write_text(f"{int(limits['cpus'] * CGROUP_PERIOD)} {CGROUP_PERIOD}")
+    (cgroup / 'memory.max').write_text(str(limits['memory']))
+    (cgroup / 'pids.max').write_text(str(limits['pids']))
+
+
+class NamespaceSandbox:
+    """
+    A running namespace sandbox.
+
+    Attributes:
+        process (asyncio.subprocess.Process): The `unshare` process, killing it kills the sandbox
+        directory (Path): Sandbox directory (see module docstring)
+        cgroup (Path): The sandbox's cgroup, None without cgroup limits
+        limiter (list): Command prefix applying the sandbox's limits (commands
+                        entering the sandbox with nsenter don't inherit them)
+        pid (int): Host PID of the sandbox's main process (PID 1 inside)
+    """
+
+    def __init__(self, process, directory: Path, cgroup: Path | None, limiter: list):
+        self.process = process
+        self.directory = directory
+        self.cgroup = cgroup
+        self.limiter = limiter
+        self.pid = None
+
+
+class NamespaceBackend(SandboxBackend):
+    """
+    Manages sandboxes as Linux namespaces set up with unshare / nsenter.
+
+    Attributes:
+        base_dir (Path): Directory holding the sandbox directories
+        cgroup_parent (Path): Delegated cgroup v2 directory, None to limit with rlimits
+        sandboxes (dict): Maps sandbox name -> NamespaceSandbox
+    """
+
+    name = 'namespace'
+
+    def __init__(self, base_dir: str = None, cgroup_parent: str = None):
+        load_dotenv()
+        self.base_dir = Path(base_dir or os.getenv("SANDBOX_NAMESPACE_DIR", DEFAULT_NAMESPACE_DIR))
+        cgroup_parent = cgroup_parent or os.getenv("SANDBOX_CGROUP")
+        self.cgroup_parent = Path(cgroup_parent) if cgroup_parent else None
+        self.sandboxes: dict[str, NamespaceSandbox] = {}
+        self.seed_dir = self.base_dir / 'pycache-seed'
+        self.seed_task = None
+
+        # Statistics
+        self.started = 0
+        self.failed = 0
+        self.start_time_total = 0.0
+
+    def start_seeding(self):
+        """Create the bytecode seed and compile it in the background (once)."""
+        if self.seed_task is not None:
+            return
+        # Mount point of the sandboxes' writable mirror of the working directory
+        (self.seed_dir / SANDBOX_WORKDIR.lstrip('/')).mkdir(parents=True, exist_ok=True)
+        self.seed_task = asyncio.create_task(asyncio.to_thread(seed_bytecode, self.seed_dir))
+
+    def make_cgroup(self, name: str, limits: dict) -> Path | None:
+        """
+        Create the cgroup of a sandbox with its limits applied.
+
+        Returns:
+            Path | None: The cgroup directory, None without a delegated cgroup
+        """
+        if self.cgroup_parent is None:
+            return None
+
+        cgroup = self.cgroup_parent / name
+        cgroup.mkdir()
+        write_cgroup_limits(cgroup, limits)
+        (cgroup / 'memory.swap.max').write_text("0")
+        return cgroup
+
+    @property
+    def live_limits(self) -> bool:
+        return self.cgroup_parent is not None
+
+    async def update_limits(self, name: str, limits: dict) -> bool:
+        sandbox = self.sandboxes.get(name)
+        if sandbox is None or sandbox.cgroup is None:
+            return False
+        try:
+            await asyncio.to_thread(write_cgroup_limits, sandbox.cgroup, limits)
+        except OSError:
+            return False
+        return True
+
+    async def start_sandbox(self, name: str, image: str, limits: dict, command: list, labels: dict = None,
+                            mounts: dict = None) -> bool:
+        """
+        Start a sandbox and wait until its main process runs inside its root.
+
+        Returns:
+            bool: Whether the sandbox was started
+        """
+        start = time.monotonic()
+        if '/' in name or name in self.sandboxes:
+            return False
+
+        self.start_seeding()
+        directory = self.base_dir / name
+        try:
+            await asyncio.to_thread(make_root, directory, list((mounts or {}).values()))
+            (directory / 'labels.json').write_text(json.dumps(labels or {}))
+            cgroup = await asyncio.to_thread(self.make_cgroup, name, limits)
+        except (OSError, ValueError):
+            await asyncio.to_thread(shutil.rmtree, directory, True)
+            self.failed += 1
+            return False
+
+        if cgroup is not None:
+            # Join the cgroup before creating or entering the namespaces, so every process of the sandbox is in it
+            limiter = ["sh", "-c", 'echo $$ > "$0/cgroup.procs" && exec "$@"', str(cgroup)]
+        else:
+            limiter = ["prlimit", f"--data={limits['memory']}", f"--nproc={limits['pids']}",
+                       f"--cpu={math.ceil(limits['cpus'] * DEFAULT_MAX_LEASE)}", "--"]
+
+        mount_args = [path for source, target in (mounts or {}).items() for path in (source, target)]
+        process = await asyncio.create_subprocess_exec(
+            *limiter, "unshare", *UNSHARE_ARGS,
+            "sh", "-c", SETUP_SCRIPT, "setup",
+            str(directory), RUNNER_DIR, str(self.seed_dir), str(cgroup or ''),
+            str(len(mounts or {})), *mount_args, *command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True
+        )
+        sandbox = NamespaceSandbox(process, directory, cgroup, limiter)
+        self.sandboxes[name] = sandbox
+        (directory / 'pid').write_text(str(process.pid))
+
+        sandbox.pid = await self.wait_ready(sandbox)
+        if sandbox.pid is None:
+            await self.kill_sandbox(name)
+            self.failed += 1
+            return False
+
+        self.started += 1
+        self.start_time_total += time.monotonic() - start
+        return True
+
+    async def wait_ready(self, sandbox: NamespaceSandbox) -> int | None:
+        """
+        Wait for the sandbox's main process to have dropped its privileges, which
+        it does once its root is set up.
+
+        Returns:
+            int | None: Host PID of the main process, None if the setup failed
+        """
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline and sandbox.process.returncode is None:
+            pid = child_pid(sandbox.process.pid)
+            try:
+                if pid is not None and dropped_privileges(pid):
+                    return pid
+            except OSError:
+                pass
+            await asyncio.sleep(0.002)
+        return None
+
+    async def kill_sandbox(self, name: str):
+        """Kill a sandbox (its PID namespace ends with `unshare`) and remove its directory and cgroup."""
+        sandbox = self.sandboxes.pop(name, None)
+        if sandbox is not None:
+            try:
+                sandbox.process.kill()
+            except ProcessLookupError:
+                pass
+            await sandbox.process.wait()
+            directory, cgroup = sandbox.directory, sandbox.cgroup
+        else:
+            # Possibly left behind by an earlier server process
+            directory = self.base_dir / name
+            if '/' in name or not (directory / 'labels.json').is_file():
+                return
+            await asyncio.to_thread(kill_leftover, directory)
+            cgroup = self.cgroup_parent / name if self.cgroup_parent is not None else None
+
+        await asyncio.to_thread(shutil.rmtree, directory, True)
+
+        if cgroup is not None:
+            # The cgroup can only be removed once the killed processes are gone
+            for _ in range(100):
+                try:
+                    cgroup.rmdir()
+                    break
+                except FileNotFoundError:
+                    break
+                except OSError:
+                    await asyncio.sleep(0.01)
+
+    def read_labels(self) -> dict:
+        """
+        Returns:
+            dict: Maps sandbox name -> labels, for every sandbox directory
+        """
+        labels = {}
+        if not self.base_dir.is_dir():
+            return labels
+        for directory in self.base_dir.iterdir():
+            try:
+                labels[directory.name] = json.loads((directory / 'labels.json').read_text())
+            except (OSError, ValueError):
+                continue  # Not a sandbox, or still being created
+        return labels
+
+    async def list_sandboxes(self, label: str) -> dict | None:
+        try:
+            sandboxes = await asyncio.to_thread(self.read_labels)
+        except OSError:
+            return None
+        return {name: labels[label] for name, labels in sandboxes.items() if label in labels}
+
+    async def exec(self, name: str, command: list, env: dict = None):
+        """
+        Start a command inside a sandbox with pipes for stdin/stdout/stderr.
+
+        Returns:
+            asyncio.subprocess.Process: The `nsenter` process
+        """
+        sandbox = self.sandboxes.get(name)
+        if sandbox is None or sandbox.pid is None:
+            raise ProcessLookupError(f"No running sandbox {name}")
+
+        env_args = [f"{key}={value}" for key, value in {"PATH": SANDBOX_PATH, "HOME": SANDBOX_HOME, **(env or {})}.items()]
+        # Not `nsenter --wd`: it opens the directory before entering the namespaces, leaving the
+        # command's working directory in the host's mount tree, out of the sandbox root
+        return await asyncio.create_subprocess_exec(
+            *sandbox.limiter, "nsenter", "-t", str(sandbox.pid), *NSENTER_ARGS, "--",
+            *DROP_PRIVILEGES, "/usr/bin/env", "-i", f"--chdir={SANDBOX_WORKDIR}", *env_args, *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+    async def copy_into(self, name: str, dest: str, archive: bytes):
+        """Extract a tar archive into a directory of the sandbox (with `tar` inside it)."""
+        process = await self.exec(name, ["tar", "-x", "-f", "-", "-C", dest])
+        await process.communicate(archive)
+
+    async def copy_from(self, name: str, path: str) -> bytes | None:
+        """
+        Returns:
+            bytes | None: Tar archive of a path of the sandbox, None if it doesn't exist
+        """
+        parent, base = os.path.split(path.rstrip('/'))
+        process = await self.exec(name, ["tar", "-c", "-f", "-", "-C", parent or '/', base])
+        stdout, _ = await process.communicate()
+        return stdout if process.returncode == 0 else None
+
+    async def image_id(self, image: str) -> str | None:
+        return await asyncio.to_thread(environment_id)
+
+    async def close(self):
+        await asyncio.gather(*(self.kill_sandbox(name) for name in list(self.sandboxes)))
+        if self.seed_task is not None:
+            await self.seed_task
+
+    def stats(self) -> dict:
+        avg = self.start_time_total / self.started if self.started else 0.0
+        return {
+            "backend": self.name,
+            "cgroup_limits": self.cgroup_parent is not None,
+            "sandboxes": len(self.sandboxes),
+            "started": self.started,
+            "failed": self.failed,
+            "start_ms_avg": round(avg * 1000, 2),
+        }
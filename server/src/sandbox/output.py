@@ -0,0 +1,267 @@
+"""
+Output pipeline for sandboxed program output.
+
+Program output arrives from the sandbox as arbitrary byte chunks. Decoding
+each chunk on its own breaks on multi-byte characters split across chunk
+boundaries, and forwarding every chunk as its own frame floods the client
+with tiny messages when a program prints a lot.
+
+This module provides:
+- OutputCoalescer: Incrementally decodes output (UTF-8) and coalesces it
+  into frames, flushed once a short time window passes or a size
+  threshold is reached
+- OutputBudget: Per-run output budget (total size and rate). Past the
+  budget only a ring buffer of the most recent output is kept
+- OutputStats: Aggregated frame statistics across runs
+
+Environment Variables:
+    OUTPUT_FLUSH_INTERVAL_MS: Max time output is held back before it is sent (default: 20)
+    OUTPUT_MAX_FRAME_BYTES: Size at which output is sent right away (default: 16384)
+    OUTPUT_MAX_BYTES: Total output sent per run (default: 1 MiB)
+    OUTPUT_MAX_RATE: Sustained output rate sent per run, bytes/sec (default: 128 KiB)
+    OUTPUT_TAIL_BYTES: Size of the most recent output kept past the budget (default: 8 KiB)
+"""
+
+import codecs
+import os
+import time
+
+from dotenv import load_dotenv
+
+DEFAULT_FLUSH_INTERVAL_MS = 20
+DEFAULT_MAX_FRAME_BYTES = 16384
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_MAX_RATE = 128 * 1024
+DEFAULT_TAIL_BYTES = 8 * 1024
+RATE_BURST_SECONDS = 2  # Output allowed in a burst before the rate budget applies
+READ_SIZE = 65536
+
+
+class OutputCoalescer:
+    """
+    Incrementally decodes program output and groups it into frames.
+
+    Attributes:
+        flush_interval (float): Max seconds output is held back
+        max_frame_size (int): Pending size (bytes) at which a frame is due
+        frames (int): Number of frames taken so far
+        frame_bytes (int): Total encoded size of the frames taken so far
+    """
+
+    def __init__(self, flush_interval: float = None, max_frame_size: int = None):
+        load_dotenv()
+        if flush_interval is None:
+            flush_interval = int(os.getenv("OUTPUT_FLUSH_INTERVAL_MS", DEFAULT_FLUSH_INTERVAL_MS)) / 1000
+        self.flush_interval = flush_interval
+        self.max_frame_size = max_frame_size if max_frame_size is not None else int(os.getenv("OUTPUT_MAX_FRAME_BYTES", DEFAULT_MAX_FRAME_BYTES))
+
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.pending: list[str] = []
+        self.pending_size = 0
+        self.pending_since = None
+
+        self.frames = 0
+        self.frame_bytes = 0
+        self.max_frame_bytes = 0
+
+    def feed(self, chunk: bytes):
+        """
+        Add raw output bytes. Incomplete multi-byte characters at the end of
+        the chunk are kept by the decoder until the rest arrives.
+        """
+        text = self.decoder.decode(chunk)
+        if not text:
+            return
+
+        if self.pending_since is None:
+            self.pending_since = time.monotonic()
+        self.pending.append(text)
+        self.pending_size += len(chunk)
+
+    def full(self) -> bool:
+        """Returns whether enough output is pending to send a frame right away."""
+        return self.pending_size >= self.max_frame_size
+
+    def time_left(self) -> float | None:
+        """
+        Returns:
+            float | None: Seconds until pending output is due, None if nothing is pending
+        """
+        if self.pending_since is None:
+            return None
+        return max(0.0, self.pending_since + self.flush_interval - time.monotonic())
+
+    def take(self) -> str:
+        """
+        Take all pending output as a single frame.
+
+        Returns:
+            str: The frame's text ('' if nothing is pending)
+        """
+        text = ''.join(self.pending)
+        self.pending.clear()
+        self.pending_size = 0
+        self.pending_since = None
+
+        if text:
+            size = len(text.encode('utf-8'))
+            self.frames += 1
+            self.frame_bytes += size
+            self.max_frame_bytes = max(self.max_frame_bytes, size)
+        return text
+
+    def finish(self) -> str:
+        """
+        Flush the decoder at end of output and take the last frame.
+
+        Returns:
+            str: The remaining output ('' if nothing is pending)
+        """
+        tail = self.decoder.decode(b'', final=True)
+        if tail:
+            self.pending.append(tail)
+        return self.take()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Frame count and frame sizes of the run
+        """
+        return {
+            "frames": self.frames,
+            "bytes": self.frame_bytes,
+            "bytes_per_frame": round(self.frame_bytes / self.frames, 1) if self.frames else 0,
+            "max_frame_bytes": self.max_frame_bytes,
+        }
+
+
+class OutputBudget:
+    """
+    Per-run output budget with tail retention.
+
+    Output is sent as long as the run stays within its total size budget
+    and its rate budget (a token bucket allowing short bursts). Once either
+    is exceeded the run is truncated: from then on output is only kept in a
+    ring buffer holding the most recent `tail_size` bytes.
+
+    Attributes:
+        max_bytes (int): Total output sent per run
+        max_rate (int): Sustained output rate sent per run (bytes/sec)
+        tail_size (int): Size of the ring buffer kept once truncated
+        truncated (bool): Whether the budget was exceeded
+        reason (str): Which budget was exceeded
+    """
+
+    def __init__(self, max_bytes: int = None, max_rate: int = None, tail_size: int = None):
+        load_dotenv()
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("OUTPUT_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_rate = max_rate if max_rate is not None else int(os.getenv("OUTPUT_MAX_RATE", DEFAULT_MAX_RATE))
+        self.tail_size = tail_size if tail_size is not None else int(os.getenv("OUTPUT_TAIL_BYTES", DEFAULT_TAIL_BYTES))
+
+        self.sent = 0
+        self.tokens = self.max_rate * RATE_BURST_SECONDS
+        self.refilled_at = time.monotonic()
+
+        self.truncated = False
+        self.reason = None
+        self.ring = bytearray()
+        self.retained = 0  # Bytes kept since the tail was last taken
+        self.omitted = 0   # Bytes never shown to the client
+
+    def admit(self, size: int) -> bool:
+        """
+        Charge output against the budget.
+
+        Args:
+            size (int): Size of the output chunk in bytes
+
+        Returns:
+            bool: True if the chunk may be sent, False if it must be retained
+        """
+        if self.truncated:
+            return False
+
+        now = time.monotonic()
+        self.tokens = min(self.max_rate * RATE_BURST_SECONDS, self.tokens + (now - self.refilled_at) * self.max_rate)
+        self.refilled_at = now
+
+        if self.sent + size > self.max_bytes:
+            self.truncated, self.reason = True, f"over {self.max_bytes} bytes"
+        elif size > self.tokens:
+            self.truncated, self.reason = True, f"over {self.max_rate} bytes/sec"
+        else:
+            self.sent += size
+            self.tokens -= size
+            return True
+
+        return False
+
+    def retain(self, chunk: bytes):
+        """Keep output that was not sent in the ring buffer."""
+        self.ring += chunk
+        self.retained += len(chunk)
+        if len(self.ring) > self.tail_size:
+            del self.ring[:-self.tail_size]
+
+    def take_tail(self, final: bool = False) -> str:
+        """
+        Take the retained output, prefixed with a note on how much was omitted.
+
+        Args:
+            final (bool): Whether the run ended (appends a truncation summary)
+
+        Returns:
+            str: Text to show the client ('' if the run was not truncated)
+        """
+        if not self.truncated:
+            return ''
+
+        tail = bytes(self.ring)
+        skipped = self.retained - len(tail)
+        self.omitted += skipped
+        self.ring.clear()
+        self.retained = 0
+
+        text = ''
+        if skipped:
+            text += f"\n[... {skipped} bytes of output omitted ...]\n"
+        text += tail.decode('utf-8', errors='replace')
+        if final:
+            text += f"\n[Output truncated ({self.reason}): {self.omitted} bytes omitted in total]\n"
+        return text
+
+
+class OutputStats:
+    """Aggregated output frame statistics across runs."""
+
+    def __init__(self):
+        self.runs = 0
+        self.frames = 0
+        self.frame_bytes = 0
+        self.max_frames_per_run = 0
+        self.truncated_runs = 0
+        self.client_pauses = 0
+
+    def record(self, coalescer: OutputCoalescer, budget: OutputBudget, client_pauses: int = 0):
+        """Add the statistics of a finished run."""
+        self.runs += 1
+        self.frames += coalescer.frames
+        self.frame_bytes += coalescer.frame_bytes
+        self.max_frames_per_run = max(self.max_frames_per_run, coalescer.frames)
+        self.truncated_runs += budget.truncated
+        self.client_pauses += client_pauses
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Frames per run and bytes per frame
+        """
+        return {
+            "runs": self.runs,
+            "frames": self.frames,
+            "frames_per_run_avg": round(self.frames / self.runs, 1) if self.runs else 0,
+            "frames_per_run_max": self.max_frames_per_run,
+            "bytes_per_frame_avg": round(self.frame_bytes / self.frames, 1) if self.frames else 0,
+            "truncated_runs": self.truncated_runs,
+            "client_pauses": self.client_pauses,
+        }
@@ -0,0 +1,304 @@
+"""
+Warm pool of pre-started sandbox containers.
+
+Starting a fresh `docker run --rm python_runner` for every execution makes the
+container cold start the dominant cost of short scripts. This module keeps a
+number of idle, network-less, resource-limited containers running in the
+background so that an execution only has to `docker exec` into one of them.
+
+Lifecycle:
+    1. The pool starts containers (`sleep infinity`, or the fork server in
+       fork server mode, as their main process) until `size` idle containers are ready, at most `refill_rate` per second
+    2. acquire() hands out an idle container (hit), or cold starts one on
+       demand when the pool is empty (miss)
+    3. release() destroys a used container (user code may have left files or
+       background processes behind) and wakes the refill task. A container
+       that was never used can be returned to the pool as is
+
+Naming:
+    Every pool belongs to a server instance with a random instance ID.
+    Sandboxes are named "codebox-<instance ID>-<n>" and labeled with the
+    instance ID (INSTANCE_LABEL), so names never collide with sandboxes left
+    behind by an earlier server process and those can be found and removed
+    (see reaper.py)
+
+Statistics:
+    Hits, misses and acquire latency are tracked and exposed via stats()
+
+Environment Variables:
+    SANDBOX_POOL_SIZE: Number of idle containers kept ready (default: 4)
+    SANDBOX_POOL_REFILL_RATE: Max containers started per second (default: 2)
+    SANDBOX_MAX_LEASE: Seconds a sandbox may stay acquired when the caller gives no lease (default: 600)
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from sandbox import supervisor
+from utils.logger import (
+    Logger,
+    Level,
+    Event
+    )
+
+SANDBOX_IMAGE = 'python_runner'
+SANDBOX_WORKDIR = '/home/sandboxuser/app'
+SANDBOX_NAME_PREFIX = 'codebox-'
+INSTANCE_LABEL = 'codebox.instance'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_REFILL_RATE = 2.0  # containers per second
+DEFAULT_MAX_LEASE = 600  # seconds
+
+# Security constraints applied to every sandbox container (which never has network access):
+# - Limited CPU and memory
+# - Limited number of processes
+# Sandboxes start with these, runs may get more CPU and memory while the host has headroom (see limits.py)
+SANDBOX_LIMITS = {
+    "cpus": 0.5,
+    "memory": 128 * 1024 * 1024,
+    "pids": 64,
+}
+
+
+def sandbox_id():
+    """Generator function that produces unique sandbox IDs."""
+    id = 0
+    while True:
+        id += 1
+        yield id
+
+sandbox_id_gen = sandbox_id()
+
+
+class Sandbox:
+    """
+    A running sandbox container owned by the pool.
+
+    Attributes:
+        name (str): Docker container name
+        created_at (float): Monotonic time the container was started
+        used (bool): Whether code was executed in the container
+        deadline (float): Monotonic time the current lease ends (while acquired)
+        limits (dict): Current resource limits (see limits.py)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.created_at = time.monotonic()
+        self.used = False
+        self.deadline = None
+        self.limits = SANDBOX_LIMITS
+
+
+class SandboxPool:
+    """
+    Keeps a set of idle sandbox containers ready for code execution.
+
+    Attributes:
+        backend (SandboxBackend): Backend managing the sandboxes (see backend.py)
+        size (int): Number of idle containers to keep ready
+        refill_rate (float): Max number of containers started per second
+        forkserver (bool): Whether sandboxes run the fork server (see supervisor.py)
+        instance_id (str): ID of the server instance owning the sandboxes
+        mounts (dict): Host directories mounted read-only into every sandbox (host path -> sandbox path)
+        max_lease (float): Default lease of acquired sandboxes in seconds
+        idle (list): Idle sandboxes ready to be handed out
+        in_use (dict): Maps name -> acquired sandbox
+        owned (set): Names of all sandboxes of the pool, from their start until they are destroyed
+        logger (Logger): Pool event logger
+    """
+
+    def __init__(self, backend, size: int = None, refill_rate: float = None, forkserver: bool = None,
+                 instance_id: str = None, mounts: dict = None):
+        """
+        Initialize the pool. Containers are only started once start() is called.
+
+        Args:
+            backend (SandboxBackend): Backend managing the sandboxes
+            size (int): Number of idle containers to keep ready
+            refill_rate (float): Max number of containers started per second
+            forkserver (bool): Whether sandboxes run the fork server
+            instance_id (str): ID of the server instance (default: a new random ID)
+            mounts (dict): Host directories mounted read-only into every sandbox
+        """
+        load_dotenv()
+        self.backend = backend
+        self.size = size if size is not None else int(os.getenv("SANDBOX_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.refill_rate = refill_rate if refill_rate is not None else float(os.getenv("SANDBOX_POOL_REFILL_RATE", DEFAULT_REFILL_RATE))
+        self.forkserver = forkserver if forkserver is not None else supervisor.forkserver_enabled()
+        self.instance_id = instance_id or uuid.uuid4().hex[:12]
+        self.mounts = mounts or {}
+        self.max_lease = float(os.getenv("SANDBOX_MAX_LEASE", DEFAULT_MAX_LEASE))
+        self.logger = Logger()
+
+        self.idle: list[Sandbox] = []
+        self.in_use: dict[str, Sandbox] = {}
+        self.owned: set[str] = set()
+        self.refill_event = asyncio.Event()
+        self.refill_task = None
+        self.pending = set()  # Background recycle tasks
+        self.image_id = None  # Resolved when the pool starts
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.acquire_count = 0
+        self.acquire_time_total = 0.0
+        self.acquire_time_max = 0.0
+
+    async def start(self):
+        """Resolve the sandbox image ID and start the background refill task."""
+        self.image_id = await self.resolve_image_id()
+        self.refill_task = asyncio.create_task(self.refill_loop())
+        self.refill_event.set()
+
+    async def close(self):
+        """Stop refilling and destroy all idle containers."""
+        if self.refill_task:
+            self.refill_task.cancel()
+            try:
+                await self.refill_task
+            except asyncio.CancelledError:
+                pass
+
+        idle, self.idle = self.idle, []
+        await asyncio.gather(*(self.destroy(sandbox) for sandbox in idle))
+
+    async def refill_loop(self):
+        """
+        Top the pool back up to `size` idle containers whenever it is woken,
+        starting at most `refill_rate` containers per second.
+        """
+        while True:
+            await self.refill_event.wait()
+            self.refill_event.clear()
+
+            while len(self.idle) < self.size:
+                sandbox = await self.create()
+                if sandbox is None:
+                    break  # Backend failed, wait for the next wake up
+                self.idle.append(sandbox)
+                await asyncio.sleep(1 / self.refill_rate)
+
+    async def resolve_image_id(self) -> str | None:
+        """
+        Returns:
+            str | None: ID of the sandbox image, None if it couldn't be inspected
+        """
+        return await self.backend.image_id(SANDBOX_IMAGE)
+
+    async def create(self) -> Sandbox | None:
+        """
+        Start a new idle sandbox container.
+
+        Returns:
+            Sandbox: The started sandbox, None if the backend failed to start it
+        """
+        name = f"{SANDBOX_NAME_PREFIX}{self.instance_id}-{next(sandbox_id_gen)}"
+        self.owned.add(name)
+
+        command = supervisor.sandbox_main_command(self.forkserver)
+        labels = {INSTANCE_LABEL: self.instance_id}
+        if not await self.backend.start_sandbox(name, SANDBOX_IMAGE, SANDBOX_LIMITS, command, labels=labels,
+                                                mounts=self.mounts):
+            self.logger.log_connection_event(Level.LEVEL_ERROR, Event.SANDBOX_POOL, message=f"Failed to start {name}")
+            self.owned.discard(name)
+            return None
+
+        return Sandbox(name)
+
+    async def destroy(self, sandbox: Sandbox):
+        """Kill a sandbox container (the backend removes it)."""
+        await self.backend.kill_sandbox(sandbox.name)
+        self.owned.discard(sandbox.name)
+
+    async def acquire(self, lease: float = None) -> Sandbox | None:
+        """
+        Take a sandbox out of the pool, cold starting one if none is idle.
+
+        Args:
+            lease (float): Seconds the caller may keep the sandbox before the
+                           reaper kills it (default: max_lease)
+
+        Returns:
+            Sandbox: A running sandbox, None if no sandbox could be started
+        """
+        start = time.monotonic()
+
+        if self.idle:
+            self.hits += 1
+            sandbox = self.idle.pop(0)
+        else:
+            self.misses += 1
+            sandbox = await self.create()
+
+        self.refill_event.set()
+
+        elapsed = time.monotonic() - start
+        self.acquire_count += 1
+        self.acquire_time_total += elapsed
+        self.acquire_time_max = max(self.acquire_time_max, elapsed)
+
+        if sandbox is not None:
+            sandbox.deadline = time.monotonic() + (lease or self.max_lease)
+            self.in_use[sandbox.name] = sandbox
+        return sandbox
+
+    def renew(self, sandbox: Sandbox, lease: float):
+        """Extend the lease of an acquired sandbox to `lease` seconds from now."""
+        if sandbox.name in self.in_use:
+            sandbox.deadline = time.monotonic() + lease
+
+    async def release(self, sandbox: Sandbox):
+        """
+        Give a sandbox back to the pool after execution.
+
+        Unused sandboxes are returned to the idle list, used ones are destroyed
+        and replaced by a fresh container in the background.
+        """
+        self.in_use.pop(sandbox.name, None)
+        sandbox.deadline = None
+
+        if not sandbox.used and len(self.idle) < self.size:
+            self.idle.append(sandbox)
+            return
+
+        # Recycle in the background so the caller isn't delayed by `docker kill`
+        task = asyncio.create_task(self.recycle(sandbox))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def recycle(self, sandbox: Sandbox):
+        """Destroy a used sandbox and wake the refill task to replace it."""
+        await self.destroy(sandbox)
+        self.refill_event.set()
+
+    def expired(self) -> list:
+        """
+        Returns:
+            list: Acquired sandboxes whose lease ended
+        """
+        now = time.monotonic()
+        return [sandbox for sandbox in self.in_use.values() if sandbox.deadline is not None and sandbox.deadline < now]
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Pool size, hit/miss counters and acquire latency (ms)
+        """
+        avg = self.acquire_time_total / self.acquire_count if self.acquire_count else 0.0
+        return {
+            "instance_id": self.instance_id,
+            "size": self.size,
+            "forkserver": self.forkserver,
+            "idle": len(self.idle),
+            "in_use": len(self.in_use),
+            "hits": self.hits,
+            "misses": self.misses,
+            "acquire_ms_avg": round(avg * 1000, 2),
+            "acquire_ms_max": round(self.acquire_time_max * 1000, 2),
+        }
@@ -0,0 +1,312 @@
+"""
+Pre-flight compile check of executed scripts.
+
+Many executions are scripts with a syntax error, each of which used to cost
+a sandbox just to print the error. The server now compiles the script first
+(the EXEC code, or the entry file of a RUNF run) and, when it doesn't
+compile, sends the error the sandbox would have printed without starting one.
+
+Only the executed script is checked: a syntax error in another project file
+surfaces when that file is imported, after the script already ran (and
+possibly wrote output), so those runs still go to a sandbox.
+
+Workers:
+    compile() runs in a small process pool. Untrusted source can make the
+    compiler slow or crash (deeply nested expressions), which must neither
+    block the event loop nor take the server down. A check that fails,
+    times out or exceeds the size bound is inconclusive, and the script
+    simply runs in a sandbox. A compile that times out has its workers
+    killed, so it can't hold them and delay the checks after it.
+
+Versions:
+    Syntax and error messages differ between Python versions, so errors are
+    only reported when the server's Python has the same version as the
+    sandbox's, which is asked from a pooled sandbox once at startup.
+
+Cache:
+    Results are cached by the SHA-256 of the source (least recently used
+    entries evicted), so re-running an unchanged broken script costs no
+    compile at all.
+
+Environment Variables:
+    PREFLIGHT_ENABLED: "true"/"false" - Enable the pre-flight check (default: true)
+    PREFLIGHT_WORKERS: Number of compile worker processes (default: 2)
+    PREFLIGHT_TIMEOUT: Seconds a compile may take (default: 2)
+    PREFLIGHT_MAX_BYTES: Larger scripts are not checked (default: 1 MiB)
+    PREFLIGHT_CACHE_SIZE: Number of cached results (default: 4096)
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from utils.logger import (
+    Logger,
+    Level,
+    Event
+    )
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 2  # seconds
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_CACHE_SIZE = 4096
+VERSION_TIMEOUT = 10  # seconds
+VERSION_COMMAND = ['python3', '-c', 'import sys; print("%d.%d" % sys.version_info[:2])']
+COMPILE_ERRORS = {error.__name__: error for error in (SyntaxError, IndentationError, TabError)}
+COMPILED = 'ok'  # Cached result of a script that compiles
+
+
+def compile_source(source: bytes) -> str | dict | None:
+    """
+    Compile a script like runpy does (worker process side).
+
+    Returns:
+        str | dict | None: COMPILED, the fields of the SyntaxError, or None
+                           if compiling failed otherwise (e.g. RecursionError)
+    """
+    try:
+        compile(source, '<preflight>', 'exec', dont_inherit=True)
+    except SyntaxError as exc:
+        text = exc.text
+        if text is None and exc.lineno:
+            # Errors past parsing leave the line to be read from the file, like Python does
+            lines = source.splitlines(keepends=True)
+            if exc.lineno <= len(lines):
+                text = lines[exc.lineno - 1].decode('utf-8', errors='replace')
+        return {
+            "type": type(exc).__name__,
+            "msg": exc.msg,
+            "lineno": exc.lineno,
+            "offset": exc.offset,
+            "text": text,
+            "end_lineno": exc.end_lineno,
+            "end_offset": exc.end_offset,
+        }
+    except Exception:
+        return None
+    return COMPILED
+
+
+def format_error(error: dict, filename: str) -> str:
+    """
+    Format a compile error the way the sandbox's launcher prints it (the
+    failing compile has no frames of the script, so there is no traceback header).
+
+    Args:
+        error (dict): Fields of the SyntaxError (see compile_source)
+        filename (str): Path of the script as executed in the sandbox
+
+    Returns:
+        str: The formatted error
+    """
+    exc_type = COMPILE_ERRORS.get(error["type"], SyntaxError)
+    exc = exc_type(error["msg"], (
+        filename, error["lineno"], error["offset"], error["text"], error["end_lineno"], error["end_offset"]
+    ))
+    return ''.join(traceback.format_exception_only(exc_type, exc))
+
+
+def read_script(folder: str, path: str, max_bytes: int) -> bytes | None:
+    """
+    Read a script of a user's project.
+
+    Args:
+        folder (str): User's storage directory
+        path (str): Path of the script relative to it (as sent by the client)
+        max_bytes (int): Larger scripts are not read
+
+    Returns:
+        bytes | None: Source of the script, None if it is missing, too
+                      large or outside of the directory
+    """
+    root = Path(folder).resolve()
+    script = (root / path).resolve()
+    if not script.is_relative_to(root) or not script.is_file() or script.stat().st_size > max_bytes:
+        return None
+    return script.read_bytes()
+
+
+async def sandbox_python_version(backend, name: str) -> str | None:
+    """
+    Returns:
+        str | None: "major.minor" version of a sandbox's python3, None if it couldn't be run
+    """
+    async def read():
+        process = await backend.exec(name, VERSION_COMMAND)
+        output = await process.stdout.read()
+        await process.wait()
+        return output
+
+    try:
+        output = await asyncio.wait_for(read(), timeout=VERSION_TIMEOUT)
+    except (asyncio.TimeoutError, OSError, ProcessLookupError):
+        return None
+    return output.decode(errors='replace').strip() or None
+
+
+class CompileChecker:
+    """
+    Compiles scripts in a worker pool before they are executed.
+
+    Attributes:
+        enabled (bool): Whether scripts are checked
+        workers (int): Number of compile worker processes
+        timeout (float): Seconds a compile may take
+        max_bytes (int): Larger scripts are not checked
+        cache_size (int): Number of cached results
+        sandbox_version (str): Python version of the sandboxes, None until known
+        results (OrderedDict): Maps source digest -> compile result, least recently used first
+    """
+
+    def __init__(self, enabled: bool = None, workers: int = None, timeout: float = None, max_bytes: int = None,
+                 cache_size: int = None):
+        load_dotenv()
+        self.enabled = enabled if enabled is not None else os.getenv("PREFLIGHT_ENABLED", "true").lower() == "true"
+        self.workers = workers if workers is not None else int(os.getenv("PREFLIGHT_WORKERS", DEFAULT_WORKERS))
+        self.timeout = timeout if timeout is not None else float(os.getenv("PREFLIGHT_TIMEOUT", DEFAULT_TIMEOUT))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("PREFLIGHT_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.cache_size = cache_size if cache_size is not None else int(
+            os.getenv("PREFLIGHT_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+        )
+        self.logger = Logger()
+
+        self.executor = None  # Started with the first check
+        self.sandbox_version = None
+        self.version_task = None
+        self.results: OrderedDict[str, str | dict] = OrderedDict()
+
+        # Statistics
+        self.checks = 0
+        self.rejected = 0
+        self.cache_hits = 0
+        self.inconclusive = 0
+
+    @property
+    def active(self) -> bool:
+        """Whether errors found by the server's compiler hold for the sandboxes."""
+        return self.enabled and self.sandbox_version == "%d.%d" % sys.version_info[:2]
+
+    def start(self, pool):
+        """
+        Learn the sandboxes' Python version from a pooled sandbox in the background.
+
+        Args:
+            pool (SandboxPool): Pool to borrow the sandbox from
+        """
+        if self.enabled:
+            self.version_task = asyncio.create_task(self.resolve_version(pool))
+
+    async def resolve_version(self, pool):
+        sandbox = await pool.acquire()
+        if sandbox is None:
+            return
+        try:
+            self.sandbox_version = await sandbox_python_version(pool.backend, sandbox.name)
+        finally:
+            await pool.release(sandbox)  # Never used, it goes back to the pool
+
+        if not self.active:
+            self.logger.log_connection_event(
+                Level.LEVEL_INFO, Event.SANDBOX_POOL,
+                message=f"Pre-flight compile check off (sandbox Python {self.sandbox_version})"
+            )
+
+    async def close(self):
+        if self.version_task is not None:
+            self.version_task.cancel()
+        if self.executor is not None:
+            await asyncio.to_thread(self.executor.shutdown, wait=True, cancel_futures=True)
+            self.executor = None
+
+    async def check(self, source: bytes, filename: str) -> str | None:
+        """
+        Compile a script before it is executed.
+
+        Args:
+            source (bytes): Source of the script
+            filename (str): Path of the script as executed in the sandbox
+
+        Returns:
+            str | None: The error the sandbox would print if the script
+                        doesn't compile, None if it compiles or that's unknown
+        """
+        if not self.active or len(source) > self.max_bytes:
+            return None
+
+        self.checks += 1
+        digest = hashlib.sha256(source).hexdigest()
+        result = self.results.get(digest)
+        if result is not None:
+            self.cache_hits += 1
+            self.results.move_to_end(digest)
+        else:
+            result = await self.compile(source)
+            if result is None:
+                self.inconclusive += 1
+                return None
+            self.results[digest] = result
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+
+        if result == COMPILED:
+            return None
+        self.rejected += 1
+        return format_error(result, filename)
+
+    async def compile(self, source: bytes) -> str | dict | None:
+        """
+        Returns:
+            str | dict | None: Result of compile_source in a worker, None if inconclusive
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        executor = self.executor
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, compile_source, source), timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            # The compile keeps its worker busy until it ends, which would delay later checks
+            self.reset(executor)
+            return None
+        except BrokenProcessPool:
+            # A worker died (e.g. the compiler crashed), start over with fresh workers
+            self.reset(executor)
+            return None
+
+    def reset(self, executor: ProcessPoolExecutor):
+        """
+        Kill the workers of `executor` and shut it down, the next compile starts fresh ones.
+        Checks still waiting for it are inconclusive.
+        """
+        if self.executor is executor:
+            self.executor = None
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Checked and rejected scripts, cache hits and inconclusive checks
+        """
+        return {
+            "enabled": self.enabled,
+            "active": self.active,
+            "sandbox_version": self.sandbox_version,
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "cache_hits": self.cache_hits,
+            "inconclusive": self.inconclusive,
+            "cached": len(self.results),
+        }
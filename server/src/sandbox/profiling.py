@@ -0,0 +1,56 @@
+"""
+Profile mode of RUNF runs (server side of server/docker/profiler.py).
+
+A profiled run sets CODEBOX_PROFILE, so the launcher runs the script under
+cProfile and tracemalloc and writes an aggregated profile (top functions by
+cumulative time, top allocation sites, traced memory and a call tree for
+flame graphs) into the sandbox. Once the run ended the profile is copied
+out and sent to the client after DONE.
+
+Profiling slows the script down (several times for call- or
+allocation-heavy code) and raises its memory use, see profiler.py for
+measurements. Profiled runs keep the normal timeout and limits, so a
+script close to them may only hit them when profiled.
+"""
+
+import json
+
+from sandbox.archive import read_file
+
+PROFILE_ENV = 'CODEBOX_PROFILE'
+PROFILE_PATH = '/tmp/codebox-profile.json'  # Inside the sandbox
+MAX_PROFILE_BYTES = 1024 * 1024
+
+
+def profile_environment() -> dict:
+    """
+    Returns:
+        dict: Environment variables making the launcher profile the run
+    """
+    return {PROFILE_ENV: PROFILE_PATH}
+
+
+async def read_profile(backend, name: str) -> dict | None:
+    """
+    Copy the profile of a finished run out of its sandbox.
+
+    Args:
+        backend (SandboxBackend): Backend of the sandbox
+        name (str): Name of the sandbox
+
+    Returns:
+        dict | None: The profile, None if the run wrote none (e.g. it was
+                     killed at the timeout) or it is invalid
+    """
+    archive = await backend.copy_from(name, PROFILE_PATH)
+    if not archive:
+        return None
+
+    content = read_file(archive, MAX_PROFILE_BYTES)
+    if content is None:
+        return None
+    try:
+        profile = json.loads(content)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return profile if isinstance(profile, dict) else None
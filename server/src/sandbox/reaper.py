@@ -0,0 +1,176 @@
+"""
+Background reaper of leaked sandboxes.
+
+Sandboxes outlive the server process that started them when it crashes
+(containers keep running `sleep infinity`), and a failed kill leaves one
+behind while the server runs, slowly draining the host's capacity. Every
+sandbox is labeled with the ID of its server instance (see pool.py), and
+every instance keeps a heartbeat file in the instance directory. The reaper
+periodically lists all labeled sandboxes and kills:
+    - foreign: sandboxes of other instances whose heartbeat is stale (the
+      instance crashed or stopped without cleaning up)
+    - orphaned: sandboxes of this instance the pool doesn't know (e.g. a kill failed)
+    - expired: acquired sandboxes whose run outlived its lease
+
+Several server instances may share a sandbox host as long as they share the
+instance directory.
+
+Environment Variables:
+    SANDBOX_REAPER_ENABLED: "true"/"false" - Kill leaked sandboxes (default: true, the
+                            heartbeat is kept either way)
+    SANDBOX_REAPER_INTERVAL: Seconds between scans (default: 30)
+    SANDBOX_INSTANCE_STALE_AFTER: Seconds without heartbeat after which an instance
+                                  is considered dead (default: 3 scan intervals)
+"""
+
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from sandbox.pool import INSTANCE_LABEL, SandboxPool
+from utils.logger import (
+    Logger,
+    Level,
+    Event
+    )
+
+SANDBOX_INSTANCE_DIR = "../sandbox_instances"
+DEFAULT_INTERVAL = 30  # seconds
+STALE_INTERVALS = 3  # Missed heartbeats after which an instance is considered dead
+
+
+class SandboxReaper:
+    """
+    Finds and kills sandboxes nobody will ever release.
+
+    Attributes:
+        pool (SandboxPool): Pool of this server instance
+        enabled (bool): Whether leaked sandboxes are killed
+        interval (float): Seconds between scans
+        stale_after (float): Heartbeat age after which an instance is considered dead
+        instance_dir (Path): Directory holding a heartbeat file per server instance
+        logger (Logger): Reaper event logger
+    """
+
+    def __init__(self, pool: SandboxPool, enabled: bool = None, interval: float = None,
+                 stale_after: float = None, instance_dir: str = SANDBOX_INSTANCE_DIR):
+        load_dotenv()
+        self.pool = pool
+        self.enabled = enabled if enabled is not None else os.getenv("SANDBOX_REAPER_ENABLED", "true").lower() == "true"
+        self.interval = interval if interval is not None else float(os.getenv("SANDBOX_REAPER_INTERVAL", DEFAULT_INTERVAL))
+        self.stale_after = stale_after if stale_after is not None else float(
+            os.getenv("SANDBOX_INSTANCE_STALE_AFTER", self.interval * STALE_INTERVALS)
+        )
+        self.instance_dir = Path(instance_dir)
+        self.logger = Logger()
+        self.task = None
+
+        # Statistics
+        self.scans = 0
+        self.scan_failures = 0
+        self.reaped = {"foreign": 0, "orphaned": 0, "expired": 0}
+        self.last_scan_ms = 0.0
+
+    def heartbeat_path(self, instance_id: str) -> Path:
+        return self.instance_dir / instance_id
+
+    def heartbeat(self):
+        """Mark this server instance as alive."""
+        self.instance_dir.mkdir(parents=True, exist_ok=True)
+        self.heartbeat_path(self.pool.instance_id).touch()
+
+    def instance_alive(self, instance_id: str) -> bool:
+        if not instance_id.isalnum():
+            return False  # Not an instance ID of this server
+        try:
+            age = time.time() - self.heartbeat_path(instance_id).stat().st_mtime
+        except OSError:
+            return False  # No heartbeat
+        return age < self.stale_after
+
+    async def start(self):
+        """
+        Write the first heartbeat and start scanning in the background.
+
+        Must run before the pool starts sandboxes, so other instances never
+        see sandboxes of an instance without heartbeat.
+        """
+        await asyncio.to_thread(self.heartbeat)
+        self.task = asyncio.create_task(self.reap_loop())
+
+    async def close(self):
+        """Stop scanning and remove this instance's heartbeat."""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.heartbeat_path(self.pool.instance_id).unlink(missing_ok=True)
+
+    async def reap_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.heartbeat)
+                if self.enabled:
+                    await self.reap()
+            except OSError as e:
+                self.scan_failures += 1
+                self.logger.log_connection_event(Level.LEVEL_ERROR, Event.SANDBOX_REAPER, message=str(e))
+            await asyncio.sleep(self.interval)
+
+    async def reap(self):
+        """Run a single scan, killing leaked sandboxes (see module docstring)."""
+        start = time.monotonic()
+        pool = self.pool
+
+        for sandbox in pool.expired():
+            self.count(sandbox.name, "expired")
+            sandbox.deadline = None  # Reaped once, its holder still releases it
+            await pool.destroy(sandbox)
+
+        sandboxes = await pool.backend.list_sandboxes(INSTANCE_LABEL)
+        if sandboxes is None:
+            self.scan_failures += 1
+            return
+
+        dead_instances = set()
+        for name, instance_id in sandboxes.items():
+            if instance_id == pool.instance_id:
+                if name not in pool.owned:
+                    await self.kill(name, "orphaned")
+            elif not self.instance_alive(instance_id):
+                dead_instances.add(instance_id)
+                await self.kill(name, "foreign")
+
+        # Forget the dead instances, their sandboxes are gone
+        for instance_id in dead_instances:
+            if instance_id.isalnum():
+                self.heartbeat_path(instance_id).unlink(missing_ok=True)
+
+        self.scans += 1
+        self.last_scan_ms = round((time.monotonic() - start) * 1000, 2)
+
+    def count(self, name: str, reason: str):
+        self.reaped[reason] += 1
+        self.logger.log_connection_event(Level.LEVEL_WARNING, Event.SANDBOX_REAPER, message=f"Reaping {reason} {name}")
+
+    async def kill(self, name: str, reason: str):
+        self.count(name, reason)
+        await self.pool.backend.kill_sandbox(name)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Scan counters and the number of leaked sandboxes reaped per reason
+        """
+        return {
+            "enabled": self.enabled,
+            "scans": self.scans,
+            "scan_failures": self.scan_failures,
+            "reaped": dict(self.reaped),
+            "last_scan_ms": self.last_scan_ms,
+        }
@@ -0,0 +1,479 @@
+"""
+Remote sandbox backend: sandboxes on runner hosts.
+
+A runner (runner_server.py) is an agent process on a sandbox host that
+exposes its local backend (Docker or namespaces) over TCP. The central
+server connects to a set of runners and places every new sandbox on the
+least-loaded connected runner (fewest sandboxes relative to its capacity);
+all later operations on the sandbox go to that runner. A runner that
+rejects a start or can't be reached is skipped, and lost connections are
+re-established in the background.
+
+Protocol:
+    Messages use the size-prefixed framing of utils/async_tcp_by_size.py.
+    Each message is a JSON header line, optionally followed by a binary
+    payload (archives, process I/O):  <header JSON>\\n<payload>
+
+    Requests carry an "id" and get exactly one response with the same "id"
+    and "ok" (plus "error" when not ok). The first request must be hello:
+        hello {token}                                   -> {runner, capacity, sandboxes}
+        start {name, command, labels}                   -> {sandboxes}
+        kill {name}                                     -> {sandboxes}
+        list {label}                                    -> {sandboxes: {name: value}}
+        exec {proc, name, command, env}                 -> {}
+        copy_into {name, dest} + archive                -> {}
+        copy_from {name, path}                          -> {found} + archive
+        image_id {}                                     -> {image_id}
+    Process messages (no response), "proc" is an ID chosen by the server:
+        stdin {proc} + data, stdin_close {proc}, kill_proc {proc},
+        ack {proc, stream, size}  (output consumed, see flow control)
+    Process events sent by the runner:
+        out {proc, stream} + data, eof {proc, stream}, exit {proc, code}
+
+Flow control:
+    The runner keeps at most STREAM_WINDOW unacknowledged bytes in flight per
+    output stream. The server acknowledges output as the reader consumes it,
+    so a slow reader pauses its own process without blocking the connection.
+
+Ownership:
+    Sandboxes belong to the connection that started them; the runner kills
+    them when the connection is lost. Runners start sandboxes with their own
+    image, limits and mounts, so those of start_sandbox() are not sent.
+
+Environment Variables:
+    RUNNER_ADDRESSES: Comma separated host:port of the runners (default: 127.0.0.1:7070)
+    RUNNER_TOKEN: Shared secret runners require in hello (default: none)
+"""
+
+import asyncio
+import itertools
+import json
+import os
+
+from dotenv import load_dotenv
+
+from sandbox.backend import SandboxBackend
+from sandbox.docker_api import DemuxedStream
+from utils.async_tcp_by_size import send_one_message, recv_one_message
+
+DEFAULT_RUNNER_ADDRESSES = '127.0.0.1:7070'
+DEFAULT_RUNNER_PORT = 7070
+STREAM_WINDOW = 256 * 1024  # Unacknowledged output bytes per stream
+RECONNECT_INTERVAL = 2  # Seconds
+REQUEST_TIMEOUT = 60  # Seconds
+
+# Output streams
+STREAM_STDOUT = 1
+STREAM_STDERR = 2
+
+
+def encode_frame(header: dict, payload: bytes = b'') -> bytes:
+    return json.dumps(header).encode() + b'\n' + payload
+
+
+def decode_frame(message: bytes) -> tuple:
+    """
+    Returns:
+        tuple: (header dict, payload bytes)
+    """
+    header, _, payload = message.partition(b'\n')
+    return json.loads(header), payload
+
+
+def parse_address(address: str) -> tuple:
+    host, _, port = address.strip().rpartition(':')
+    return host or '127.0.0.1', int(port or DEFAULT_RUNNER_PORT)
+
+
+class RemoteStream(DemuxedStream):
+    """Output stream of a remote process, acknowledging consumed bytes to the runner."""
+
+    def __init__(self, acknowledge):
+        super().__init__(limit=STREAM_WINDOW)
+        self.acknowledge = acknowledge
+
+    async def read(self, n: int = -1) -> bytes:
+        data = await super().read(n)
+        if data:
+            self.acknowledge(len(data))
+        return data
+
+    async def readline(self) -> bytes:
+        data = await super().readline()
+        if data:
+            self.acknowledge(len(data))
+        return data
+
+
+class RemoteInput:
+    """Stdin of a remote process."""
+
+    def __init__(self, runner, proc: int):
+        self.runner = runner
+        self.proc = proc
+
+    def write(self, data: bytes):
+        self.runner.post({"op": "stdin", "proc": self.proc}, data)
+
+    async def drain(self):
+        await self.runner.drain()
+
+    def close(self):
+        self.runner.post({"op": "stdin_close", "proc": self.proc})
+
+
+class RemoteProcess:
+    """
+    Process-like handle of a command running on a runner, compatible with
+    asyncio.subprocess.Process (stdin / stdout / stderr / wait / kill / returncode).
+    """
+
+    def __init__(self, runner, proc: int):
+        self.runner = runner
+        self.proc = proc
+        self.stdin = RemoteInput(runner, proc)
+        self.stdout = RemoteStream(lambda size: self.acknowledge(STREAM_STDOUT, size))
+        self.stderr = RemoteStream(lambda size: self.acknowledge(STREAM_STDERR, size))
+        self.returncode = None
+        self.exited = asyncio.Event()
+
+    def acknowledge(self, stream: int, size: int):
+        if self.returncode is None:
+            self.runner.post({"op": "ack", "proc": self.proc, "stream": stream, "size": size})
+
+    async def feed(self, header: dict, payload: bytes):
+        """Handle a process event sent by the runner."""
+        stream = self.stderr if header.get("stream") == STREAM_STDERR else self.stdout
+        if header["event"] == "out":
+            await stream.feed(payload)
+        elif header["event"] == "eof":
+            await stream.feed_eof()
+        elif header["event"] == "exit":
+            await self.finish(header.get("code"))
+
+    async def finish(self, code: int):
+        await self.stdout.feed_eof()
+        await self.stderr.feed_eof()
+        if self.returncode is None:
+            self.returncode = code
+        self.exited.set()
+
+    async def wait(self) -> int:
+        await self.exited.wait()
+        return self.returncode
+
+    def kill(self):
+        if self.returncode is None:
+            self.runner.post({"op": "kill_proc", "proc": self.proc})
+
+
+class RemoteRunner:
+    """
+    Connection to a single runner.
+
+    Attributes:
+        address (str): host:port of the runner
+        capacity (int): Sandboxes the runner is sized for (reported in hello)
+        sandboxes (int): Sandboxes running on the runner (reported with every start / kill)
+        connected (bool): Whether the connection is up
+    """
+
+    def __init__(self, address: str, token: str):
+        self.address = address
+        self.token = token
+        self.capacity = 1
+        self.sandboxes = 0
+        self.connected = False
+        self.reader = None
+        self.writer = None
+        self.receive_task = None
+        self.ids = itertools.count(1)
+        self.pending: dict[int, asyncio.Future] = {}
+        self.processes: dict[int, RemoteProcess] = {}
+        self.posted = set()
+
+        # Statistics
+        self.requests = 0
+        self.connects = 0
+        self.disconnects = 0
+
+    def load(self) -> float:
+        return self.sandboxes / max(self.capacity, 1)
+
+    async def connect(self) -> bool:
+        """
+        Connect and authenticate.
+
+        Returns:
+            bool: Whether the runner accepted the connection
+        """
+        host, port = parse_address(self.address)
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=5)
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+        self.connected = True
+        self.receive_task = asyncio.create_task(self.receive_loop())
+        try:
+            header, _ = await self.request({"op": "hello", "token": self.token})
+        except (ConnectionError, asyncio.TimeoutError):
+            await self.close()
+            return False
+
+        self.capacity = header.get("capacity", 1)
+        self.sandboxes = header.get("sandboxes", 0)
+        self.connects += 1
+        return True
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.receive_task is not None:
+            await self.receive_task
+
+    def post(self, header: dict, payload: bytes = b''):
+        """
+        Send a message without waiting. Messages are written in the order they are posted.
+        """
+        if not self.connected:
+            return
+        task = asyncio.create_task(send_one_message(self.writer, encode_frame(header, payload)))
+        self.posted.add(task)
+        task.add_done_callback(self.posted.discard)
+
+    async def drain(self):
+        if self.connected:
+            await self.writer.drain()
+
+    async def request(self, header: dict, payload: bytes = b'') -> tuple:
+        """
+        Send a request and wait for its response.
+
+        Returns:
+            tuple: (response header, response payload)
+
+        Raises:
+            ConnectionError: The runner is not connected or rejected the request
+        """
+        if not self.connected:
+            raise ConnectionError(f"Runner {self.address} is not connected")
+
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.requests += 1
+        try:
+            await send_one_message(self.writer, encode_frame({**header, "id": request_id}, payload))
+            response, data = await asyncio.wait_for(future, timeout=REQUEST_TIMEOUT)
+        finally:
+            self.pending.pop(request_id, None)
+
+        if not response.get("ok"):
+            raise ConnectionError(f"Runner {self.address}: {response.get('error', 'request failed')}")
+        if "sandboxes" in response and isinstance(response["sandboxes"], int):
+            self.sandboxes = response["sandboxes"]
+        return response, data
+
+    async def receive_loop(self):
+        """Dispatch responses and process events until the connection is lost."""
+        try:
+            while message := await recv_one_message(self.reader, return_type="bytes"):
+                header, payload = decode_frame(message)
+                if "event" in header:
+                    process = self.processes.get(header.get("proc"))
+                    if process is not None:
+                        await process.feed(header, payload)
+                        if header["event"] == "exit":
+                            self.processes.pop(process.proc, None)
+                else:
+                    future = self.pending.get(header.get("id"))
+                    if future is not None and not future.done():
+                        future.set_result((header, payload))
+        except (ValueError, KeyError):
+            pass  # Malformed message, drop the connection
+        finally:
+            self.connected = False
+            self.writer.close()
+            self.disconnects += 1
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Runner {self.address} disconnected"))
+            processes, self.processes = self.processes, {}
+            for process in processes.values():
+                await process.finish(-1)
+
+    async def exec(self, name: str, command: list, env: dict = None) -> RemoteProcess:
+        process = RemoteProcess(self, next(self.ids))
+        self.processes[process.proc] = process
+        try:
+            await self.request({"op": "exec", "proc": process.proc, "name": name, "command": command, "env": env or {}})
+        except ConnectionError:
+            self.processes.pop(process.proc, None)
+            raise
+        return process
+
+    def stats(self) -> dict:
+        return {
+            "address": self.address,
+            "connected": self.connected,
+            "capacity": self.capacity,
+            "sandboxes": self.sandboxes,
+            "requests": self.requests,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+        }
+
+
+class RemoteBackend(SandboxBackend):
+    """
+    Runs sandboxes on a set of runners (see module docstring).
+
+    Attributes:
+        runners (list): RemoteRunner per runner address
+        placement (dict): Maps sandbox name -> runner it runs on
+    """
+
+    name = 'remote'
+
+    def __init__(self, addresses: list = None, token: str = None):
+        load_dotenv()
+        if addresses is None:
+            addresses = [address for address in os.getenv("RUNNER_ADDRESSES", DEFAULT_RUNNER_ADDRESSES).split(',')
+                         if address.strip()]
+        token = token if token is not None else os.getenv("RUNNER_TOKEN", "")
+        self.runners = [RemoteRunner(address.strip(), token) for address in addresses]
+        self.placement: dict[str, RemoteRunner] = {}
+        self.connecting = None
+        self.maintain_tasks = []
+
+        # Statistics
+        self.placements = 0
+        self.placement_failures = 0
+
+    async def ensure_connected(self):
+        """Connect to the runners on first use and keep reconnecting lost ones in the background."""
+        if self.connecting is None:
+            self.connecting = asyncio.create_task(self.connect_all())
+        await asyncio.shield(self.connecting)
+
+    async def connect_all(self):
+        await asyncio.gather(*(runner.connect() for runner in self.runners))
+        self.maintain_tasks = [asyncio.create_task(self.maintain(runner)) for runner in self.runners]
+
+    async def maintain(self, runner: RemoteRunner):
+        while True:
+            await asyncio.sleep(RECONNECT_INTERVAL)
+            if not runner.connected:
+                # Sandboxes of the old connection were killed by the runner
+                for name in [name for name, placed in self.placement.items() if placed is runner]:
+                    del self.placement[name]
+                await runner.connect()
+
+    def connected_runners(self) -> list:
+        return [runner for runner in self.runners if runner.connected]
+
+    def runner_of(self, name: str) -> RemoteRunner:
+        runner = self.placement.get(name)
+        if runner is None or not runner.connected:
+            raise ProcessLookupError(f"No running sandbox {name}")
+        return runner
+
+    async def start_sandbox(self, name: str, image: str, limits: dict, command: list, labels: dict = None,
+                            mounts: dict = None) -> bool:
+        """
+        Start a sandbox on the least-loaded runner accepting it, with the
+        runner's image, limits and mounts (see Ownership).
+
+        Returns:
+            bool: Whether the sandbox was started
+        """
+        await self.ensure_connected()
+        request = {"op": "start", "name": name, "command": command, "labels": labels or {}}
+
+        for runner in sorted(self.connected_runners(), key=RemoteRunner.load):
+            # Count it right away, so concurrent starts spread over the runners
+            runner.sandboxes += 1
+            try:
+                await runner.request(request)
+            except (ConnectionError, asyncio.TimeoutError):
+                runner.sandboxes -= 1
+                continue
+            self.placement[name] = runner
+            self.placements += 1
+            return True
+
+        self.placement_failures += 1
+        return False
+
+    async def kill_sandbox(self, name: str):
+        runner = self.placement.pop(name, None)
+        # Sandboxes not placed by this server (see list_sandboxes) are killed on every runner
+        runners = [runner] if runner is not None else self.connected_runners()
+        for runner in runners:
+            try:
+                await runner.request({"op": "kill", "name": name})
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+
+    async def list_sandboxes(self, label: str) -> dict | None:
+        await self.ensure_connected()
+        sandboxes = {}
+        for runner in self.connected_runners():
+            try:
+                header, _ = await runner.request({"op": "list", "label": label})
+            except (ConnectionError, asyncio.TimeoutError):
+                return None
+            sandboxes.update(header["sandboxes"])
+        return sandboxes
+
+    async def exec(self, name: str, command: list, env: dict = None) -> RemoteProcess:
+        """
+        Start a command inside a sandbox, with its I/O streamed over the runner connection.
+
+        Returns:
+            RemoteProcess: Process-like handle of the command
+        """
+        runner = self.runner_of(name)
+        try:
+            return await runner.exec(name, command, env)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"Runner {runner.address} did not respond")
+
+    async def copy_into(self, name: str, dest: str, archive: bytes):
+        await self.runner_of(name).request({"op": "copy_into", "name": name, "dest": dest}, archive)
+
+    async def copy_from(self, name: str, path: str) -> bytes | None:
+        try:
+            header, archive = await self.runner_of(name).request({"op": "copy_from", "name": name, "path": path})
+        except (ConnectionError, asyncio.TimeoutError):
+            return None
+        return archive if header.get("found") else None
+
+    async def image_id(self, image: str) -> str | None:
+        """
+        Returns:
+            str | None: Image ID reported by the first connected runner (runners are
+                        expected to run the same image), None if none is connected
+        """
+        await self.ensure_connected()
+        for runner in self.connected_runners():
+            try:
+                header, _ = await runner.request({"op": "image_id"})
+            except (ConnectionError, asyncio.TimeoutError):
+                continue
+            return header.get("image_id")
+        return None
+
+    async def close(self):
+        for task in self.maintain_tasks:
+            task.cancel()
+        await asyncio.gather(*(runner.close() for runner in self.runners))
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "placements": self.placements,
+            "placement_failures": self.placement_failures,
+            "runners": [runner.stats() for runner in self.runners],
+        }
@@ -0,0 +1,153 @@
+"""
+Content-addressed cache of execution results.
+
+Many executions are byte-identical re-runs of the same code (e.g. students
+re-running an example) that never read stdin. For such runs the output is
+fully determined by the code, the project files, the sandbox image and the
+resource limits, so the recorded output can be replayed without starting a
+container.
+
+The cache is opt-in, since it assumes executed programs are deterministic.
+
+Key:
+    SHA-256 over the executed command, the digests of the files copied into
+    the sandbox (EXEC code or the RUNF project), the sandbox image ID, the
+    resource limits and the execution timeout
+
+Validity:
+    Only runs that finished normally and consumed no input are stored
+
+Eviction:
+    Least recently used entries are evicted once the total size of the stored
+    output exceeds the configured bound
+
+Environment Variables:
+    RESULT_CACHE_ENABLED: "true"/"false" - Enable the result cache (default: false)
+    RESULT_CACHE_MAX_BYTES: Total size of stored output (default: 64 MiB)
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def result_key(**parts) -> str:
+    """
+    Compute the cache key of an execution.
+
+    Args:
+        **parts: JSON serializable values identifying the execution
+
+    Returns:
+        str: Hex digest of the canonical JSON encoding of the parts
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class CachedResult:
+    """
+    Recorded result of an execution.
+
+    Attributes:
+        frames (list): Output frames in the order they were sent
+        returncode (int): Process return code
+        size (int): Total size of the output frames
+    """
+
+    def __init__(self, frames: list, returncode: int):
+        self.frames = frames
+        self.returncode = returncode
+        self.size = sum(len(frame) for frame in frames)
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of execution results.
+
+    Attributes:
+        enabled (bool): Whether results are stored and replayed
+        max_bytes (int): Bound on the total size of stored output
+        entries (OrderedDict): Maps key -> CachedResult, least recently used first
+    """
+
+    def __init__(self, enabled: bool = None, max_bytes: int = None):
+        load_dotenv()
+        self.enabled = enabled if enabled is not None else os.getenv("RESULT_CACHE_ENABLED", "false").lower() == "true"
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("RESULT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+        self.entries: OrderedDict[str, CachedResult] = OrderedDict()
+        self.size = 0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> CachedResult | None:
+        """
+        Look up the result of an execution.
+
+        Args:
+            key (str): Execution key (see result_key)
+
+        Returns:
+            CachedResult | None: The stored result, None on a miss
+        """
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, frames: list, returncode: int):
+        """
+        Store the result of an execution, evicting least recently used entries.
+
+        Args:
+            key (str): Execution key (see result_key)
+            frames (list): Output frames in the order they were sent
+            returncode (int): Process return code
+        """
+        result = CachedResult(list(frames), returncode)
+        if result.size > self.max_bytes:
+            return  # Would evict everything else
+
+        if key in self.entries:
+            self.size -= self.entries.pop(key).size
+
+        self.entries[key] = result
+        self.size += result.size
+        self.stores += 1
+
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Cache size and hit-rate counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
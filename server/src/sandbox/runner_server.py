@@ -0,0 +1,336 @@
+"""
+Runner agent: serves the sandboxes of one host to remote servers.
+
+Wraps the local sandbox backend (SANDBOX_BACKEND, Docker or namespaces) and
+exposes its sandbox lifecycle over TCP, speaking the protocol described in
+remote_backend.py. Servers connect with RemoteBackend, one connection each;
+sandboxes and processes of a connection are killed when it is lost.
+
+Authentication is a shared token only and traffic is not encrypted, so
+runners belong on a private network. A runner listening on anything but the
+loopback interface refuses to start without a token. All runners of a
+deployment should run the same sandbox image (it is part of the result cache
+keys).
+
+Sandboxes are started with the runner's own image, limits (SANDBOX_IMAGE,
+SANDBOX_LIMITS) and mounts (its ENVIRONMENTS_DIR if it exists, see
+environments.py), servers only choose their name, main command and labels. A
+connection may only use the sandboxes it started, and kill those and the ones
+no connection owns (left behind by an earlier runner process).
+
+Usage:
+    python3 runner_server.py [--port N]
+
+Environment Variables:
+    RUNNER_HOST: Interface to listen on (default: 127.0.0.1)
+    RUNNER_PORT: Port to listen on (default: 7070)
+    RUNNER_CAPACITY: Sandboxes this runner accepts (default: 8)
+    RUNNER_NAME: Name reported to servers (default: the host name)
+    RUNNER_TOKEN: Shared secret servers must present (default: none, only allowed on the loopback interface)
+    ENVIRONMENTS_DIR: Project environments mounted into the sandboxes (default: ../environments)
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import socket
+import sys
+from pathlib import Path
+
+# Add the src directory to sys.path to allow access packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dotenv import load_dotenv  # noqa: E402
+
+from sandbox.backend import SandboxBackend, create_backend  # noqa: E402
+from sandbox.environments import ENVIRONMENTS_BASE_DIR, SANDBOX_ENVIRONMENTS_DIR  # noqa: E402
+from sandbox.pool import SANDBOX_IMAGE, SANDBOX_LIMITS  # noqa: E402
+from sandbox.remote_backend import (  # noqa: E402
+    DEFAULT_RUNNER_PORT,
+    STREAM_STDERR,
+    STREAM_STDOUT,
+    STREAM_WINDOW,
+    decode_frame,
+    encode_frame,
+)
+from utils.async_tcp_by_size import send_one_message, recv_one_message  # noqa: E402
+
+DEFAULT_HOST = '127.0.0.1'
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+DEFAULT_CAPACITY = 8
+READ_SIZE = 65536
+MAX_HELLO_SIZE = 4096  # Frames are only read up to this size before authentication
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - Runner: %(message)s')
+
+
+class RunnerProcess:
+    """A command started by a server, with the output window of each stream."""
+
+    def __init__(self, process):
+        self.process = process
+        self.window = {STREAM_STDOUT: STREAM_WINDOW, STREAM_STDERR: STREAM_WINDOW}
+        self.credit = {STREAM_STDOUT: asyncio.Event(), STREAM_STDERR: asyncio.Event()}
+
+    def acknowledge(self, stream: int, size: int):
+        if stream in self.window:
+            self.window[stream] += size
+            self.credit[stream].set()
+
+    async def room(self, stream: int) -> int:
+        """Wait until the server has room for more output of a stream."""
+        while self.window[stream] <= 0:
+            self.credit[stream].clear()
+            await self.credit[stream].wait()
+        return self.window[stream]
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class RunnerConnection:
+    """
+    A connected server.
+
+    Attributes:
+        runner (Runner): The runner
+        sandboxes (set): Names of the sandboxes started by this connection
+        processes (dict): Maps process ID (chosen by the server) -> RunnerProcess
+    """
+
+    def __init__(self, runner, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.runner = runner
+        self.reader = reader
+        self.writer = writer
+        self.sandboxes = set()
+        self.processes: dict[int, RunnerProcess] = {}
+        self.tasks = set()
+
+    async def send(self, header: dict, payload: bytes = b''):
+        await send_one_message(self.writer, encode_frame(header, payload))
+
+    async def respond(self, request: dict, payload: bytes = b'', **fields):
+        await self.send({"id": request.get("id"), "ok": True, **fields}, payload)
+
+    async def fail(self, request: dict, error: str):
+        await self.send({"id": request.get("id"), "ok": False, "error": error})
+
+    def owned_elsewhere(self, name: str) -> bool:
+        """Whether a sandbox was started by another connection."""
+        return any(name in connection.sandboxes for connection in self.runner.connections if connection is not self)
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def authenticate(self) -> bool:
+        message = await recv_one_message(self.reader, return_type="bytes", max_size=MAX_HELLO_SIZE)
+        if not message:
+            return False
+        request, _ = decode_frame(message)
+        if request.get("op") != "hello" or not hmac.compare_digest(str(request.get("token", "")), self.runner.token):
+            await self.fail(request, "authentication failed")
+            return False
+        await self.respond(request, runner=self.runner.name, capacity=self.runner.capacity,
+                           sandboxes=self.runner.sandbox_count())
+        return True
+
+    async def serve(self):
+        try:
+            if not await self.authenticate():
+                return
+            while message := await recv_one_message(self.reader, return_type="bytes"):
+                request, payload = decode_frame(message)
+                self.dispatch(request, payload)
+        except (ValueError, KeyError) as e:
+            logging.error(f"Malformed message: {e}")
+        finally:
+            self.writer.close()
+            await self.cleanup()
+
+    def dispatch(self, request: dict, payload: bytes):
+        """
+        Handle a message. Process I/O is handled inline to keep its order,
+        everything else in a task of its own.
+        """
+        op = request["op"]
+        process = self.processes.get(request.get("proc"))
+
+        if op == "ack":
+            if process is not None:
+                process.acknowledge(request["stream"], request["size"])
+        elif op == "stdin":
+            if process is not None and process.process.stdin is not None:
+                try:
+                    process.process.stdin.write(payload)
+                except (ConnectionError, RuntimeError):
+                    pass  # The process stopped reading
+        elif op == "stdin_close":
+            if process is not None and process.process.stdin is not None:
+                process.process.stdin.close()
+        elif op == "kill_proc":
+            if process is not None:
+                process.kill()
+        else:
+            self.spawn(self.handle(op, request, payload))
+
+    async def handle(self, op: str, request: dict, payload: bytes):
+        backend = self.runner.backend
+        try:
+            if op == "start":
+                await self.start(request)
+            elif op == "kill":
+                if request["name"] not in self.sandboxes and self.owned_elsewhere(request["name"]):
+                    await self.fail(request, f"No running sandbox {request['name']}")
+                    return
+                await backend.kill_sandbox(request["name"])
+                self.sandboxes.discard(request["name"])
+                await self.respond(request, sandboxes=self.runner.sandbox_count())
+            elif op == "list":
+                sandboxes = await backend.list_sandboxes(request["label"])
+                if sandboxes is None:
+                    await self.fail(request, "listing sandboxes failed")
+                else:
+                    await self.respond(request, sandboxes=sandboxes)
+            elif op == "exec":
+                await self.exec(request)
+            elif op in ("copy_into", "copy_from") and request["name"] not in self.sandboxes:
+                await self.fail(request, f"No running sandbox {request['name']}")
+            elif op == "copy_into":
+                await backend.copy_into(request["name"], request["dest"], payload)
+                await self.respond(request)
+            elif op == "copy_from":
+                archive = await backend.copy_from(request["name"], request["path"])
+                await self.respond(request, archive or b'', found=archive is not None)
+            elif op == "image_id":
+                await self.respond(request, image_id=await backend.image_id(SANDBOX_IMAGE))
+            else:
+                await self.fail(request, f"unknown operation {op}")
+        except (OSError, ProcessLookupError, KeyError) as e:
+            await self.fail(request, f"{type(e).__name__}: {e}")
+
+    async def start(self, request: dict):
+        if self.runner.sandbox_count() >= self.runner.capacity:
+            await self.fail(request, "runner at capacity")
+            return
+
+        name = request["name"]
+        # Claimed before starting, so concurrent starts can't exceed the capacity
+        self.sandboxes.add(name)
+        started = await self.runner.backend.start_sandbox(
+            name, SANDBOX_IMAGE, SANDBOX_LIMITS, request["command"], request.get("labels"), self.runner.mounts
+        )
+        if not started:
+            self.sandboxes.discard(name)
+            await self.fail(request, "sandbox failed to start")
+            return
+        await self.respond(request, sandboxes=self.runner.sandbox_count())
+
+    async def exec(self, request: dict):
+        if request["name"] not in self.sandboxes:
+            await self.fail(request, f"No running sandbox {request['name']}")
+            return
+
+        process = RunnerProcess(await self.runner.backend.exec(request["name"], request["command"], request.get("env")))
+        proc = request["proc"]
+        self.processes[proc] = process
+        await self.respond(request)
+        self.spawn(self.forward(proc, process))
+
+    async def forward(self, proc: int, process: RunnerProcess):
+        """Stream a process's output to the server, then its exit code."""
+        await asyncio.gather(
+            self.pump(proc, process, STREAM_STDOUT, process.process.stdout),
+            self.pump(proc, process, STREAM_STDERR, process.process.stderr),
+        )
+        code = await process.process.wait()
+        self.processes.pop(proc, None)
+        await self.send({"event": "exit", "proc": proc, "code": code})
+
+    async def pump(self, proc: int, process: RunnerProcess, stream: int, reader):
+        # Never more than the window in flight, so the server never blocks on a full stream
+        while data := await reader.read(min(READ_SIZE, await process.room(stream))):
+            process.window[stream] -= len(data)
+            await self.send({"event": "out", "proc": proc, "stream": stream}, data)
+        await self.send({"event": "eof", "proc": proc, "stream": stream})
+
+    async def cleanup(self):
+        """Kill everything the lost server left behind."""
+        for process in self.processes.values():
+            process.kill()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*(self.runner.backend.kill_sandbox(name) for name in self.sandboxes))
+        self.sandboxes.clear()
+
+
+class Runner:
+    """
+    Serves the local sandbox backend to servers.
+
+    Attributes:
+        backend (SandboxBackend): Local backend running the sandboxes
+        capacity (int): Sandboxes accepted at once, over all connections
+        token (str): Shared secret servers must present
+        mounts (dict): Mounts of the sandboxes (host directory -> sandbox path)
+        connections (set): Connected servers
+    """
+
+    def __init__(self, backend: SandboxBackend = None, capacity: int = None, token: str = None, name: str = None):
+        load_dotenv()
+        self.backend = backend or create_backend()
+        if self.backend.name == 'remote':
+            raise ValueError("A runner needs a local sandbox backend (SANDBOX_BACKEND)")
+        self.capacity = capacity if capacity is not None else int(os.getenv("RUNNER_CAPACITY", DEFAULT_CAPACITY))
+        self.token = token if token is not None else os.getenv("RUNNER_TOKEN", "")
+        self.name = name or os.getenv("RUNNER_NAME", socket.gethostname())
+        environments = Path(os.getenv("ENVIRONMENTS_DIR", ENVIRONMENTS_BASE_DIR)).resolve()
+        self.mounts = {str(environments): SANDBOX_ENVIRONMENTS_DIR} if environments.is_dir() else {}
+        self.connections = set()
+
+    def sandbox_count(self) -> int:
+        return sum(len(connection.sandboxes) for connection in self.connections)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        address = writer.get_extra_info('peername')
+        logging.info(f"Server connected from {address}")
+        connection = RunnerConnection(self, reader, writer)
+        self.connections.add(connection)
+        try:
+            await connection.serve()
+        finally:
+            self.connections.discard(connection)
+            logging.info(f"Server {address} disconnected")
+
+    async def serve(self, host: str, port: int):
+        if not self.token and host not in LOOPBACK_HOSTS:
+            raise ValueError(f"A runner listening on {host} needs a token (RUNNER_TOKEN)")
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"Runner {self.name} ({self.backend.name}, capacity {self.capacity}) listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.backend.close()
+
+
+def main():
+    load_dotenv()
+    host = os.getenv("RUNNER_HOST", DEFAULT_HOST)
+    port = int(os.getenv("RUNNER_PORT", DEFAULT_RUNNER_PORT))
+    if "--port" in sys.argv:
+        port = int(sys.argv[sys.argv.index("--port") + 1])
+
+    try:
+        asyncio.run(Runner().serve(host, port))
+    except KeyboardInterrupt:
+        logging.info("Runner stopped")
+
+
+if __name__ == '__main__':
+    main()
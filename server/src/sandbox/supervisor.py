@@ -0,0 +1,151 @@
+"""
+Server side of the in-container supervisor.
+
+User scripts are started through the launcher baked into the python_runner
+image (server/docker/launcher.py). The launcher redirects the script's stderr
+into stdout and uses the container's stderr stream as a side channel carrying
+JSON event lines, e.g. when the script blocks waiting for input.
+
+In fork server mode (server/docker/forkserver.py) the sandbox's main process
+is a warm interpreter with commonly used modules imported, and runs are forked
+off it instead of starting `python3` (see run_command).
+
+In kernel mode (server/docker/kernel.py, see kernel.py) a long-lived
+interpreter runs code cells sent over its stdin, reporting on the same side
+channel.
+
+This module builds launcher commands and parses side channel lines.
+Event names must match the ones defined in the launcher and the kernel.
+
+Environment Variables:
+    SANDBOX_FORKSERVER: "true"/"false" - Run scripts through the fork server (default: false)
+    SANDBOX_PRELOAD_MODULES: Comma separated modules the fork server imports ahead of runs
+                             (default: PRELOAD_MODULES)
+"""
+
+import json
+import os
+
+from dotenv import load_dotenv
+
+LAUNCHER_PATH = '/opt/codebox/launcher.py'
+FORKSERVER_PATH = '/opt/codebox/forkserver.py'
+KERNEL_PATH = '/opt/codebox/kernel.py'
+FORKSERVER_RUN_DIR = '/tmp/codebox'
+PRELOAD_MODULES = [
+    'abc', 'bisect', 'collections', 'copy', 'dataclasses', 'datetime', 'decimal', 'enum',
+    'fractions', 'functools', 'heapq', 'itertools', 'json', 'math', 'operator', 'random',
+    're', 'statistics', 'string', 'time', 'typing',
+]
+
+# Fork server client, started with `docker exec`: waits for the server to be
+# ready, submits "<pid> <request>" and exits with the status of the run.
+# The run takes over fds 4-6, copies of the client's standard streams (the
+# shell itself redirects fds 0-2 while it runs printf / read). The exit FIFO
+# is opened before submitting, so a fast run can't miss it.
+FORKSERVER_CLIENT = f"""
+exec 4<&0 5>&1 6>&2
+f={FORKSERVER_RUN_DIR}/exit-$$; i=0
+while [ ! -p {FORKSERVER_RUN_DIR}/control ]; do
+    i=$((i + 1)); [ $i -gt 500 ] && exit 2; sleep 0.01
+done
+mkfifo "$f" && exec 3<>"$f" || exit 2
+printf '%s %s\n' "$$" "$1" > {FORKSERVER_RUN_DIR}/control
+read -r status <&3; rm -f "$f"; exit "${{status:-2}}"
+"""
+
+# Side channel events
+EVENT_INPUT = 'input'
+EVENT_DONE = 'done'  # Kernel cell finished
+
+
+def launcher_command(script_path: str) -> list:
+    """
+    Build the command running a script through the in-container launcher.
+
+    Args:
+        script_path: Path of the script inside the sandbox
+
+    Returns:
+        list: Command arguments
+    """
+    return ["python3", "-u", LAUNCHER_PATH, script_path]
+
+
+def kernel_command() -> list:
+    """
+    Returns:
+        list: Command starting a REPL kernel
+    """
+    return ["python3", "-u", KERNEL_PATH]
+
+
+def kernel_request(op: str, **fields) -> bytes:
+    """
+    Returns:
+        bytes: Request line for a kernel's stdin ("cell", "input" or "eof")
+    """
+    return (json.dumps({"op": op, **fields}) + '\n').encode()
+
+
+def forkserver_enabled() -> bool:
+    load_dotenv()
+    return os.getenv("SANDBOX_FORKSERVER", "false").lower() == "true"
+
+
+def sandbox_main_command(forkserver: bool) -> list:
+    """
+    Returns:
+        list: Main process of idle sandboxes, the fork server (after it
+              preloaded modules) or a plain `sleep`
+    """
+    if not forkserver:
+        return ["sleep", "infinity"]
+
+    load_dotenv()
+    modules = os.getenv("SANDBOX_PRELOAD_MODULES")
+    modules = [name.strip() for name in modules.split(',') if name.strip()] if modules is not None else PRELOAD_MODULES
+    return ["python3", "-u", FORKSERVER_PATH, *modules]
+
+
+def run_command(script_path: str, timeout: int, workdir: str, forkserver: bool, env: dict = None) -> list:
+    """
+    Build the command running a script through the launcher with a timeout.
+
+    Args:
+        script_path: Path of the script inside the sandbox
+        timeout: Seconds after which the script is killed (exit status 124)
+        workdir: Working directory of the script
+        forkserver: Whether the sandbox's main process is the fork server
+        env: Environment variables of the script (the fork server does not
+             see the exec's environment, so they travel in the request)
+
+    Returns:
+        list: Command arguments
+    """
+    if not forkserver:
+        return ["timeout", f"{timeout}s", *launcher_command(script_path)]
+
+    request = {"argv": [script_path], "cwd": workdir, "env": env or {}, "timeout": timeout}
+    return ["sh", "-c", FORKSERVER_CLIENT, "forkserver-client", json.dumps(request)]
+
+
+def parse_event(line: bytes) -> dict | None:
+    """
+    Parse a single side channel line.
+
+    Args:
+        line: Raw line read from the sandbox's stderr stream
+
+    Returns:
+        dict | None: The event, None if the line is not an event (e.g. an
+                     error printed by the launcher or the docker CLI)
+    """
+    try:
+        event = json.loads(line)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+    if not isinstance(event, dict) or 'event' not in event:
+        return None
+    return event
@@ -0,0 +1,270 @@
+"""
+Test suite mode: a project's pytest / unittest tests sharded across sandboxes
+(server side of server/docker/testrunner.py).
+
+A test suite run first discovers the project's tests in a pooled sandbox
+(pytest when it is importable there, e.g. from the project's requirements,
+unittest otherwise). The tests are then split into shards, each running in
+a sandbox of its own, and every test's result is streamed to the client as
+it finishes. The discovering sandbox runs the first shard, and its scheduler
+admission ends with that shard: the other shards are admitted on their own
+and a suite never waits for the scheduler while holding an admission (which
+could deadlock the scheduler once suites hold all its slots).
+
+Sharding:
+    The duration of every test is remembered per user. Tests are assigned
+    longest first to the shard with the least estimated time so far, so the
+    shards end at about the same time (tests without history count as the
+    average of those with history). Within a shard tests keep their
+    discovery order, so module and class fixtures are set up once per shard.
+    A suite is split into at most `max_sandboxes` shards, no more than the
+    user may run at once (every shard is admitted by the scheduler like any
+    execution, see EXEC_MAX_PER_USER and EXEC_MAX_CONCURRENT) and none estimated shorter than
+    MIN_SHARD_SECONDS, since each shard costs a sandbox and a project copy.
+
+Environment Variables:
+    TEST_SUITE_MAX_SANDBOXES: Max number of shards of a suite (default: 4)
+    TEST_SUITE_TIMEOUT: Seconds a shard may run (default: 300)
+    TEST_SUITE_MAX_TESTS: Max number of tests of a suite (default: 5000)
+"""
+
+import asyncio
+import heapq
+import math
+import os
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from sandbox import supervisor
+from sandbox.batch import read_capped
+
+TEST_RUNNER_PATH = '/opt/codebox/testrunner.py'
+DEFAULT_MAX_SANDBOXES = 4
+DEFAULT_TIMEOUT = 300  # seconds
+DEFAULT_MAX_TESTS = 5000
+DEFAULT_DURATION = 0.1  # seconds, estimate of tests when no test has history
+MIN_SHARD_SECONDS = 0.5
+MAX_LOG_BYTES = 16 * 1024  # Framework output kept per shard (shown when tests didn't report)
+MAX_HISTORY_USERS = 1024
+MAX_HISTORY_TESTS = 20000  # Test durations remembered per user
+OUTCOMES = ('passed', 'failed', 'error', 'skipped')
+
+
+class TestSuiteConfig:
+    """
+    Limits of test suite runs.
+
+    Attributes:
+        max_sandboxes (int): Max number of shards of a suite
+        timeout (float): Seconds a shard may run
+        max_tests (int): Max number of tests of a suite
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self.max_sandboxes = int(os.getenv("TEST_SUITE_MAX_SANDBOXES", DEFAULT_MAX_SANDBOXES))
+        self.timeout = float(os.getenv("TEST_SUITE_TIMEOUT", DEFAULT_TIMEOUT))
+        self.max_tests = int(os.getenv("TEST_SUITE_MAX_TESTS", DEFAULT_MAX_TESTS))
+
+
+class TestDurations:
+    """
+    Durations of the users' tests in their last runs, least recently used
+    users and tests forgotten first.
+
+    Attributes:
+        users (OrderedDict): Maps user ID -> OrderedDict of test ID -> seconds
+    """
+
+    def __init__(self):
+        self.users: OrderedDict[int, OrderedDict] = OrderedDict()
+
+    def estimate(self, uid: int, test_ids: list) -> list:
+        """
+        Returns:
+            list: Estimated seconds of every test
+        """
+        history = self.users.get(uid, {})
+        known = [history[test_id] for test_id in test_ids if test_id in history]
+        default = sum(known) / len(known) if known else DEFAULT_DURATION
+        return [history.get(test_id, default) for test_id in test_ids]
+
+    def record(self, uid: int, test_id: str, seconds: float):
+        history = self.users.setdefault(uid, OrderedDict())
+        self.users.move_to_end(uid)
+        history[test_id] = seconds
+        history.move_to_end(test_id)
+        while len(history) > MAX_HISTORY_TESTS:
+            history.popitem(last=False)
+        while len(self.users) > MAX_HISTORY_USERS:
+            self.users.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "tests": sum(len(history) for history in self.users.values()),
+        }
+
+
+def shard_tests(test_ids: list, estimates: list, max_shards: int) -> list:
+    """
+    Split tests into shards of about equal estimated time (see module docstring).
+
+    Args:
+        test_ids (list): Tests in discovery order
+        estimates (list): Estimated seconds of every test
+        max_shards (int): Max number of shards
+
+    Returns:
+        list: Lists of test IDs (in discovery order), without empty shards
+    """
+    count = max(1, min(max_shards, len(test_ids), math.ceil(sum(estimates) / MIN_SHARD_SECONDS)))
+    loads = [(0.0, shard) for shard in range(count)]
+    assigned = [[] for _ in range(count)]
+    for index in sorted(range(len(test_ids)), key=lambda i: -estimates[i]):
+        load, shard = heapq.heappop(loads)
+        assigned[shard].append(index)
+        heapq.heappush(loads, (load + estimates[index], shard))
+    return [[test_ids[index] for index in sorted(indices)] for indices in assigned if indices]
+
+
+async def run_runner(backend, name: str, args: list, stdin_data: bytes, env: dict, timeout: float, on_event) -> bytes:
+    """
+    Run the test runner in a sandbox, passing its events on as they arrive.
+
+    Args:
+        backend (SandboxBackend): Backend of the sandbox
+        name (str): Name of the sandbox
+        args (list): Arguments of the runner (see testrunner.py)
+        stdin_data (bytes): Input of the runner
+        env (dict): Environment variables of the runner
+        timeout (float): Seconds after which the runner is killed
+        on_event (coroutine function): Called with every event
+
+    Returns:
+        bytes: Start of the runner's other output (framework output, errors)
+    """
+    command = ["timeout", "-k", "1s", f"{timeout}s", "python3", "-u", TEST_RUNNER_PATH, *args]
+    process = await backend.exec(name, command, env=env)
+
+    async def feed():
+        try:
+            process.stdin.write(stdin_data)
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def read_events():
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                continue  # Longer than a stream's line limit, dropped
+            if not line:
+                break
+            event = supervisor.parse_event(line)
+            if event is not None:
+                await on_event(event)
+
+    async def collect():
+        _, _, (log, _) = await asyncio.gather(feed(), read_events(), read_capped(process.stderr, MAX_LOG_BYTES))
+        await process.wait()
+        return log
+
+    try:
+        # `timeout` ends the runner itself, this only guards against a stuck exec
+        return await asyncio.wait_for(collect(), timeout=timeout + 2)
+    except asyncio.TimeoutError:
+        return b''
+    finally:
+        if process.returncode is None:
+            process.kill()
+
+
+def parse_duration(value) -> float:
+    """
+    Returns:
+        float: A reported test duration in milliseconds, 0 if it isn't a finite non-negative number
+    """
+    try:
+        duration = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return duration if math.isfinite(duration) and duration > 0 else 0.0
+
+
+class SuiteResults:
+    """
+    Results of a test suite run, merged from its shards.
+
+    Attributes:
+        framework (str): Framework that discovered the tests
+        tests (dict): Maps test ID -> result, in the order they finished
+        collection_errors (list): Modules that failed to import ({"id", "message"})
+        shards (int): Number of shards the tests ran in
+        limits (list): Resource limits of the shards' sandboxes (see limits.py)
+    """
+
+    def __init__(self, framework: str, collection_errors: list):
+        self.framework = framework
+        self.tests: dict[str, dict] = {}
+        self.collection_errors = collection_errors
+        self.shards = 0
+        self.limits = []
+
+    def add(self, event: dict, test_ids) -> dict | None:
+        """
+        Record a test's result event.
+
+        Args:
+            event (dict): Event reported by the test runner (user code runs in its process)
+            test_ids (set | list): IDs of the tests of the shard that reported it
+
+        Returns:
+            dict | None: The result to send to the client, None if the event is invalid
+        """
+        if not isinstance(event.get('id'), str) or event['id'] not in test_ids or event.get('outcome') not in OUTCOMES:
+            return None
+        result = {
+            "id": event['id'],
+            "outcome": event['outcome'],
+            "duration_ms": parse_duration(event.get('duration_ms', 0)),
+            "message": str(event.get('message', '')),
+        }
+        self.tests[result['id']] = result
+        return result
+
+    def missing(self, test_ids: list, log: bytes) -> list:
+        """
+        Record the tests of a shard that never reported (the shard timed out or crashed).
+
+        Returns:
+            list: Their results
+        """
+        message = "The test didn't finish (the test run timed out or crashed)"
+        if log:
+            message += "\n" + log.decode('utf-8', errors='replace')
+        shard = set(test_ids)
+        return [self.add({"id": test_id, "outcome": 'error', "message": message}, shard)
+                for test_id in test_ids if test_id not in self.tests]
+
+    def summary(self, time_ms: int) -> dict:
+        """
+        Returns:
+            dict: Counts per outcome, wall time and the summed time of the tests
+        """
+        counts = {outcome: 0 for outcome in OUTCOMES}
+        for result in self.tests.values():
+            counts[result['outcome']] += 1
+        return {
+            "framework": self.framework,
+            "total": len(self.tests),
+            **counts,
+            "collection_errors": self.collection_errors,
+            "shards": self.shards,
+            "limits": self.limits,
+            "time_ms": time_ms,
+            "tests_time_ms": round(sum(result['duration_ms'] for result in self.tests.values())),
+        }
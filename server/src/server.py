@@ -36,10 +36,12 @@ async def main(db_server_ip: str):
     """
     print("Starting Server... (press 'ctrl + shift + q' to stop)\n")
 
-    await http_server.start_http_server(HOST, HTTP_PORT, ssl_context)
-
     server = websocket_controller.Server(db_server_ip)
+
+    await http_server.start_http_server(HOST, HTTP_PORT, ssl_context, stats_provider=server.stats)
+
     await server.initialize_db_connections()
+    await server.initialize_sandbox_pool()
     
     async with websockets.serve(server.handle_client, HOST, PORT, ssl=ssl_context):
         await shutdown_signal()
@@ -81,7 +81,7 @@ async def send_one_message(writer: asyncio.StreamWriter, data):
     except Exception as e:
         logging.error(f"Error in send_one_message: {e}")
 
-async def recv_one_message(reader: asyncio.StreamReader, return_type="string"):
+async def recv_one_message(reader: asyncio.StreamReader, return_type="string", max_size: int = None):
     """
     Receive a message using binary size-prefixed protocol (4-byte header).
     
@@ -90,6 +90,7 @@ async def recv_one_message(reader: asyncio.StreamReader, return_type="string"):
     Args:
         reader: StreamReader to receive from
         return_type: Type of returned data ("string" or "bytes")
+        max_size: Largest accepted message size, larger messages are not read (default: no limit)
 
     Returns:
         str or bytes: Received message in specified format, None if connection closed
@@ -103,6 +104,9 @@ async def recv_one_message(reader: asyncio.StreamReader, return_type="string"):
         # Unpack the length (network byte order)
         len_int, = struct.unpack('I', len_section)
         len_int = socket.ntohl(len_int)
+        if max_size is not None and len_int > max_size:
+            logging.error(f"Message of {len_int} bytes exceeds {max_size} bytes")
+            return None if return_type == "string" else b''
 
         # Read the actual data
         data = await __recv_amount(reader, len_int)
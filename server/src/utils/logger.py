@@ -56,6 +56,12 @@ class Event:
         DB_QUERY/RESPONSE - Database operations
         DB_QUERY_F - Failed database operations
         
+    Sandbox Events:
+        SANDBOX_POOL - Sandbox pool container management
+        SANDBOX_REAPER - Leaked sandboxes found and killed
+        RUN_OUTPUT - Output statistics of a finished run
+        RUN_USAGE - Resource usage of a finished run
+
     Error Events:
         SERVER_ERROR - General server issues
     """
@@ -74,6 +80,10 @@ class Event:
     DB_QUERY_FAILED = 'DB_QUERY_F'
     GENERAL_SERVER_ERROR = 'SERVER_ERROR'
     USER_LOGOUT = 'LOGOUT'
+    SANDBOX_POOL = 'SANDBOX_POOL'
+    SANDBOX_REAPER = 'REAPER'
+    RUN_OUTPUT = 'RUN_OUTPUT'
+    RUN_USAGE = 'RUN_USAGE'
 
 class Logger:
     """
@@ -1,5 +1,6 @@
 from pathlib import Path
 from enum import Enum
+import hashlib
 import json
 from protocol import JsonEntries
 import errors
@@ -67,6 +68,31 @@ def update_file_content(uid: int, path: str, new_content: str):
     file_path.write_text(new_content, encoding="utf-8")
 
 
+def project_snapshot(uid: int) -> dict:
+    """
+    Computes a content snapshot of a user's storage directory.
+    
+    Maps every file's relative path (using '/' separators) to the SHA-256
+    digest of its content, so two snapshots are equal exactly when the
+    project's files are byte-identical.
+    
+    Args:
+        uid: User ID to locate the storage directory
+        
+    Returns:
+        Dictionary of relative file path -> hex digest
+    """
+    folder = Path(user_folder_name(uid))
+    snapshot = {}
+
+    for file_path in sorted(folder.rglob('*')):
+        if file_path.is_file():
+            relative_path = file_path.relative_to(folder).as_posix()
+            snapshot[relative_path] = hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+    return snapshot
+
+
 class UserStorage():
     """
     Manages file storage operations for a specific user.